@@ -0,0 +1,143 @@
+import codecs
+import json
+from typing import Any, AsyncIterator, List, Optional, Tuple
+
+import orjson
+
+class BodyError(ValueError):
+    pass
+
+_decoder = json.JSONDecoder()
+_WS = " \t\r\n"
+_ITEM_END = _WS + ",]"
+_NUMBER_CHARS = "0123456789.eE+-"
+
+Item = Tuple[int, Any]  # (index, value or BodyError)
+
+class _NDJSONParser:
+    """One JSON value per line; an invalid line becomes an error item and parsing continues."""
+    def __init__(self, max_item_bytes: int):
+        self.max_item_bytes = max_item_bytes
+        self._buf = b""
+        self._idx = 0
+
+    def feed(self, chunk: bytes) -> List[Item]:
+        lines = (self._buf + chunk).split(b"\n")
+        self._buf = lines.pop()
+        if len(self._buf) > self.max_item_bytes:
+            raise BodyError(f"item {self._idx} exceeds {self.max_item_bytes} bytes")
+        return self._parse(lines)
+
+    def close(self) -> List[Item]:
+        lines, self._buf = [self._buf], b""
+        return self._parse(lines)
+
+    def _parse(self, lines: List[bytes]) -> List[Item]:
+        out = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                out.append((self._idx, orjson.loads(line)))
+            except orjson.JSONDecodeError as e:
+                out.append((self._idx, BodyError(f"invalid JSON: {e}")))
+            self._idx += 1
+        return out
+
+class _ArrayParser:
+    """
+    Top-level JSON array, decoded one element at a time with raw_decode.
+    A malformed array cannot be resynchronized: it ends with a single error item.
+    """
+    def __init__(self, max_item_bytes: int):
+        self.max_item_bytes = max_item_bytes
+        self._dec = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._idx = 0
+        self._state = "open"  # open -> first -> (sep -> item)* -> done
+
+    def feed(self, chunk: bytes) -> List[Item]:
+        return self._parse(self._dec.decode(chunk), final=False)
+
+    def close(self) -> List[Item]:
+        out = self._parse(self._dec.decode(b"", final=True), final=True)
+        if self._state != "done":
+            out.append((self._idx, BodyError("unexpected end of body")))
+            self._state = "done"
+        return out
+
+    def _fail(self, out: List[Item], msg: str) -> List[Item]:
+        out.append((self._idx, BodyError(msg)))
+        self._state, self._buf = "done", ""
+        return out
+
+    def _parse(self, text: str, final: bool) -> List[Item]:
+        out: List[Item] = []
+        if self._state == "done":
+            return out  # ignore anything after the closing bracket or an error
+        buf = self._buf + text
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in _WS:
+                pos += 1
+            if pos >= len(buf):
+                break
+            c = buf[pos]
+            if self._state == "open":
+                if c != "[":
+                    return self._fail(out, "expected a JSON array")
+                pos += 1
+                self._state = "first"
+            elif self._state == "sep":
+                if c == "]":
+                    self._state, buf, pos = "done", "", 0
+                    break
+                if c != ",":
+                    return self._fail(out, f"expected ',' or ']' after item {self._idx - 1}")
+                pos += 1
+                self._state = "item"
+            else:
+                if c == "]" and self._state == "first":
+                    self._state, buf, pos = "done", "", 0
+                    break
+                try:
+                    value, end = _decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError as e:
+                    if final or len(buf) - pos > self.max_item_bytes:
+                        return self._fail(out, f"invalid JSON at item {self._idx}: {e.msg}")
+                    break  # most likely cut off mid-item; wait for more data
+                if end == len(buf) and not final:
+                    break  # a number or literal may continue in the next chunk
+                if end < len(buf) and buf[end] not in _ITEM_END:
+                    # raw_decode stops at the longest valid prefix: "1." of a number cut after the
+                    # dot decodes as 1; wait for the rest unless the body ended
+                    if final or not isinstance(value, (int, float)) or buf[end] not in _NUMBER_CHARS:
+                        return self._fail(out, f"invalid JSON at item {self._idx}")
+                    break
+                out.append((self._idx, value))
+                self._idx += 1
+                pos = end
+                self._state = "sep"
+        self._buf = buf[pos:]
+        return out
+
+async def iter_json_items(chunks: AsyncIterator[bytes], max_item_bytes: int) -> AsyncIterator[Item]:
+    """
+    Parse a streamed request body holding either a JSON array or NDJSON (one value per line)
+    and yield (index, value) per item, holding about one item in memory at a time.
+    Values that cannot be parsed are yielded as (index, BodyError).
+    """
+    parser: Optional[Any] = None
+    head = b""
+    async for chunk in chunks:
+        if parser is None:
+            head += chunk
+            if not head.strip():
+                continue
+            parser = (_ArrayParser if head.lstrip()[:1] == b"[" else _NDJSONParser)(max_item_bytes)
+            chunk, head = head, b""
+        for item in parser.feed(chunk):
+            yield item
+    if parser is not None:
+        for item in parser.close():
+            yield item
@@ -1,20 +1,33 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from contextlib import asynccontextmanager
+import asyncio
+import hashlib
 import structlog
-import uuid
+import shutil
+import tempfile
+import time
+from typing import Optional
+import orjson
 from fastapi import UploadFile, File
 from pathlib import Path
 
 from prometheus_fastapi_instrumentator import Instrumentator
 
 from src.utils.settings import settings
-from src.rag.qdrant_store import qdrant_store
-from src.rag.embedding import embed_texts
-from src.rag.bm25_store import bm25_store
-from src.rag.merged_retriever import search_merged
+from src.rag.store import vector_store
+from src.rag.embedding import embed_texts, aembed_texts, embedding_batcher
+from src.rag.bm25_sync import bm25_sync
+from src.rag.warmup import warmup
+from src.rag.merged_retriever import asearch_merged
 from src.api.schemas import TicketRequest, TicketResponse, IngestPathRequest, IngestItem, SearchQuery
-from src.core.orchestrator import resolve_ticket
+from src.core.orchestrator import aresolve_ticket, astream_resolve_ticket, resolve_tickets
+from src.utils.metrics import STREAM_TTFB, STREAM_TTFT
 from src.rag.file_ingest import ingest_file, ingest_folder
+from src.rag.batch_ingest import ingest_items, item_payload
+from src.rag.ingest_jobs import ingest_jobs, upload_source
+from src.api.body_stream import iter_json_items
+from src.utils.clients import aclose_clients
 
 logger = structlog.get_logger()
 
@@ -24,69 +37,118 @@ instrumentator.instrument(app).expose(app, endpoint="/metrics")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    qdrant_store.ensure_collection()
-    pairs = [(row["id"], row["text"]) for row in qdrant_store.scroll_all_texts()]
-    bm25_store.build(pairs)
-    logger.info("bm25_built", count=len(pairs))
-    logger.info("startup_done", qdrant_host=settings.qdrant_host, qdrant_port=settings.qdrant_port)
+    # serve at once; the vector store, BM25 and the chunk cache warm up in the background (see /ready)
+    warmup.start()
+    logger.info("startup_done", vector_backend=settings.vector_backend)
     yield
+    await warmup.stop()
+    # the snapshot + change log already hold every change; nothing to save
+    bm25_sync.stop()
+    ingest_jobs.close()
+    await embedding_batcher.close()
+    await vector_store.aclose()
+    await aclose_clients()
     logger.info("shutdown_done")
 
 app.router.lifespan_context = lifespan
 
 @app.get("/health")
 def health():
+    """Liveness: the process serves requests."""
     return {"status": "ok"}
 
+@app.get("/ready")
+def ready():
+    """
+    Readiness: 503 until the vector store is reachable. Once ready, "degraded" is true while
+    BM25 is still being built (merged search is vector-only meanwhile); the body has the
+    progress of each warmup step.
+    """
+    report = warmup.report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
 @app.get("/qdrant/health")
 def qdrant_health():
-    ok = qdrant_store.is_healthy()
+    ok = vector_store.is_healthy()
+    if settings.vector_backend == "embedded":
+        return {"connected": ok, "backend": "embedded", "path": settings.embedded_store_dir}
     return {"connected": ok, "host": settings.qdrant_host, "port": settings.qdrant_port, "collection": settings.qdrant_collection}
 
 @app.post("/ingest")
 def ingest(item: IngestItem):
     # Prepare payload
-    pid = item.id or str(uuid.uuid4())
-    payload = item.model_dump()
-    payload["id"] = pid # Ensure id is included in payload
+    payload = item_payload(item)
+    pid = payload["id"]
 
     # Generate embedding
     vec = embed_texts([item.text])
 
-    # Upsert to Qdrant and add to BM25 store
-    qdrant_store.upsert(ids=[pid], vectors=vec, payloads=[payload])
-    bm25_store.add(pid, item.text)
+    # Upsert to the vector store; this also appends to the shared BM25 change log
+    vector_store.upsert(ids=[pid], vectors=vec, payloads=[payload])
 
     return {"ok": True, "id": pid}
 
+@app.post("/ingest-batch")
+async def ingest_batch_api(request: Request):
+    """
+    Bulk ingest of pre-chunked items: the body is a JSON array or NDJSON of IngestItem,
+    read as a stream. Returns per-item status (by position in the body).
+    """
+    items = iter_json_items(request.stream(), settings.ingest_batch_max_item_bytes)
+    return await ingest_items(items)
+
 @app.post("/search")
-def search(q: SearchQuery):
-    vec = embed_texts([q.query])
+async def search(q: SearchQuery):
+    vec = await aembed_texts([q.query])
     filters = {}
     if q.product: filters["product"] = q.product
     if q.lang: filters["lang"] = q.lang
-    hits = qdrant_store.search(vec[0], top_k=q.top_k, filters=filters or None)
+    hits = await vector_store.asearch(vec[0], top_k=q.top_k, filters=filters or None)
     return {"query": q.query, "hits": hits}
 
 @app.post("/search_merged")
-def search_v2(q: SearchQuery):
+async def search_v2(q: SearchQuery):
     filters = {}
     if q.product: filters["product"] = q.product
     if q.lang: filters["lang"] = q.lang
-    hits = search_merged(q.query, top_k=q.top_k, filters=filters or None, alpha=0.7)
+    hits = await asearch_merged(q.query, top_k=q.top_k, filters=filters or None, alpha=q.alpha, fusion=q.fusion)
     return {"query": q.query, "hits": hits}
 
 @app.post("/ingest-file")
-async def ingest_file_api(file: UploadFile = File(...), product: str = "domains", lang: str = "en"):
-    tmp = Path("/tmp") / file.filename
-    content = await file.read()
-    tmp.write_bytes(content)
+async def ingest_file_api(file: UploadFile = File(...), product: str = "domains", lang: str = "en",
+                          background: Optional[bool] = None, source_id: Optional[str] = None):
+    """
+    The upload is streamed to a unique temp file and ingested in a worker pool.
+    Uploads of at least INGEST_UPLOAD_ASYNC_BYTES (or background=true) return 202 with a
+    job id; poll /ingest-jobs/{job_id} for the result.
+    source_id: stable identity of the document; a later upload with the same source_id replaces
+    it. Replacement needs a source_id: without one, uploads are told apart by product, lang, file
+    name and content, so a changed file uploaded again is added next to the old version.
+    """
+    path = ingest_jobs.new_upload_path(file.filename)
+    size, sha = 0, hashlib.sha256()
     try:
-        res = ingest_file(tmp, product=product, lang=lang)
-        return res
-    finally:
-        try: tmp.unlink()
-        except Exception: pass
+        with open(path, "wb") as out:
+            while chunk := await file.read(settings.ingest_upload_chunk_bytes):
+                out.write(chunk)
+                sha.update(chunk)
+                size += len(chunk)
+    except BaseException:
+        shutil.rmtree(path.parent, ignore_errors=True)
+        raise
+    source = upload_source(path.name, product, lang, sha.hexdigest(), source_id)
+
+    if background or (background is None and size >= settings.ingest_upload_async_bytes):
+        job = ingest_jobs.submit(path, product, lang, source)
+        return JSONResponse(dict(job, status_url=f"/ingest-jobs/{job['job_id']}"), status_code=202)
+    return await asyncio.wrap_future(ingest_jobs.run(path, product, lang, source))
+
+@app.get("/ingest-jobs/{job_id}")
+def ingest_job_status(job_id: str):
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return job
 
 @app.post("/ingest-path")
 def ingest_path_api(req: IngestPathRequest):
@@ -96,9 +158,74 @@ def ingest_path_api(req: IngestPathRequest):
     if p.is_file():
         return ingest_file(p, product=req.product or "domains", lang=req.lang or "en")
     else:
-        return {"ok": True, "results": ingest_folder(p, product=req.product or "domains", lang=req.lang or "en")}
+        stats = {}
+        results = ingest_folder(p, product=req.product or "domains", lang=req.lang or "en", stats=stats)
+        return {"ok": True, "results": results, "stats": stats}
 
 @app.post("/resolve-ticket", response_model=TicketResponse)
-def resolve_ticket_api(req: TicketRequest):
-    result = resolve_ticket(req.ticket_text, top_k=req.top_k)
+async def resolve_ticket_api(req: TicketRequest):
+    result = await aresolve_ticket(req.ticket_text, top_k=req.top_k)
     return result
+
+@app.post("/resolve-tickets")
+async def resolve_tickets_api(request: Request):
+    """
+    Bulk triage: the body is a JSON array or NDJSON of TicketRequest (or plain ticket strings),
+    read as a stream. The response is NDJSON with one line per ticket in completion order,
+    {"index", "ok": true, "result": TicketResponse} or {"index", "ok": false, "error"},
+    and a last {"summary": {...}} line with the throughput in tickets per minute.
+    """
+    # spool the body first: once the response streams, Starlette's disconnect listener
+    # consumes receive(), so the request body cannot be read any more. Past the spool limit the
+    # body is on disk, and it is written and read from a thread
+    limit, size = settings.resolve_batch_spool_bytes, 0
+    body = tempfile.SpooledTemporaryFile(max_size=limit)
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit:
+            await asyncio.to_thread(body.write, chunk)
+        else:
+            body.write(chunk)
+    body.seek(0)
+
+    async def chunks():
+        n = settings.ingest_upload_chunk_bytes
+        while chunk := (await asyncio.to_thread(body.read, n) if size > limit else body.read(n)):
+            yield chunk
+
+    async def lines():
+        try:
+            async for item in resolve_tickets(iter_json_items(chunks(), settings.resolve_batch_max_item_bytes)):
+                yield orjson.dumps(item) + b"\n"
+        finally:
+            body.close()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+def _sse(event: str, data) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+@app.post("/resolve-ticket/stream")
+async def resolve_ticket_stream_api(req: TicketRequest):
+    """
+    Server-Sent Events: `references` as soon as retrieval is done, `token` events with the
+    answer as it is generated, then `final` with the validated TicketResponse (or `error`).
+    """
+    t0 = time.perf_counter()
+
+    async def events():
+        first_token = True
+        try:
+            async for event, data in astream_resolve_ticket(req.ticket_text, top_k=req.top_k):
+                if event == "references":
+                    STREAM_TTFB.observe(time.perf_counter() - t0)
+                elif event == "token" and first_token:
+                    STREAM_TTFT.observe(time.perf_counter() - t0)
+                    first_token = False
+                yield _sse(event, data)
+        except Exception as e:
+            logger.exception("resolve_ticket_stream_failed")
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
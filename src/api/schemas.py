@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field, constr
+from pydantic import BaseModel, Field, ValidationError, constr
 from typing import List, Literal, Optional, Dict, Any
 
 class IngestItem(BaseModel):
@@ -15,6 +15,9 @@ class SearchQuery(BaseModel):
     top_k: int = 5
     product: Optional[str] = None
     lang: Optional[str] = None
+    # /search_merged only: semantic weight and score fusion strategy
+    alpha: float = Field(0.7, ge=0.0, le=1.0)
+    fusion: Literal["minmax", "rrf", "zscore"] = "minmax"
 
 class TicketRequest(BaseModel):
     ticket_text: constr(strip_whitespace=True, min_length=5)
@@ -34,4 +37,8 @@ class TicketResponse(BaseModel):
 class IngestPathRequest(BaseModel):
     path: str
     product: Optional[str] = "domains"
-    lang: Optional[str] = "en"
\ No newline at end of file
+    lang: Optional[str] = "en"
+
+def validation_msg(e: ValidationError) -> str:
+    """One-line summary of a ValidationError for per-item error results: "field: message; ..."."""
+    return "; ".join(f"{'.'.join(map(str, err['loc'])) or 'item'}: {err['msg']}" for err in e.errors())
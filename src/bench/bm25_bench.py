@@ -0,0 +1,72 @@
+"""
+Add/search latency benchmark for BM25Store.
+
+    python -m src.bench.bm25_bench --sizes 10000,100000,1000000
+"""
+import argparse
+import random
+import time
+from typing import List, Tuple
+
+import numpy as np
+
+from src.rag.bm25_store import BM25Store
+
+def synthetic_corpus(n: int, vocab: int = 50000, seed: int = 0) -> List[Tuple[str, str]]:
+    """Zipf-distributed vocabulary, 20-120 words per chunk."""
+    rng = np.random.default_rng(seed)
+    words = np.array([f"w{i}" for i in range(vocab)])
+    lens = rng.integers(20, 120, size=n)
+    ranks = rng.zipf(1.2, size=int(lens.sum())) % vocab
+    out, pos = [], 0
+    for i, ln in enumerate(lens):
+        out.append((f"chunk-{i}", " ".join(words[ranks[pos:pos + ln]])))
+        pos += ln
+    return out
+
+def _pct(samples: List[float], q: float) -> float:
+    return float(np.percentile(np.array(samples) * 1000, q))
+
+def run(size: int, n_adds: int = 1000, n_queries: int = 200, top_k: int = 32) -> dict:
+    items = synthetic_corpus(size + n_adds)
+    store = BM25Store()
+
+    t0 = time.perf_counter()
+    store.build(items[:size])
+    build_s = time.perf_counter() - t0
+
+    add_lat = []
+    for _id, text in items[size:]:
+        t = time.perf_counter()
+        store.add(_id, text)
+        add_lat.append(time.perf_counter() - t)
+
+    rng = random.Random(1)
+    search_lat = []
+    for _ in range(n_queries):
+        _, text = items[rng.randrange(len(items))]
+        words = text.split()
+        query = " ".join(rng.sample(words, k=min(6, len(words))))
+        t = time.perf_counter()
+        store.search(query, top_k=top_k)
+        search_lat.append(time.perf_counter() - t)
+
+    return {
+        "size": size,
+        "build_s": round(build_s, 3),
+        "add_p50_ms": round(_pct(add_lat, 50), 4),
+        "add_p99_ms": round(_pct(add_lat, 99), 4),
+        "search_p50_ms": round(_pct(search_lat, 50), 3),
+        "search_p99_ms": round(_pct(search_lat, 99), 3),
+    }
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="10000,100000,1000000")
+    ap.add_argument("--queries", type=int, default=200)
+    args = ap.parse_args()
+    for size in [int(s) for s in args.sizes.split(",")]:
+        print(run(size, n_queries=args.queries))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Load test of /resolve-ticket and /search_merged against local stubs of OpenAI and Qdrant.
+Compares a sync-handler app (threadpool-bound, the previous request path) with the async app.
+
+    python -m src.bench.load_test --requests 600 --concurrency 200 --latency-ms 200
+"""
+import argparse
+import asyncio
+import base64
+import json
+import time
+from typing import Callable, List
+
+import httpx
+import numpy as np
+from fastapi import FastAPI
+from openai import OpenAI, AsyncOpenAI
+
+from src.utils.clients import set_openai_clients
+from src.utils.settings import settings
+from src.api.schemas import SearchQuery, TicketRequest, TicketResponse
+from src.rag.bm25_store import bm25_store
+from src.rag.merged_retriever import search_merged
+from src.rag.store import vector_store
+from src.core import orchestrator
+
+_ANSWER = json.dumps({
+    "answer": "Update the WHOIS details and reply to the verification email.",
+    "references": [],
+    "action_required": "no_escalation_needed",
+})
+
+def _openai_response(request: httpx.Request) -> httpx.Response:
+    body = json.loads(request.content)
+    if request.url.path.endswith("/embeddings"):
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        data = [{"object": "embedding", "index": i,
+                 "embedding": base64.b64encode(np.random.default_rng(abs(hash(text)) % 2**32)
+                                               .random(settings.embedding_dim, dtype=np.float32).tobytes()).decode()}
+                for i, text in enumerate(inputs)]
+        return httpx.Response(200, json={"object": "list", "data": data, "model": body["model"],
+                                         "usage": {"prompt_tokens": 8, "total_tokens": 8}})
+    if body.get("stream"):
+        events = []
+        for i in range(0, len(_ANSWER), 8):
+            events.append({"id": "stub", "object": "chat.completion.chunk", "created": 0, "model": "stub",
+                           "choices": [{"index": 0, "delta": {"content": _ANSWER[i:i + 8]}, "finish_reason": None}]})
+        sse = "".join(f"data: {json.dumps(e)}\n\n" for e in events) + "data: [DONE]\n\n"
+        return httpx.Response(200, content=sse.encode(), headers={"content-type": "text/event-stream"})
+    return httpx.Response(200, json={
+        "id": "stub", "object": "chat.completion", "created": 0, "model": body["model"] or "stub",
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": _ANSWER}}],
+        "usage": {"prompt_tokens": 500, "completion_tokens": 60, "total_tokens": 560},
+    })
+
+class _Point:
+    def __init__(self, pid: str, score: float = 0.0, payload=None, vector=None):
+        self.id, self.score, self.payload, self.vector = pid, score, payload, vector
+
+class _StubQdrant:
+    """search/retrieve with a fixed latency; enough surface for QdrantStore."""
+    def __init__(self, ids: List[str], latency: float):
+        self.ids, self.latency = ids, latency
+
+    def _search(self, limit: int):
+        return [_Point(pid, 0.5, {"doc": "Stub", "section": "1", "text": "stub"}) for pid in self.ids[:limit]]
+
+    def _retrieve(self, ids: List[str]):
+        return [_Point(pid, vector=[0.01] * settings.embedding_dim) for pid in ids]
+
+    def search(self, collection_name, query_vector, limit, **kw):
+        time.sleep(self.latency)
+        return self._search(limit)
+
+    def retrieve(self, collection_name, ids, **kw):
+        time.sleep(self.latency)
+        return self._retrieve(ids)
+
+class _AsyncStubQdrant(_StubQdrant):
+    async def search(self, collection_name, query_vector, limit, **kw):
+        await asyncio.sleep(self.latency)
+        return self._search(limit)
+
+    async def retrieve(self, collection_name, ids, **kw):
+        await asyncio.sleep(self.latency)
+        return self._retrieve(ids)
+
+def install_stubs(latency: float, corpus: int = 2000):
+    def sync_handler(request):
+        time.sleep(latency)
+        return _openai_response(request)
+
+    async def async_handler(request):
+        await asyncio.sleep(latency)
+        return _openai_response(request)
+
+    sync_client = OpenAI(api_key="stub", http_client=httpx.Client(transport=httpx.MockTransport(sync_handler)))
+    async_client = AsyncOpenAI(api_key="stub", http_client=httpx.AsyncClient(transport=httpx.MockTransport(async_handler)))
+    set_openai_clients(sync_client, async_client)
+
+    ids = [f"00000000-0000-0000-0000-{i:012d}" for i in range(corpus)]
+    vector_store.client = _StubQdrant(ids, latency / 4)
+    vector_store.aclient = _AsyncStubQdrant(ids, latency / 4)
+    words = ["domain", "whois", "suspended", "transfer", "renewal", "dns", "billing", "verification"]
+    bm25_store.build([(pid, " ".join(words[j % len(words)] for j in range(i, i + 12))) for i, pid in enumerate(ids)])
+
+def sync_app() -> FastAPI:
+    """The request path before the async rewrite: sync handlers on Starlette's threadpool."""
+    app = FastAPI()
+
+    @app.post("/search_merged")
+    def search_v2(q: SearchQuery):
+        return {"query": q.query, "hits": search_merged(q.query, top_k=q.top_k)}
+
+    @app.post("/resolve-ticket", response_model=TicketResponse)
+    def resolve_ticket_api(req: TicketRequest):
+        return orchestrator.resolve_ticket(req.ticket_text, top_k=req.top_k)
+
+    return app
+
+async def drive(app: FastAPI, path: str, body: Callable[[int], dict], n: int, concurrency: int) -> dict:
+    sem = asyncio.Semaphore(concurrency)
+    lat: List[float] = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as c:
+        async def one(i: int):
+            async with sem:
+                t = time.perf_counter()
+                r = await c.post(path, json=body(i))
+                r.raise_for_status()
+                lat.append(time.perf_counter() - t)
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(n)))
+        wall = time.perf_counter() - t0
+    ms = np.array(lat) * 1000
+    return {"path": path, "p50_ms": round(float(np.percentile(ms, 50)), 1),
+            "p99_ms": round(float(np.percentile(ms, 99)), 1), "rps": round(n / wall, 1)}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=600)
+    ap.add_argument("--concurrency", type=int, default=200)
+    ap.add_argument("--latency-ms", type=float, default=200.0)
+    args = ap.parse_args()
+
+    install_stubs(args.latency_ms / 1000)
+    from src.api.main import app as async_app
+
+    cases = [
+        ("/search_merged", lambda i: {"query": f"suspended domain whois {i}", "top_k": 5}),
+        ("/resolve-ticket", lambda i: {"ticket_text": f"My domain was suspended, ticket {i}", "top_k": 8}),
+    ]
+    for name, app in [("sync", sync_app()), ("async", async_app)]:
+        for path, body in cases:
+            res = asyncio.run(drive(app, path, body, args.requests, args.concurrency))
+            print(json.dumps({"mode": name, **res}))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+Offline retrieval quality and latency benchmark; needs no OpenAI key or Qdrant server.
+
+Stand-ins:
+  * embeddings: a deterministic hash embedder (token + char-trigram feature hashing) served
+    through an OpenAI transport stub, so embed_texts / the cache / the batcher run unchanged;
+  * Qdrant: QdrantClient(":memory:") (with an async adapter over the same data), unless
+    VECTOR_BACKEND=embedded, which runs the embedded store in the bench's temp dir;
+  * corpus: synthetic markdown documents recombined from the sentences in data/.
+
+For each corpus size it ingests the corpus through ingest_folder, then measures recall@k, MRR
+and p50/p95/p99 latency of BM25Store.search, /search and /search_merged, and writes JSON.
+
+    python -m src.bench.retrieval_bench --sizes 100,500,2000 --out retrieval_bench.json
+    python -m src.bench.retrieval_bench --sizes 100 --baseline retrieval_bench.json   # exit 1 on regression
+"""
+import argparse
+import base64
+import hashlib
+import json
+import re
+import sys
+import tempfile
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+import httpx
+import numpy as np
+from openai import OpenAI, AsyncOpenAI
+from qdrant_client import QdrantClient
+
+from src.utils.clients import set_openai_clients
+from src.utils.settings import settings
+from src.rag.bm25_store import bm25_store, _tok
+from src.rag.file_ingest import _read_text_from_file, ingest_folder
+from src.rag.ingest_manifest import ingest_manifest
+from src.rag.store import vector_store
+from src.rag.embedded_store import EmbeddedStore
+
+DATA_DIR = Path(__file__).resolve().parents[2] / "data"
+
+# ---- deterministic embedder ----
+
+@lru_cache(maxsize=200_000)
+def _feature(feat: str) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha1(feat.encode("utf-8")).digest()[:8], "little")
+    return np.random.default_rng(seed).standard_normal(settings.embedding_dim).astype(np.float32)
+
+def fake_embed(text: str) -> np.ndarray:
+    """Sum of hashed token and char-trigram features; similar wording gives similar vectors."""
+    vec = np.zeros(settings.embedding_dim, dtype=np.float32)
+    for tok in _tok(text):
+        vec += _feature(tok)
+        padded = f"#{tok}#"
+        for i in range(len(padded) - 2):
+            vec += 0.3 * _feature(padded[i:i + 3])
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+def _embeddings_response(request: httpx.Request) -> httpx.Response:
+    body = json.loads(request.content)
+    inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+    data = [{"object": "embedding", "index": i, "embedding": base64.b64encode(fake_embed(t).tobytes()).decode()}
+            for i, t in enumerate(inputs)]
+    return httpx.Response(200, json={"object": "list", "data": data, "model": body["model"],
+                                     "usage": {"prompt_tokens": 0, "total_tokens": 0}})
+
+class _AsyncLocalQdrant:
+    """AsyncQdrantClient stand-in that shares the data of the sync in-memory client."""
+    def __init__(self, client: QdrantClient):
+        self._client = client
+
+    def __getattr__(self, name):
+        fn = getattr(self._client, name)
+
+        async def call(*args, **kwargs):
+            return fn(*args, **kwargs)
+        return call
+
+def install_standins(workdir: Path):
+    async def async_handler(request):
+        return _embeddings_response(request)
+
+    set_openai_clients(
+        OpenAI(api_key="bench", http_client=httpx.Client(transport=httpx.MockTransport(_embeddings_response))),
+        AsyncOpenAI(api_key="bench", http_client=httpx.AsyncClient(transport=httpx.MockTransport(async_handler))))
+    # the in-memory client is not thread-safe; upsert from one thread
+    settings.ingest_upsert_concurrency = 1
+    ingest_manifest.path = workdir / "manifest.json"
+    if isinstance(vector_store, EmbeddedStore):
+        vector_store.path = workdir / "vector_store"
+
+def reset_qdrant():
+    """Start from an empty vector store: a fresh in-memory Qdrant, or an emptied embedded store."""
+    if isinstance(vector_store, EmbeddedStore):
+        vector_store.drop()
+        vector_store.ensure_collection()
+        return
+    client = QdrantClient(":memory:")
+    vector_store.client = client
+    vector_store.aclient = _AsyncLocalQdrant(client)
+    vector_store.ensure_collection()
+
+# ---- synthetic corpus ----
+
+def _sample_sentences() -> List[str]:
+    out = []
+    for p in sorted(DATA_DIR.iterdir()):
+        try:
+            text = _read_text_from_file(p)
+        except ValueError:
+            continue
+        for line in text.splitlines():
+            line = re.sub(r"^[#\-\s*]+", "", line).replace("**", "").strip()
+            if len(line.split()) >= 5:
+                out.append(line)
+    return out
+
+def generate_corpus(folder: Path, n_docs: int, seed: int = 0):
+    """n_docs markdown files: sample sentences with a few words swapped for rare keywords."""
+    rng = np.random.default_rng(seed)
+    sentences = _sample_sentences()
+    vocab = [f"{a}{b}" for a in ("reg", "dns", "tld", "ssl", "acct", "zone", "lock", "ns")
+             for b in range(400)]
+    products = ["domains", "hosting", "email"]
+    folder.mkdir(parents=True, exist_ok=True)
+    for d in range(n_docs):
+        lines = [f"# Policy {d}"]
+        for s in range(int(rng.integers(2, 5))):
+            lines.append(f"\n## Section {d}.{s}")
+            for _ in range(int(rng.integers(1, 4))):
+                para = []
+                for _ in range(int(rng.integers(2, 5))):
+                    words = sentences[int(rng.integers(len(sentences)))].split()
+                    for _ in range(2):
+                        words[int(rng.integers(len(words)))] = vocab[int(rng.integers(len(vocab)))]
+                    para.append(" ".join(words))
+                lines.append("\n" + " ".join(para))
+        (folder / f"doc_{d:05d}_{products[d % 3]}.md").write_text("\n".join(lines) + "\n")
+
+def make_queries(n: int, seed: int = 1) -> List[Tuple[str, set]]:
+    """(query, relevant ids): ~8 words from a random chunk with some dropped, plus one noise word."""
+    rng = np.random.default_rng(seed)
+    # point ids depend on the (temporary) source path, so order rows by text to keep runs comparable
+    rows = sorted(vector_store.scroll_all_texts(), key=lambda r: r["text"])
+    by_text: Dict[str, set] = {}
+    for r in rows:
+        by_text.setdefault(r["text"], set()).add(r["id"])
+    out = []
+    all_words = [w for r in rows[:200] for w in r["text"].split()]
+    for i in rng.choice(len(rows), size=min(n, len(rows)), replace=False):
+        words = rows[i]["text"].split()
+        start = int(rng.integers(max(1, len(words) - 8)))
+        window = [w for w in words[start:start + 8] if rng.random() > 0.25]
+        window.append(all_words[int(rng.integers(len(all_words)))])
+        out.append((" ".join(window), by_text[rows[i]["text"]]))
+    return out
+
+# ---- measurement ----
+
+def _percentiles(lat: List[float]) -> Dict[str, float]:
+    ms = np.array(lat) * 1000
+    return {f"p{q}_ms": round(float(np.percentile(ms, q)), 3) for q in (50, 95, 99)}
+
+def evaluate(name: str, run: Callable[[str], List[str]], queries: List[Tuple[str, set]], k: int) -> Dict:
+    lat, hits, rr = [], 0, 0.0
+    for q, relevant in queries:
+        t = time.perf_counter()
+        ids = run(q)
+        lat.append(time.perf_counter() - t)
+        for rank, pid in enumerate(ids[:k], 1):
+            if pid in relevant:
+                hits += 1
+                rr += 1.0 / rank
+                break
+    n = len(queries)
+    return {"name": name, f"recall@{k}": round(hits / n, 4), "mrr": round(rr / n, 4), **_percentiles(lat)}
+
+def run_size(n_docs: int, n_queries: int, k: int, workdir: Path) -> Dict:
+    from fastapi.testclient import TestClient
+    from src.api.main import app
+
+    reset_qdrant()
+    corpus = workdir / f"corpus_{n_docs}"
+    generate_corpus(corpus, n_docs)
+
+    stats: Dict = {}
+    t = time.perf_counter()
+    ingest_folder(corpus, stats=stats)
+    ingest_s = time.perf_counter() - t
+    bm25_store.build([(r["id"], r["text"], r["fields"]) for r in vector_store.scroll_all_texts()])
+    chunks = vector_store.count()
+
+    queries = make_queries(n_queries)
+    client = TestClient(app)
+
+    def http(path: str) -> Callable[[str], List[str]]:
+        def run(q: str) -> List[str]:
+            r = client.post(path, json={"query": q, "top_k": k})
+            r.raise_for_status()
+            return [h["id"] for h in r.json()["hits"]]
+        return run
+
+    return {
+        "docs": n_docs,
+        "chunks": chunks,
+        "ingest": {"wall_s": round(ingest_s, 3), "chunks_per_s": round(chunks / ingest_s, 1), "stages": stats},
+        "retrieval": [
+            evaluate("bm25_store.search", lambda q: [h["id"] for h in bm25_store.search(q, top_k=k)], queries, k),
+            evaluate("/search", http("/search"), queries, k),
+            evaluate("/search_merged", http("/search_merged"), queries, k),
+        ],
+    }
+
+def compare(results: Dict, baseline: Dict, tolerance: float, latency_factor: float) -> List[str]:
+    """Regressions of recall/MRR beyond tolerance or p95 latency beyond latency_factor x baseline."""
+    problems = []
+    base = {(r["docs"], m["name"]): m for r in baseline["runs"] for m in r["retrieval"]}
+    for r in results["runs"]:
+        for m in r["retrieval"]:
+            b = base.get((r["docs"], m["name"]))
+            if b is None:
+                continue
+            for metric in [key for key in m if key.startswith("recall@")] + ["mrr"]:
+                if metric in b and m[metric] < b[metric] - tolerance:
+                    problems.append(f"{m['name']} @ {r['docs']} docs: {metric} {b[metric]} -> {m[metric]}")
+            if m["p95_ms"] > b["p95_ms"] * latency_factor:
+                problems.append(f"{m['name']} @ {r['docs']} docs: p95 {b['p95_ms']}ms -> {m['p95_ms']}ms")
+    return problems
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="100,500,2000", help="corpus sizes, in documents")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("-k", type=int, default=5)
+    ap.add_argument("--out", default="retrieval_bench.json")
+    ap.add_argument("--baseline", help="previous results to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.02, help="allowed recall/MRR drop")
+    ap.add_argument("--latency-factor", type=float, default=1.5, help="allowed p95 latency growth")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        install_standins(Path(tmp))
+        runs = [run_size(int(n), args.queries, args.k, Path(tmp)) for n in args.sizes.split(",")]
+    results = {"k": args.k, "queries": args.queries, "runs": runs}
+    Path(args.out).write_text(json.dumps(results, indent=2))
+    for r in runs:
+        for m in r["retrieval"]:
+            print(json.dumps({"docs": r["docs"], "chunks": r["chunks"], **m}))
+        print(json.dumps({"docs": r["docs"], "ingest": r["ingest"]["wall_s"], "chunks_per_s": r["ingest"]["chunks_per_s"]}))
+
+    if args.baseline:
+        problems = compare(results, json.loads(Path(args.baseline).read_text()), args.tolerance, args.latency_factor)
+        for p in problems:
+            print("REGRESSION:", p, file=sys.stderr)
+        sys.exit(1 if problems else 0)
+
+if __name__ == "__main__":
+    main()
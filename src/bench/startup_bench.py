@@ -0,0 +1,139 @@
+"""
+Startup latency of the API server: how long until it answers /health (liveness), /ready
+(vector store reachable) and /ready without "degraded" (BM25 built), measured from process spawn.
+
+The server runs as a uvicorn subprocess on the embedded vector backend, pre-filled with --n
+synthetic chunks: it needs neither Qdrant nor an OpenAI key (the OpenAI clients are only built
+on the first embedding call). Two scenarios per run:
+    cold - no BM25 snapshot: the index is built from a full scroll of the store
+    warm - the snapshot written by the cold start is loaded instead
+Import time of src.api.main is measured separately, in a fresh interpreter.
+
+    python -m src.bench.startup_bench --n 50000 --runs 3
+    python -m src.bench.startup_bench --n 2000 --runs 1   # smoke run
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+import numpy as np
+
+from src.bench.vector_storage_bench import overrides, synthetic_vectors
+from src.rag import vector_store as store_module
+from src.rag.bm25_store import BM25Store
+from src.rag.bm25_sync import BM25Sync
+from src.rag.chunk_cache import ChunkCache
+from src.rag.embedded_store import EmbeddedStore
+from src.utils.settings import settings
+
+ROOT = Path(__file__).resolve().parents[2]
+WORDS = ("domain transfer renewal dns record nameserver whois privacy email mailbox hosting ssl "
+         "certificate refund invoice billing auth code lock expiry redirect forwarding").split()
+
+def populate(path: Path, n: int, dim: int, batch: int = 1024):
+    """Fill an embedded store directly, without the service's chunk cache and BM25 log."""
+    rng = np.random.default_rng(0)
+    with overrides({"embedding_dim": dim}):
+        saved = store_module.chunk_cache, store_module.bm25_sync
+        store_module.chunk_cache, store_module.bm25_sync = ChunkCache(dim=dim, max_bytes=0), BM25Sync(BM25Store())
+        try:
+            store = EmbeddedStore(str(path))
+            store.ensure_collection()
+            for i in range(0, n, batch):
+                m = min(batch, n - i)
+                ids = [f"chunk-{j}" for j in range(i, i + m)]
+                payloads = [{"id": pid, "text": " ".join(rng.choice(WORDS, 60)), "doc_id": f"doc-{j // 8}",
+                             "product": ("domains", "hosting", "email")[j % 3], "lang": "en",
+                             "updated_at": "2024-01-01T00:00:00+00:00"}
+                            for j, pid in zip(range(i, i + m), ids)]
+                store.upsert_many(ids, synthetic_vectors(m, dim, seed=i), payloads, chunk=batch)
+        finally:
+            store_module.chunk_cache, store_module.bm25_sync = saved
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def server_env(work: Path, dim: int) -> Dict[str, str]:
+    return dict(os.environ, PYTHONPATH=str(ROOT), VECTOR_BACKEND="embedded",
+                EMBEDDED_STORE_DIR=str(work / "vectors"), EMBEDDING_DIM=str(dim),
+                BM25_SNAPSHOT_DIR=str(work / "bm25_index"), BM25_CHANGELOG_PATH=str(work / "bm25_index.log"),
+                INGEST_JOBS_DIR=str(work / "ingest_jobs"), INGEST_MANIFEST_PATH=str(work / "manifest.json"))
+
+def import_seconds(env: Dict[str, str], work: Path) -> float:
+    code = "import time; t = time.perf_counter(); import src.api.main; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], env=env, cwd=work, check=True, capture_output=True, text=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+def start_once(env: Dict[str, str], work: Path, timeout: float) -> Dict[str, Optional[float]]:
+    port = free_port()
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "src.api.main:app", "--port", str(port),
+                             "--log-level", "warning"], env=env, cwd=work,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    marks: Dict[str, Optional[float]] = {"health_s": None, "ready_s": None, "bm25_ready_s": None}
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=5) as client:
+            while time.perf_counter() - t0 < timeout and marks["bm25_ready_s"] is None:
+                if proc.poll() is not None:
+                    raise RuntimeError(f"server exited with {proc.returncode}")
+                try:
+                    if marks["health_s"] is None and client.get("/health").status_code == 200:
+                        marks["health_s"] = time.perf_counter() - t0
+                    if marks["health_s"] is not None:
+                        r = client.get("/ready")
+                        if r.status_code == 200 and marks["ready_s"] is None:
+                            marks["ready_s"] = time.perf_counter() - t0
+                        if r.status_code == 200 and not r.json()["degraded"]:
+                            marks["bm25_ready_s"] = time.perf_counter() - t0
+                            marks["bm25_warmup_s"] = r.json()["bm25"].get("seconds")
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.005)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+    return {k: None if v is None else round(v, 3) for k, v in marks.items()}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=20000, help="chunks in the store")
+    ap.add_argument("--dim", type=int, default=settings.embedding_dim)
+    ap.add_argument("--runs", type=int, default=3, help="cold + warm starts per run")
+    ap.add_argument("--timeout", type=float, default=600)
+    ap.add_argument("--out", default="startup_bench.json")
+    args = ap.parse_args()
+
+    work = Path(tempfile.mkdtemp(prefix="startup_bench_"))
+    try:
+        t = time.perf_counter()
+        populate(work / "vectors", args.n, args.dim)
+        print(f"populated {args.n} chunks in {time.perf_counter() - t:.1f}s")
+        env = server_env(work, args.dim)
+        results: Dict[str, List] = {"import_s": [], "cold": [], "warm": []}
+        for _ in range(args.runs):
+            results["import_s"].append(round(import_seconds(env, work), 3))
+            shutil.rmtree(work / "bm25_index", ignore_errors=True)
+            (work / "bm25_index.log").unlink(missing_ok=True)
+            results["cold"].append(start_once(env, work, args.timeout))
+            results["warm"].append(start_once(env, work, args.timeout))
+        for name in ("cold", "warm"):
+            for run in results[name]:
+                print(f"{name:5s} health {run['health_s']}s  ready {run['ready_s']}s  bm25 {run['bm25_ready_s']}s")
+        print(f"import src.api.main: {results['import_s']}s")
+        Path(args.out).write_text(json.dumps({"n": args.n, "dim": args.dim, **results}, indent=2))
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Recall / latency / RAM trade-offs of the vector store layouts that Settings can select
+(Qdrant quantization, on-disk vectors, HNSW parameters, shortened embeddings, gRPC transport,
+and the embedded in-process backend with float32/float16 rows or an HNSW graph).
+
+Each configuration gets its own collection (or embedded store directory), created through
+ensure_collection and filled through upsert_many, so the measured code is the code the service runs.
+Recall@k is measured against exact cosine search over the full-size vectors.
+
+    python -m src.bench.vector_storage_bench --n 50000 --configs float32,scalar,binary,scalar_on_disk
+    python -m src.bench.vector_storage_bench --vectors embeddings.npy   # real embeddings (N x dim float32)
+    python -m src.bench.vector_storage_bench --local --n 2000           # smoke run, no server needed
+    python -m src.bench.vector_storage_bench --configs embedded,embedded_f16,embedded_hnsw
+
+Synthetic vectors are clustered Gaussians: they rank quantization and HNSW settings sensibly,
+but shortened dimensions are only meaningful with real text-embedding-3 vectors (--vectors),
+whose leading dimensions carry most of the signal. With --local the in-memory client ignores
+quantization and HNSW (it always searches exactly); use a real server for the trade-offs.
+embedded_hnsw needs hnswlib (otherwise it searches exactly, like embedded).
+RAM is estimated from the layout (vectors, quantized copy, HNSW level-0 links).
+"""
+import argparse
+import json
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+from qdrant_client import QdrantClient
+
+from src.rag import vector_store as store_module
+from src.rag.chunk_cache import ChunkCache
+from src.rag.embedded_store import EmbeddedStore
+from src.rag.store import make_vector_store
+from src.rag.vector_store import VectorStore
+from src.utils.settings import settings
+
+CONFIGS: Dict[str, Dict] = {
+    "float32": {},
+    "on_disk": {"qdrant_on_disk": True},
+    "hnsw_m32": {"qdrant_hnsw_m": 32, "qdrant_hnsw_ef_construct": 200},
+    "scalar": {"qdrant_quantization": "scalar"},
+    "scalar_no_rescore": {"qdrant_quantization": "scalar", "qdrant_search_rescore": False},
+    "scalar_on_disk": {"qdrant_quantization": "scalar", "qdrant_on_disk": True},
+    "binary": {"qdrant_quantization": "binary", "qdrant_search_oversampling": 3.0},
+    "dim512": {"embedding_dim": 512},
+    "dim512_scalar": {"embedding_dim": 512, "qdrant_quantization": "scalar"},
+    "grpc": {"qdrant_prefer_grpc": True},
+    "embedded": {"vector_backend": "embedded"},
+    "embedded_f16": {"vector_backend": "embedded", "embedded_store_dtype": "float16"},
+    "embedded_hnsw": {"vector_backend": "embedded", "embedded_hnsw_min_points": 1},
+}
+
+@contextmanager
+def overrides(values: Dict) -> Iterator[None]:
+    old = {k: getattr(settings, k) for k in values}
+    try:
+        for k, v in values.items():
+            setattr(settings, k, v)
+        yield
+    finally:
+        for k, v in old.items():
+            setattr(settings, k, v)
+
+# ---- data ----
+
+def synthetic_vectors(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n // 50), dim)).astype(np.float32)
+    x = centers[rng.integers(len(centers), size=n)] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+def make_queries(x: np.ndarray, n: int, seed: int = 1) -> np.ndarray:
+    """Perturbed corpus vectors: each query has a close, but not identical, neighbourhood."""
+    rng = np.random.default_rng(seed)
+    q = x[rng.choice(len(x), size=n, replace=False)] + 0.02 * rng.standard_normal((n, x.shape[1])).astype(np.float32)
+    return q / np.linalg.norm(q, axis=1, keepdims=True)
+
+def shorten(x: np.ndarray, dim: int) -> np.ndarray:
+    """What the embeddings API returns for dimensions=dim: leading components, renormalized."""
+    if dim >= x.shape[1]:
+        return x
+    y = x[:, :dim]
+    return y / np.linalg.norm(y, axis=1, keepdims=True)
+
+def exact_top_k(x: np.ndarray, q: np.ndarray, k: int) -> List[set]:
+    out = []
+    for i in range(0, len(q), 256):
+        scores = q[i:i + 256] @ x.T
+        out.extend(set(row) for row in np.argpartition(-scores, k - 1, axis=1)[:, :k])
+    return out
+
+# ---- measurement ----
+
+def ram_estimate_mb(n: int) -> Dict[str, float]:
+    dim = settings.embedding_dim
+    if settings.vector_backend == "embedded":
+        # mapped rows stay in the page cache; HNSW level-0 links as for Qdrant
+        mb = {"vectors_mb": n * dim * np.dtype(settings.embedded_store_dtype).itemsize,
+              "hnsw_mb": n * 2 * settings.embedded_hnsw_m * 4 if settings.embedded_hnsw_min_points is not None else 0}
+        mb = {k: round(v / 2 ** 20, 1) for k, v in mb.items()}
+        mb["total_mb"] = round(sum(mb.values()), 1)
+        return mb
+    vectors = 0 if settings.qdrant_on_disk else n * dim * 4
+    quant = {"scalar": n * dim, "binary": n * dim // 8}.get(settings.qdrant_quantization or "", 0)
+    if not settings.qdrant_quantization_always_ram:
+        quant = 0
+    hnsw = n * 2 * (settings.qdrant_hnsw_m or 16) * 4  # level-0 links dominate
+    mb = {"vectors_mb": vectors, "quantized_mb": quant, "hnsw_mb": hnsw}
+    mb = {k: round(v / 2 ** 20, 1) for k, v in mb.items()}
+    mb["total_mb"] = round(sum(mb.values()), 1)
+    return mb
+
+def _percentiles(lat: List[float]) -> Dict[str, float]:
+    ms = np.array(lat) * 1000
+    return {f"p{q}_ms": round(float(np.percentile(ms, q)), 3) for q in (50, 95, 99)}
+
+def _wait_indexed(store: VectorStore, timeout_s: float = 600):
+    if isinstance(store, EmbeddedStore):
+        return
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        if store.client.get_collection(settings.qdrant_collection).status == "green":
+            return
+        time.sleep(0.5)
+
+def run_config(name: str, x: np.ndarray, queries: np.ndarray, truth: List[set], k: int, batch: int,
+               local: Optional[QdrantClient]) -> Dict:
+    base = settings.qdrant_collection
+    tmp = tempfile.TemporaryDirectory(prefix=f"vector-bench-{name}-")
+    with tmp, overrides(dict(CONFIGS[name], qdrant_collection=f"{base}_bench_{name}", embedded_store_dir=tmp.name)):
+        store = make_vector_store()
+        embedded = isinstance(store, EmbeddedStore)
+        if local is not None and not embedded:
+            store.client = local
+        # keep the service-side caches out of the numbers
+        store_module.chunk_cache = ChunkCache(dim=settings.embedding_dim, max_bytes=0)
+        if not embedded and store.client.collection_exists(settings.qdrant_collection):
+            store.client.delete_collection(settings.qdrant_collection)
+        store.ensure_collection()
+
+        vecs = shorten(x, settings.embedding_dim)
+        qs = shorten(queries, settings.embedding_dim)
+        ids = [str(uuid.UUID(int=i + 1)) for i in range(len(vecs))]
+        payloads = [{"id": pid, "product": "domains", "lang": "en"} for pid in ids]
+        t = time.perf_counter()
+        store.upsert_many(ids, vecs, payloads, chunk=batch)
+        upsert_s = time.perf_counter() - t
+        _wait_indexed(store)
+
+        index = {pid: i for i, pid in enumerate(ids)}
+        lat, recall = [], 0.0
+        for q, expected in zip(qs, truth):
+            t = time.perf_counter()
+            hits = store.search(q, top_k=k)
+            lat.append(time.perf_counter() - t)
+            recall += len({index[h["id"]] for h in hits} & expected) / k
+        if embedded:
+            store.drop()
+        else:
+            store.client.delete_collection(settings.qdrant_collection)
+        return {"config": name, "dim": settings.embedding_dim, f"recall@{k}": round(recall / len(qs), 4),
+                **_percentiles(lat), "upsert_points_per_s": round(len(ids) / upsert_s, 1),
+                "ram_estimate": ram_estimate_mb(len(ids))}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--configs", default=",".join(CONFIGS), help=f"any of {', '.join(CONFIGS)}")
+    ap.add_argument("--n", type=int, default=20000, help="synthetic vectors (ignored with --vectors)")
+    ap.add_argument("--vectors", help=".npy file of embeddings to use instead of synthetic vectors")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("-k", type=int, default=10)
+    ap.add_argument("--batch", type=int, default=256, help="points per upsert request")
+    ap.add_argument("--local", action="store_true", help="in-memory client instead of QDRANT_HOST")
+    ap.add_argument("--out", default="vector_storage_bench.json")
+    args = ap.parse_args()
+
+    if args.vectors:
+        x = np.load(args.vectors).astype(np.float32)
+        x /= np.linalg.norm(x, axis=1, keepdims=True)
+    else:
+        x = synthetic_vectors(args.n, settings.embedding_dim)
+    queries = make_queries(x, min(args.queries, len(x)))
+    truth = exact_top_k(x, queries, args.k)
+    local = QdrantClient(":memory:") if args.local else None
+
+    runs = []
+    for name in args.configs.split(","):
+        if local is not None and CONFIGS[name].get("qdrant_prefer_grpc"):
+            continue  # no transport in local mode
+        runs.append(run_config(name, x, queries, truth, args.k, args.batch, local))
+        print(json.dumps(runs[-1]))
+    Path(args.out).write_text(json.dumps({"n": len(x), "k": args.k, "queries": len(queries), "runs": runs},
+                                         indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,12 @@
+import bisect
+import hashlib
+import json
 import re
-from typing import Literal, List, Dict, Any
+from pathlib import Path
+from typing import Any, Dict, List, Literal, Optional, Sequence, get_args
+
+from src.utils.metrics import ACTION_RULES_FIRED
+from src.utils.settings import settings
 
 Action = Literal[
     "no_escalation_needed",
@@ -9,31 +16,127 @@ Action = Literal[
     "escalate_to_support_level_2",
 ]
 
-_ABUSE = re.compile(r"\b(abuse|malware|phishing|spam|fraud)\b", re.I)
-_BILL  = re.compile(r"\b(billing|refund|chargeback|invoice)\b", re.I)
-_IDV   = re.compile(r"\b(verification|ownership|identity|id check)\b", re.I)
-_SUSP  = re.compile(r"\b(suspend|suspension|suspended)\b", re.I)
+DEFAULT_RULES_PATH = Path(__file__).with_name("action_rules.json")
+
+# scope -> how keywords match: whole words in the ticket, substrings of retrieved snippet titles.
+# Lookaheads: matches do not consume text, so a keyword starting inside another rule's longer
+# keyword is still found (at each position the first rule in order that matches there is taken).
+_SCOPES = {"ticket": r"(?=\b(?:{})\b)", "snippet_title": "(?=(?:{}))"}
+
+def _alternation(rules: List[Dict[str, Any]], scope: str) -> Optional[re.Pattern]:
+    """One case-insensitive pattern for every rule of a scope, a named group per rule."""
+    groups = []
+    for i, r in enumerate(rules):
+        if r["scope"] == scope:
+            words = sorted(set(r["keywords"]), key=len, reverse=True)  # longest alternative first
+            groups.append(f"(?P<r{i}>{'|'.join(re.escape(w) for w in words)})")
+    if not groups:
+        return None
+    return re.compile(_SCOPES[scope].format("|".join(groups)), re.I)
+
+class RuleEngine:
+    """
+    Routing rules for action_required, loaded from a JSON file (ACTION_RULES_PATH).
+    Rules are ordered and the first one that fires decides the action. All ticket keywords are
+    compiled into a single alternation with a named group per rule, so a ticket is classified in
+    one scan; snippet-title rules share a second pattern. version is a hash of the rules, for
+    caches of rule-dependent results. Rules only need the ticket and the
+    retrieved snippets, so the action is known before the LLM is called.
+    A rule may carry a canned "answer"; tickets it fires on are answered without the LLM.
+    """
+    def __init__(self, rules: List[Dict[str, Any]]):
+        actions = set(get_args(Action))
+        for r in rules:
+            if r.get("action") not in actions:
+                raise ValueError(f"action rule {r.get('name')!r}: unknown action {r.get('action')!r}")
+            if r.get("scope", "ticket") not in _SCOPES:
+                raise ValueError(f"action rule {r.get('name')!r}: unknown scope {r.get('scope')!r}")
+            if not r.get("keywords"):
+                raise ValueError(f"action rule {r.get('name')!r}: no keywords")
+        self.rules = [dict(r, scope=r.get("scope", "ticket")) for r in rules]
+        self.version = hashlib.sha256(json.dumps(self.rules, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        self._ticket = _alternation(self.rules, "ticket")
+        self._title = _alternation(self.rules, "snippet_title")
+
+    @classmethod
+    def from_file(cls, path: Optional[str] = None) -> "RuleEngine":
+        return cls(json.loads(Path(path or DEFAULT_RULES_PATH).read_text())["rules"])
+
+    def _match(self, i: int, keyword: str) -> Dict[str, str]:
+        r = self.rules[i]
+        m = {"rule": r["name"], "action": r["action"], "keyword": keyword.lower()}
+        if r.get("answer"):
+            m["answer"] = r["answer"]
+        return m
+
+    @staticmethod
+    def _first(pattern: Optional[re.Pattern], text: str, fired: Dict[int, str], stop: int):
+        """Record the first keyword of each rule found in text; stops early once rule `stop` fires."""
+        if pattern is None:
+            return
+        for m in pattern.finditer(text):
+            i = int(m.lastgroup[1:])
+            fired.setdefault(i, m.group(m.lastgroup))
+            if i == stop:
+                return
 
-def enforce_action(ticket_text: str, snippets: List[Dict[str, Any]], llm_action: Action) -> Action:
-    text = ticket_text.lower()
+    def _decide(self, fired: Dict[int, str], snippets: Sequence[Dict[str, Any]]) -> Optional[Dict[str, str]]:
+        titles = None
+        for i, r in enumerate(self.rules):
+            if r["scope"] == "snippet_title" and titles is None and snippets:
+                titles = "\n".join((sn.get("payload") or {}).get("doc", "") for sn in snippets)
+                self._first(self._title, titles, fired, -1)
+            if i in fired:
+                return self._match(i, fired[i])
+        return None
 
-    # Rule 1: If the ticket text contains Suspension/Abuse keywords, enforce escalation to abuse team
-    if _SUSP.search(text) or _ABUSE.search(text):
-        return "escalate_to_abuse_team"
+    def classify(self, ticket_text: str, snippets: Sequence[Dict[str, Any]] = ()) -> Optional[Dict[str, str]]:
+        """
+        {"rule", "action", "keyword"[, "answer"]} of the first rule that fires, or None.
+        Snippet titles are only scanned if no earlier ticket rule fired.
+        """
+        fired: Dict[int, str] = {}
+        self._first(self._ticket, ticket_text, fired, 0)
+        decision = self._decide(fired, snippets)
+        if decision is not None:
+            ACTION_RULES_FIRED.labels(decision["rule"]).inc()
+        return decision
 
-    # Rule 2: If any retrieved snippet has "suspension" or "abuse" in the title, enforce escalation to abuse team
-    for sn in snippets:
-        title = (sn.get("payload") or {}).get("doc", "").lower()
-        if "suspension" in title or "abuse" in title:
-            return "escalate_to_abuse_team"
+    def classify_many(self, tickets: Sequence[str],
+                      snippets: Optional[Sequence[Sequence[Dict[str, Any]]]] = None) -> List[Optional[Dict[str, str]]]:
+        """
+        classify() for many tickets with a single scan over all of them: the tickets are joined
+        with NUL separators and each match is mapped back to its ticket by offset.
+        """
+        fired: List[Dict[int, str]] = [{} for _ in tickets]
+        if self._ticket is not None and tickets:
+            starts, pos = [], 0
+            for t in tickets:
+                starts.append(pos)
+                pos += len(t) + 1
+            for m in self._ticket.finditer("\0".join(tickets)):
+                fired[bisect.bisect_right(starts, m.start()) - 1].setdefault(int(m.lastgroup[1:]), m.group(m.lastgroup))
+        out = []
+        for i, f in enumerate(fired):
+            decision = self._decide(f, snippets[i] if snippets else ())
+            if decision is not None:
+                ACTION_RULES_FIRED.labels(decision["rule"]).inc()
+            out.append(decision)
+        return out
 
-    # Rule 3: Billing-related keywords → Escalate to billing team
-    if _BILL.search(text):
-        return "escalate_to_billing_team"
+rule_engine = RuleEngine.from_file(settings.action_rules_path)
 
-    # Rule 4: Identity/Verification keywords then escalate to support level 2
-    if _IDV.search(text):
-        return "escalate_to_support_level_2"
+# default of `decision` parameters: not classified yet (None means no rule fired)
+UNSET: Any = object()
 
-    # Rule 5: If the LLM suggests "no_escalation_needed" but the ticket text contains "verification" or "ownership", override to "escalate_to_support_level_2"
+def enforce_action(ticket_text: str, snippets: List[Dict[str, Any]], llm_action: Action,
+                   decision: Optional[Dict[str, str]] = UNSET) -> Action:
+    """
+    The action of the first routing rule that fires, else the LLM's suggestion.
+    decision: the result of rule_engine.classify for this ticket, if it was already classified.
+    """
+    if decision is UNSET:
+        decision = rule_engine.classify(ticket_text, snippets)
+    if decision is not None:
+        return decision["action"]
     return llm_action or "no_escalation_needed"
@@ -0,0 +1,138 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from src.api.schemas import TicketResponse
+from src.core.actions import rule_engine
+from src.core.prompt import PROMPT_VERSION
+from src.rag.context_packer import snippet_ids
+from src.utils.settings import settings
+from src.utils.metrics import ANSWER_CACHE_HITS, ANSWER_CACHE_MISSES, ANSWER_CACHE_INVALIDATIONS
+
+def _normalize_ticket(text: str) -> str:
+    return " ".join(text.lower().split())
+
+class AnswerCache:
+    """
+    Cache of final /resolve-ticket answers.
+    Exact key: normalized ticket text + ids of the prompt's chunks + chat model + prompt version
+    + routing rules version (the rules decide the action and canned answers).
+    Entries expire after ttl_s, the least recently used are evicted beyond max_entries, and an
+    entry is dropped as soon as any of its snippets is re-ingested, updated or deleted, by this
+    worker or, through the shared change log, by another one.
+    With semantic_threshold set, an answer is also reused for a ticket whose query embedding
+    has cosine similarity >= threshold with a cached ticket (checked before retrieval).
+    """
+    def __init__(self, max_entries: int, ttl_s: float, semantic_threshold: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.semantic_threshold = semantic_threshold
+        self._lock = threading.Lock()
+        # key -> (expires_at, response, snippet ids, vector slot or None)
+        self._entries: "OrderedDict[str, Tuple[float, TicketResponse, List[str], Optional[int]]]" = OrderedDict()
+        self._by_chunk: Dict[str, Set[str]] = {}
+        # semantic mode: one row per entry with a query vector
+        self._vecs: Optional[np.ndarray] = None
+        self._slot_keys: List[Optional[str]] = []
+        self._free: List[int] = []
+
+    @property
+    def semantic(self) -> bool:
+        return self.semantic_threshold is not None
+
+    @staticmethod
+    def key(ticket_text: str, snippets: List[Dict[str, Any]]) -> str:
+        ids = ",".join(sorted(pid for sn in snippets for pid in snippet_ids(sn)))
+        model = os.getenv("OPENAI_GPT_NAME") or ""
+        raw = "\0".join([_normalize_ticket(ticket_text), ids, model, PROMPT_VERSION, rule_engine.version])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _drop(self, key: str):
+        _, _, ids, slot = self._entries.pop(key)
+        for pid in ids:
+            keys = self._by_chunk.get(pid)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_chunk[pid]
+        if slot is not None:
+            self._slot_keys[slot] = None
+            self._free.append(slot)
+
+    def get(self, key: str) -> Optional[TicketResponse]:
+        with self._lock:
+            hit = self._entries.get(key)
+            if hit is not None and hit[0] < time.monotonic():
+                self._drop(key)
+                hit = None
+            if hit is None:
+                ANSWER_CACHE_MISSES.inc()
+                return None
+            self._entries.move_to_end(key)
+        ANSWER_CACHE_HITS.labels(mode="exact").inc()
+        return hit[1].model_copy()
+
+    def get_similar(self, q_vec: np.ndarray) -> Optional[TicketResponse]:
+        if not self.semantic:
+            return None
+        with self._lock:
+            if self._vecs is None or not self._entries:
+                return None
+            n = len(self._slot_keys)
+            sims = self._vecs[:n] @ q_vec.astype(np.float32)
+            live = np.array([k is not None for k in self._slot_keys])
+            sims[~live] = -np.inf
+            best = int(np.argmax(sims))
+            if sims[best] < self.semantic_threshold:
+                return None
+            key = self._slot_keys[best]
+            hit = self._entries[key]
+            if hit[0] < time.monotonic():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+        ANSWER_CACHE_HITS.labels(mode="semantic").inc()
+        return hit[1].model_copy()
+
+    def put(self, key: str, resp: TicketResponse, snippets: List[Dict[str, Any]], q_vec: Optional[np.ndarray] = None):
+        ids = [pid for sn in snippets for pid in snippet_ids(sn)]
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            while len(self._entries) >= self.max_entries:
+                self._drop(next(iter(self._entries)))
+            slot = None
+            if self.semantic and q_vec is not None:
+                if self._vecs is None:
+                    self._vecs = np.zeros((self.max_entries, len(q_vec)), dtype=np.float32)
+                slot = self._free.pop() if self._free else len(self._slot_keys)
+                if slot == len(self._slot_keys):
+                    self._slot_keys.append(None)
+                self._vecs[slot] = q_vec
+                self._slot_keys[slot] = key
+            self._entries[key] = (time.monotonic() + self.ttl_s, resp, ids, slot)
+            for pid in ids:
+                self._by_chunk.setdefault(pid, set()).add(key)
+
+    def invalidate_chunks(self, ids: Optional[List[str]]):
+        """Drop the answers built from any of these chunks; None drops every answer."""
+        with self._lock:
+            keys = set(self._entries) if ids is None else set()
+            for pid in ids or ():
+                keys |= self._by_chunk.get(pid, set())
+            for key in keys:
+                if key in self._entries:
+                    self._drop(key)
+        if keys:
+            ANSWER_CACHE_INVALIDATIONS.inc(len(keys))
+
+answer_cache = AnswerCache(
+    max_entries=settings.answer_cache_max_entries,
+    ttl_s=settings.answer_cache_ttl_s,
+    semantic_threshold=settings.answer_cache_semantic_threshold,
+)
@@ -1,61 +1,104 @@
+import asyncio
 import json, orjson
-from typing import Dict, Any, List
-from openai import OpenAI
+import time
+from typing import Dict, Any, List, AsyncIterator, Optional, Tuple
 import os
+import structlog
 from dotenv import load_dotenv
+from pydantic import ValidationError
 
-from src.rag.merged_retriever import search_merged
+from src.rag.merged_retriever import search_merged, asearch_merged, asearch_merged_batch
+from src.rag.context_packer import pack_context, snippet_ids
 from src.core.prompt import SYSTEM, build_user_prompt, output_schema_hint
-from src.api.schemas import TicketResponse
-from src.core.actions import enforce_action
+from src.api.schemas import TicketRequest, TicketResponse, validation_msg
+from src.core.actions import UNSET, enforce_action, rule_engine
+from src.core.answer_cache import answer_cache
+from src.rag.embedding import embed_texts, aembed_texts
+from src.rag.store import vector_store
+from src.utils.clients import openai_client, aopenai_client
+from src.utils.metrics import LLM_CALLS, LLM_JSON_RETRIES, LLM_TOKENS
+from src.utils.settings import settings
+from src.utils.tracing import span, trace
+
+logger = structlog.get_logger()
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+# drop cached answers whose snippets are re-ingested, updated or deleted
+vector_store.add_change_listener(answer_cache.invalidate_chunks)
+
+_FIX_MSG = {"role": "system", "content": "Your previous output was not valid JSON per the schema. Reply again with ONLY the JSON object."}
 
 def _pick_snippets(ticket_text: str, top_k: int = 8) -> List[Dict[str, Any]]:
     filters = {} # e.g., {"product": "domains", "lang": "en"}
-    return search_merged(ticket_text, top_k=top_k, filters=filters or None, alpha=0.7)
+    return _pack(search_merged(ticket_text, top_k=top_k, filters=filters or None, alpha=0.7))
+
+async def _apick_snippets(ticket_text: str, top_k: int = 8) -> List[Dict[str, Any]]:
+    filters = {}
+    return _pack(await asearch_merged(ticket_text, top_k=top_k, filters=filters or None, alpha=0.7))
+
+def _pack(snippets: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Merge overlapping chunks, drop near-duplicates and fit the prompt's token budget."""
+    with span("resolve", "context_pack"):
+        return pack_context(snippets)
 
-def _call_llm(messages: List[Dict[str, str]]) -> str:
+def _llm_kwargs(messages: List[Dict[str, str]]) -> Dict[str, Any]:
     # Response format: strict JSON object
-    resp = client.chat.completions.create(
+    return dict(
         model=os.getenv("OPENAI_GPT_NAME"),
         response_format={"type": "json_object"},
         temperature=0.1,
         messages=messages
     )
+
+def _record_usage(kind: str, usage) -> None:
+    LLM_CALLS.labels(kind).inc()
+    if usage is not None:
+        LLM_TOKENS.labels("prompt").inc(usage.prompt_tokens or 0)
+        LLM_TOKENS.labels("completion").inc(usage.completion_tokens or 0)
+
+def _call_llm(messages: List[Dict[str, str]], kind: str = "answer") -> str:
+    """kind: "answer" for the first call, "json_retry" for the schema-fix retry"""
+    with span("resolve", kind):
+        resp = openai_client().chat.completions.create(**_llm_kwargs(messages))
+    _record_usage(kind, resp.usage)
     return resp.choices[0].message.content
 
-def resolve_ticket(ticket_text: str, top_k: int = 8) -> TicketResponse:
-    # 1. Retrieval
-    snippets = _pick_snippets(ticket_text, top_k=top_k)
+async def _acall_llm(messages: List[Dict[str, str]], kind: str = "answer") -> str:
+    with span("resolve", kind):
+        resp = await aopenai_client().chat.completions.create(**_llm_kwargs(messages))
+    _record_usage(kind, resp.usage)
+    return resp.choices[0].message.content
 
-    # 2. Construct prompt
-    user_prompt = build_user_prompt(ticket_text, snippets)
-    messages = [
+def _build_messages(ticket_text: str, snippets: List[Dict[str, Any]],
+                    decision: Optional[Dict[str, str]] = None) -> List[Dict[str, str]]:
+    user_prompt = build_user_prompt(ticket_text, snippets, decision["action"] if decision else None)
+    return [
         {"role": "system", "content": SYSTEM},
         {"role": "assistant", "content": output_schema_hint()},
         {"role": "user", "content": user_prompt},
     ]
 
-    # 3. LLM Call
-    raw = _call_llm(messages)
+def _fmt_ref(sn: Dict[str, Any]) -> str:
+    return f"{sn['payload'].get('doc','')} · {sn['payload'].get('section','')} · {sn['id']}"
 
-    # 4. Parse and validate JSON
-    def _parse(s: str):
-        try:
-            return TicketResponse.model_validate_json(s)
-        except Exception:
-            fix_msg = messages + [
-                {"role": "system", "content": "Your previous output was not valid JSON per the schema. Reply again with ONLY the JSON object."}
-            ]
-            fixed = _call_llm(fix_msg)
-            return TicketResponse.model_validate_json(fixed)
+def _classify(ticket_text: str, snippets: List[Dict[str, Any]]) -> Optional[Dict[str, str]]:
+    """Routing rule decision, taken before the LLM call (see RuleEngine)."""
+    with span("resolve", "action_rules"):
+        return rule_engine.classify(ticket_text, snippets)
 
-    resp: TicketResponse = _parse(raw)
+def _canned(ticket_text: str, snippets: List[Dict[str, Any]],
+            decision: Optional[Dict[str, str]]) -> Optional[TicketResponse]:
+    """The fired rule's canned answer, if it has one; no LLM call is needed for the ticket."""
+    if not decision or not decision.get("answer"):
+        return None
+    resp = TicketResponse(answer=decision["answer"], references=[], action_required=decision["action"])
+    return _finalize(ticket_text, snippets, resp, decision)
 
-    # 5. Reference filtering, ensure IDs exist, fallback to first two snippets
-    allowed_ids = set(sn["id"] for sn in snippets)
+def _finalize(ticket_text: str, snippets: List[Dict[str, Any]], resp: TicketResponse,
+              decision: Optional[Dict[str, str]] = UNSET) -> TicketResponse:
+    # Reference filtering, ensure IDs exist, fallback to first two snippets
+    allowed_ids = set(pid for sn in snippets for pid in snippet_ids(sn))
     filtered_refs = []
     for r in resp.references:
         # Expect format: "title · section · id"
@@ -64,16 +107,410 @@ def resolve_ticket(ticket_text: str, top_k: int = 8) -> TicketResponse:
             filtered_refs.append(r)
     if not filtered_refs:
         # Auto-fallback to first two snippets if none valid
-        def fmt(sn):
-            return f"{sn['payload'].get('doc','')} · {sn['payload'].get('section','')} · {sn['id']}"
-        filtered_refs = [fmt(sn) for sn in snippets[:2]]
+        filtered_refs = [_fmt_ref(sn) for sn in snippets[:2]]
 
-    # 6. Enforce action rules
-    final_action = enforce_action(ticket_text, snippets, resp.action_required)
+    # Enforce action rules
+    with span("resolve", "enforce_action"):
+        final_action = enforce_action(ticket_text, snippets, resp.action_required, decision)
 
-    # 7. Return final response
     return TicketResponse(
         answer=resp.answer.strip(),
         references=filtered_refs,
         action_required=final_action
     )
+
+def resolve_ticket(ticket_text: str, top_k: int = 8) -> TicketResponse:
+    with trace("resolve_ticket_trace", top_k=top_k):
+        return _resolve_ticket(ticket_text, top_k)
+
+def _resolve_ticket(ticket_text: str, top_k: int) -> TicketResponse:
+    # 0. Near-duplicate answer reuse (semantic cache mode only)
+    q_vec = None
+    if answer_cache.semantic:
+        with span("resolve", "answer_cache"):
+            q_vec = embed_texts([ticket_text])[0]
+            cached = answer_cache.get_similar(q_vec)
+        if cached is not None:
+            return cached
+
+    # 1. Retrieval, then exact answer cache on ticket + retrieved snippets
+    with span("resolve", "retrieve"):
+        snippets = _pick_snippets(ticket_text, top_k=top_k)
+    key = answer_cache.key(ticket_text, snippets)
+    cached = answer_cache.get(key)
+    if cached is not None:
+        return cached
+
+    # 2. Action rules (a canned answer skips the LLM), then construct prompt
+    decision = _classify(ticket_text, snippets)
+    final = _canned(ticket_text, snippets, decision)
+    if final is not None:
+        answer_cache.put(key, final, snippets, q_vec)
+        return final
+    with span("resolve", "prompt_build"):
+        messages = _build_messages(ticket_text, snippets, decision)
+
+    # 3. LLM Call
+    raw = _call_llm(messages)
+
+    # 4. Parse and validate JSON
+    def _parse(s: str):
+        try:
+            return TicketResponse.model_validate_json(s)
+        except Exception:
+            LLM_JSON_RETRIES.inc()
+            fixed = _call_llm(messages + [_FIX_MSG], kind="json_retry")
+            return TicketResponse.model_validate_json(fixed)
+
+    resp: TicketResponse = _parse(raw)
+
+    # 5. Reference filtering and action rules
+    final = _finalize(ticket_text, snippets, resp, decision)
+    answer_cache.put(key, final, snippets, q_vec)
+    return final
+
+async def aresolve_ticket(ticket_text: str, top_k: int = 8) -> TicketResponse:
+    """
+    Async variant of resolve_ticket.
+    """
+    with trace("resolve_ticket_trace", top_k=top_k):
+        return await _aresolve_ticket(ticket_text, top_k)
+
+async def _aresolve_ticket(ticket_text: str, top_k: int) -> TicketResponse:
+    q_vec = None
+    if answer_cache.semantic:
+        with span("resolve", "answer_cache"):
+            q_vec = (await aembed_texts([ticket_text]))[0]
+            cached = answer_cache.get_similar(q_vec)
+        if cached is not None:
+            return cached
+
+    with span("resolve", "retrieve"):
+        snippets = await _apick_snippets(ticket_text, top_k=top_k)
+    return await _aanswer(ticket_text, snippets, q_vec)
+
+async def _aanswer(ticket_text: str, snippets: List[Dict[str, Any]], q_vec=None,
+                   decision: Optional[Dict[str, str]] = UNSET) -> TicketResponse:
+    """
+    Exact answer cache, then action rules, LLM call, validation and _finalize for retrieved snippets.
+    decision: the ticket's routing rule decision, if it was already classified.
+    """
+    key = answer_cache.key(ticket_text, snippets)
+    cached = answer_cache.get(key)
+    if cached is not None:
+        return cached
+
+    if decision is UNSET:
+        decision = _classify(ticket_text, snippets)
+    final = _canned(ticket_text, snippets, decision)
+    if final is not None:
+        answer_cache.put(key, final, snippets, q_vec)
+        return final
+    with span("resolve", "prompt_build"):
+        messages = _build_messages(ticket_text, snippets, decision)
+    raw = await _acall_llm(messages)
+    try:
+        resp = TicketResponse.model_validate_json(raw)
+    except Exception:
+        LLM_JSON_RETRIES.inc()
+        fixed = await _acall_llm(messages + [_FIX_MSG], kind="json_retry")
+        resp = TicketResponse.model_validate_json(fixed)
+    final = _finalize(ticket_text, snippets, resp, decision)
+    answer_cache.put(key, final, snippets, q_vec)
+    return final
+
+class _AnswerText:
+    """
+    Incrementally decodes the top-level "answer" string of the streamed TicketResponse JSON,
+    so token events carry answer text only, not keys, escapes or the other fields.
+    feed() takes each delta and returns the newly decoded text; escapes split across deltas
+    wait for the next one. Leading and trailing whitespace is dropped, as _finalize strips it.
+    """
+    _ESC = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+    def __init__(self):
+        self.depth = 0
+        self.in_str = False  # inside a string other than the answer
+        self.esc = False
+        self.text = ""  # the current depth-1 string, a key candidate
+        self.key: Optional[str] = None  # last depth-1 string
+        self.want_answer = False  # after "answer":
+        self.in_answer = False
+        self.done = False
+        self.pending = ""  # unfinished escape in the answer
+        self.space = ""  # whitespace held until more answer text follows
+        self.started = False
+
+    def _emit(self, out: List[str], c: str):
+        if c.isspace():
+            if self.started:
+                self.space += c
+            return
+        out.append(self.space + c)
+        self.space, self.started = "", True
+
+    def _answer(self, data: str, out: List[str]) -> int:
+        """Decode answer characters; returns how much of data was consumed."""
+        i = 0
+        while i < len(data):
+            c = data[i]
+            if c == '"':
+                self.in_answer, self.done = False, True
+                return i + 1
+            if c != "\\":
+                self._emit(out, c)
+                i += 1
+                continue
+            if i + 1 >= len(data):
+                break
+            if data[i + 1] != "u":
+                self._emit(out, self._ESC.get(data[i + 1], data[i + 1]))
+                i += 2
+                continue
+            if i + 6 > len(data):
+                break
+            try:
+                code, n = int(data[i + 2:i + 6], 16), 6
+                if 0xD800 <= code < 0xDC00:  # high surrogate: decode it with the low half
+                    if i + 12 > len(data):
+                        break
+                    code, n = 0x10000 + ((code - 0xD800) << 10) + (int(data[i + 8:i + 12], 16) - 0xDC00), 12
+            except ValueError:
+                code, n = 0xFFFD, 6
+            self._emit(out, chr(code))
+            i += n
+        self.pending = data[i:]
+        return len(data)
+
+    def feed(self, delta: str) -> str:
+        out: List[str] = []
+        data, self.pending = self.pending + delta, ""
+        i = self._answer(data, out) if self.in_answer else 0
+        while i < len(data) and not self.done:
+            c = data[i]
+            i += 1
+            if self.in_str:
+                if self.esc:
+                    self.esc = False
+                elif c == "\\":
+                    self.esc = True
+                elif c == '"':
+                    self.in_str = False
+                    if self.depth == 1:
+                        self.key = self.text
+                    continue
+                if self.depth == 1:
+                    self.text += c
+            elif c == '"':
+                if self.want_answer:
+                    self.want_answer, self.in_answer = False, True
+                    i += self._answer(data[i:], out)
+                else:
+                    self.in_str, self.text = True, ""
+            elif c == ":" and self.depth == 1 and self.key == "answer":
+                self.want_answer = True
+            elif c in "{[":
+                self.depth += 1
+                self.want_answer = False
+            elif c in "}]":
+                self.depth -= 1
+            elif c == ",":
+                self.key = None
+            elif not c.isspace():
+                self.want_answer = False
+        return "".join(out)
+
+async def astream_resolve_ticket(ticket_text: str, top_k: int = 8) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Streaming variant of aresolve_ticket. Yields (event, data) pairs:
+    ("references", [...]) right after retrieval, ("token", str) with each piece of the answer text
+    as it is decoded from the streamed JSON, then ("final", TicketResponse dict) after validation, reference filtering and action rules.
+    A cached or canned (rule) answer is sent as "final" without token events.
+    """
+    # spans only: a trace() context cannot stay open across the generator's yields
+    q_vec = None
+    if answer_cache.semantic:
+        with span("resolve", "answer_cache"):
+            q_vec = (await aembed_texts([ticket_text]))[0]
+            cached = answer_cache.get_similar(q_vec)
+        if cached is not None:
+            yield "final", cached.model_dump()
+            return
+
+    with span("resolve", "retrieve"):
+        snippets = await _apick_snippets(ticket_text, top_k=top_k)
+    yield "references", [
+        {"id": sn["id"], "ref": _fmt_ref(sn), "score": sn.get("score_merged")} for sn in snippets
+    ]
+    key = answer_cache.key(ticket_text, snippets)
+    cached = answer_cache.get(key)
+    if cached is not None:
+        yield "final", cached.model_dump()
+        return
+
+    decision = _classify(ticket_text, snippets)
+    final = _canned(ticket_text, snippets, decision)
+    if final is not None:
+        answer_cache.put(key, final, snippets, q_vec)
+        yield "final", final.model_dump()
+        return
+    with span("resolve", "prompt_build"):
+        messages = _build_messages(ticket_text, snippets, decision)
+    stream = await aopenai_client().chat.completions.create(**_llm_kwargs(messages), stream=True,
+                                                            stream_options={"include_usage": True})
+    parts: List[str] = []
+    answer = _AnswerText()
+    usage = None
+    async for chunk in stream:
+        # the final chunk carries the token usage and no choices
+        usage = getattr(chunk, "usage", None) or usage
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            parts.append(delta)
+            text = answer.feed(delta)
+            if text:
+                yield "token", text
+    _record_usage("answer", usage)
+
+    try:
+        resp = TicketResponse.model_validate_json("".join(parts))
+    except Exception:
+        LLM_JSON_RETRIES.inc()
+        fixed = await _acall_llm(messages + [_FIX_MSG], kind="json_retry")
+        resp = TicketResponse.model_validate_json(fixed)
+    final = _finalize(ticket_text, snippets, resp, decision)
+    answer_cache.put(key, final, snippets, q_vec)
+    yield "final", final.model_dump()
+
+def _ticket(raw: Any) -> TicketRequest:
+    if isinstance(raw, str):
+        raw = {"ticket_text": raw}
+    return TicketRequest.model_validate(raw)
+
+def _succeeded(idx: int, raw: Any, result: TicketResponse,
+               decision: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    out = {"index": idx, "ok": True, "result": result.model_dump()}
+    if isinstance(raw, dict) and "id" in raw:
+        out["id"] = raw["id"]
+    if decision:
+        out["rule"] = decision["rule"]
+    return out
+
+def _failed(idx: int, raw: Any, error: str) -> Dict[str, Any]:
+    out = {"index": idx, "ok": False, "error": error}
+    if isinstance(raw, dict) and "id" in raw:
+        out["id"] = raw["id"]
+    return out
+
+async def resolve_tickets(items: AsyncIterator[Tuple[int, Any]]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Resolve a stream of (index, ticket) pairs, e.g. from iter_json_items; a ticket is a
+    TicketRequest object (an extra "id" is echoed back) or a plain string.
+
+    Tickets are retrieved resolve_batch_size at a time with asearch_merged_batch (one embeddings
+    call, one Qdrant batch search, shared snippets fetched once) and answered with at most
+    resolve_batch_llm_concurrency LLM calls in flight; reading the input waits for a free slot.
+    Routing rules classify a whole wave in one scan (RuleEngine.classify_many); results of tickets
+    a rule fired on carry its name as "rule".
+    Yields {"index", "ok": True, "result"} or {"index", "ok": False, "error"} per ticket in
+    completion order (a failing ticket does not affect the others), then {"summary": {...}}
+    with the throughput in tickets per minute.
+    """
+    t0 = time.perf_counter()
+    out: asyncio.Queue = asyncio.Queue()
+    slots = asyncio.Semaphore(settings.resolve_batch_llm_concurrency)
+    tasks = set()
+
+    async def answer(idx: int, raw: Any, req: TicketRequest, snippets: List[Dict[str, Any]], q_vec, decision):
+        try:
+            with trace("resolve_ticket_trace", top_k=req.top_k, batch=True):
+                result = await _aanswer(req.ticket_text, snippets, q_vec, decision)
+            await out.put(_succeeded(idx, raw, result, decision))
+        except Exception as e:
+            logger.warning("resolve_tickets_item_failed", index=idx, error=str(e))
+            await out.put(_failed(idx, raw, str(e)))
+        finally:
+            slots.release()
+
+    async def start(idx: int, raw: Any, req: TicketRequest, snippets: List[Dict[str, Any]], q_vec, decision):
+        await slots.acquire()
+        task = asyncio.create_task(answer(idx, raw, req, snippets, q_vec, decision))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    async def run_wave(wave: List[Tuple[int, Any, TicketRequest]]):
+        texts = [req.ticket_text for _, _, req in wave]
+        todo = list(range(len(wave)))
+        cached: List[Tuple[int, TicketResponse]] = []
+        try:
+            with span("resolve", "retrieve"):
+                q_vecs = await aembed_texts(texts)
+                if answer_cache.semantic:
+                    for i in range(len(wave)):
+                        hit = answer_cache.get_similar(q_vecs[i])
+                        if hit is not None:
+                            cached.append((i, hit))
+                    hit_idx = {i for i, _ in cached}
+                    todo = [i for i in todo if i not in hit_idx]
+                hits = await asearch_merged_batch([texts[i] for i in todo], [wave[i][2].top_k for i in todo],
+                                                  alpha=0.7, q_vecs=q_vecs[todo])
+                hits = [_pack(h) for h in hits]
+        except Exception as e:
+            logger.exception("resolve_tickets_retrieval_failed", tickets=len(todo))
+            for i in todo:
+                await out.put(_failed(wave[i][0], wave[i][1], f"retrieval failed: {e}"))
+            hits = None
+        # cached answers need no retrieval: they go out even if the rest of the wave failed
+        for i, resp in cached:
+            await out.put(_succeeded(wave[i][0], wave[i][1], resp))
+        if hits is None:
+            return
+        with span("resolve", "action_rules"):
+            decisions = rule_engine.classify_many([texts[i] for i in todo], hits)
+        for i, snippets, decision in zip(todo, hits, decisions):
+            idx, raw, req = wave[i]
+            await start(idx, raw, req, snippets, q_vecs[i] if answer_cache.semantic else None, decision)
+
+    async def produce():
+        wave: List[Tuple[int, Any, TicketRequest]] = []
+        try:
+            async for idx, raw in items:
+                if isinstance(raw, Exception):
+                    await out.put(_failed(idx, None, str(raw)))
+                    continue
+                try:
+                    wave.append((idx, raw, _ticket(raw)))
+                except ValidationError as e:
+                    await out.put(_failed(idx, raw, validation_msg(e)))
+                    continue
+                if len(wave) >= settings.resolve_batch_size:
+                    await run_wave(wave)
+                    wave = []
+        except ValueError as e:
+            # the body could not be read any further (e.g. an oversized line); finish what was accepted
+            await out.put({"ok": False, "error": str(e)})
+        if wave:
+            await run_wave(wave)
+        while tasks:
+            await asyncio.gather(*list(tasks))
+
+    producer = asyncio.create_task(produce())
+    producer.add_done_callback(lambda _: out.put_nowait(None))
+    count = failed = 0
+    try:
+        while (item := await out.get()) is not None:
+            if "index" in item:
+                count += 1
+                failed += not item["ok"]
+            yield item
+        await producer  # re-raise an unexpected producer error
+    finally:
+        producer.cancel()
+        for task in list(tasks):
+            task.cancel()
+
+    seconds = time.perf_counter() - t0
+    summary = {"count": count, "succeeded": count - failed, "failed": failed, "seconds": round(seconds, 3),
+               "tickets_per_min": round(count * 60 / seconds, 1) if seconds > 0 else 0.0}
+    logger.info("resolve_tickets_done", **summary)
+    yield {"summary": summary}
@@ -1,4 +1,7 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+
+# Bump whenever SYSTEM, SCHEMA_HINT or build_user_prompt change; part of the answer cache key.
+PROMPT_VERSION = "2"
 
 SYSTEM = """You are a Tucows Domains Knowledge Assistant for support agents.
             Answer ONLY with grounded facts from the provided CONTEXT.
@@ -14,7 +17,8 @@ SCHEMA_HINT = """OUTPUT SCHEMA:
                 }
               """
 
-def build_user_prompt(ticket_text: str, snippets: List[Dict[str, Any]]) -> str:
+def build_user_prompt(ticket_text: str, snippets: List[Dict[str, Any]], action: Optional[str] = None) -> str:
+    """action: action_required already decided by a routing rule; the model only writes the answer."""
     lines = []
     lines.append("TICKET:\n" + ticket_text.strip())
     lines.append("\nCONTEXT:")
@@ -27,8 +31,11 @@ def build_user_prompt(ticket_text: str, snippets: List[Dict[str, Any]]) -> str:
     lines.append("INSTRUCTIONS:")
     lines.append("1) Use only CONTEXT to answer.")
     lines.append('2) Cite the most relevant 2–5 snippets in "references" using "title, section name and section number, id".')
-    lines.append("3) If steps depend on user verification/ownership, ask for it and choose action_required accordingly.")
-    lines.append("   If the ticket mentions a domain being suspended/suspension or policy enforcement, set action_required to escalate_to_abuse_team.")
+    if action:
+        lines.append(f"3) action_required is already decided: set it to {action}.")
+    else:
+        lines.append("3) If steps depend on user verification/ownership, ask for it and choose action_required accordingly.")
+        lines.append("   If the ticket mentions a domain being suspended/suspension or policy enforcement, set action_required to escalate_to_abuse_team.")
     lines.append("4) Output MUST be a single JSON object and match OUTPUT SCHEMA exactly.")
     return "\n".join(lines)
 
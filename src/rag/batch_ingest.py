@@ -0,0 +1,88 @@
+import asyncio
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+import structlog
+from pydantic import ValidationError
+
+from src.api.schemas import IngestItem, validation_msg
+from src.rag.embedding import aembed_texts
+from src.rag.file_ingest import _now_iso
+from src.rag.store import vector_store
+from src.utils.settings import settings
+from src.utils.tracing import span
+
+logger = structlog.get_logger()
+
+def item_payload(item: IngestItem) -> Dict[str, Any]:
+    """Qdrant payload of a pre-chunked item; a missing id gets a random one."""
+    payload = item.model_dump()
+    payload["id"] = item.id or str(uuid.uuid4())
+    payload["updated_at"] = _now_iso()
+    return payload
+
+async def _embed_and_upsert(batch: List[Tuple[int, Dict[str, Any]]], results: List[Dict[str, Any]]):
+    payloads = [p for _, p in batch]
+    try:
+        with span("ingest", "embed"):
+            vecs = await aembed_texts([p["text"] for p in payloads])
+        with span("ingest", "upsert"):
+            await asyncio.to_thread(vector_store.upsert_many, [p["id"] for p in payloads], vecs, payloads,
+                                    settings.ingest_batch_size)
+    except Exception as e:
+        logger.exception("ingest_batch_failed", items=len(batch))
+        results.extend({"index": i, "id": p["id"], "ok": False, "error": str(e)} for i, p in batch)
+        return
+    results.extend({"index": i, "id": p["id"], "ok": True} for i, p in batch)
+
+async def ingest_items(items: AsyncIterator[Tuple[int, Any]]) -> Dict[str, Any]:
+    """
+    Ingest a stream of (index, raw item) pairs, e.g. from iter_json_items.
+    Valid items are embedded ingest_batch_embed_size at a time and upserted in chunks of
+    ingest_batch_size points (one BM25 update per embedding batch). At most
+    ingest_embed_concurrency batches are in flight; reading the input waits for a free slot,
+    so memory stays bounded however long the stream is. Returns per-item status by index.
+    """
+    results: List[Dict[str, Any]] = []
+    slots = asyncio.Semaphore(settings.ingest_embed_concurrency)
+    tasks = set()
+    batch: List[Tuple[int, Dict[str, Any]]] = []
+    error = None
+
+    async def submit(part):
+        await slots.acquire()
+        task = asyncio.create_task(_embed_and_upsert(part, results))
+        task.add_done_callback(lambda _: slots.release())
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    try:
+        async for idx, raw in items:
+            if isinstance(raw, Exception):
+                results.append({"index": idx, "ok": False, "error": str(raw)})
+                continue
+            try:
+                payload = item_payload(IngestItem.model_validate(raw))
+            except ValidationError as e:
+                results.append({"index": idx, "ok": False, "error": validation_msg(e)})
+                continue
+            batch.append((idx, payload))
+            if len(batch) >= settings.ingest_batch_embed_size:
+                await submit(batch)
+                batch = []
+    except ValueError as e:
+        # the body could not be read any further (e.g. an oversized line); keep what was accepted
+        error = str(e)
+    if batch:
+        await submit(batch)
+    if tasks:
+        await asyncio.gather(*tasks)
+
+    results.sort(key=lambda r: r["index"])
+    failed = sum(not r["ok"] for r in results)
+    out = {"ok": failed == 0 and error is None, "count": len(results), "succeeded": len(results) - failed,
+           "failed": failed, "results": results}
+    if error:
+        out["error"] = error
+    logger.info("ingest_batch_done", count=len(results), failed=failed, error=error)
+    return out
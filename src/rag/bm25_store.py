@@ -1,43 +1,386 @@
+import json
+import math
+import os
 import re
-from typing import List, Tuple
-from rank_bm25 import BM25Okapi
+import shutil
+import threading
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
 
 _token = re.compile(r"[a-z0-9]+", re.I)
 
+# Bump when the on-disk layout or the tokenizer changes; older snapshots are then rebuilt.
+SNAPSHOT_VERSION = 2
+
+# payload fields search() can filter on (the same ones Qdrant keeps keyword indexes for)
+FILTER_FIELDS = ("product", "lang")
+
 def _tok(s: str) -> List[str]:
     return _token.findall(s.lower())
 
+def filter_fields(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """The FILTER_FIELDS values of a payload, as stored with each BM25 document."""
+    return {f: payload[f] for f in FILTER_FIELDS if payload.get(f) is not None}
+
 class BM25Store:
     """
-    A simple BM25-based text search store.
-    This class allows building a BM25 index from a list of (id, text) tuples,
-    adding new items, and searching for the top-k relevant documents based on a query.
+    A BM25 (Okapi) text search store backed by an inverted index.
+    Each term keeps a posting list of (doc index, term frequency) in compact arrays,
+    so adding a document only appends to the postings of its own terms, and a query
+    only scores the documents found in the postings of the query terms.
+    Scores match rank_bm25.BM25Okapi (same k1/b/epsilon and idf floor).
+
+    Postings live in two segments: a read-only CSR "base" segment loaded from a snapshot
+    (memory-mapped), and an in-memory "tail" that receives documents added since.
+
+    Deleted (or re-added) documents are tombstoned: they stop matching and leave the
+    document count and average length at once, and are dropped from the postings on save().
+
+    Every document also stores a small integer code per FILTER_FIELDS value, so search()
+    can drop postings of documents that do not match a filter before taking the top k.
+    Filters do not change idf or the average length: scores stay corpus-wide, as in Qdrant.
     """
-    def __init__(self):
+    def __init__(self, k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25):
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
         self.ids: List[str] = []
-        self.docs_tokens: List[List[str]] = []
-        self._bm25: BM25Okapi | None = None
+        # id -> doc index of live documents; tombstoned indices have _alive[idx] == 0
+        self._index: Dict[str, int] = {}
+        self._alive = bytearray()
+        self._doc_len = array("I")
+        self._total_len = 0  # over live documents
+        # per filter field: value of each code (0 = field missing), value -> code, code per doc
+        self._field_values: Dict[str, List[Any]] = {f: [None] for f in FILTER_FIELDS}
+        self._field_codes: Dict[str, Dict[Any, int]] = {f: {} for f in FILTER_FIELDS}
+        self._fields: Dict[str, array] = {f: array("I") for f in FILTER_FIELDS}
+        # base segment: term -> row, postings of row r are [offsets[r], offsets[r+1])
+        self._base_terms: Dict[str, int] = {}
+        self._base_offsets = np.zeros(1, dtype=np.int64)
+        self._base_docs = np.empty(0, dtype=np.uint32)
+        self._base_tfs = np.empty(0, dtype=np.uint32)
+        # tail segment: term -> (doc indices, term frequencies)
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        # document frequency -> number of terms with that df; used for the average idf
+        self._df_hist: Counter = Counter()
+        self._idf_floor: Optional[float] = None
+        # latest payload updated_at seen, used to reconcile a snapshot against Qdrant
+        self.watermark: Optional[str] = None
+        # extra fields of the last snapshot saved or loaded (see save(extra=...))
+        self.snapshot_meta: Dict = {}
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, _id: str) -> bool:
+        return _id in self._index
+
+    def doc_ids(self) -> List[str]:
+        """Ids of the live documents."""
+        with self._lock:
+            return list(self._index)
+
+    def build(self, items: Sequence[Tuple]):
+        # items: [(id, text), ...] or [(id, text, fields), ...]
+        with self._lock:
+            self._reset()
+            for _id, text, *fields in items:
+                self._append(_id, _tok(text), fields[0] if fields else None)
+
+    def add(self, _id: str, text: str, updated_at: Optional[str] = None, fields: Optional[Dict[str, Any]] = None):
+        """
+        Add a document; an existing document with the same id is replaced.
+        fields: its FILTER_FIELDS values, e.g. {"product": "domains", "lang": "en"}.
+        """
+        with self._lock:
+            self._append(_id, _tok(text), fields)
+            if updated_at and (self.watermark is None or updated_at > self.watermark):
+                self.watermark = updated_at
+
+    def delete(self, ids: List[str]) -> int:
+        """Tombstone documents by id; returns how many were present."""
+        n = 0
+        with self._lock:
+            for _id in ids:
+                idx = self._index.pop(_id, None)
+                if idx is not None:
+                    self._kill(idx)
+                    n += 1
+        return n
 
-    def build(self, items: List[Tuple[str, str]]):
-        # items: [(id, text), ...]
-        self.ids = [i for i, _ in items]
-        self.docs_tokens = [_tok(t) for _, t in items]
-        if self.docs_tokens:
-            self._bm25 = BM25Okapi(self.docs_tokens)
+    def _kill(self, idx: int):
+        self._alive[idx] = 0
+        self._total_len -= self._doc_len[idx]
+        self._idf_floor = None
 
-    def add(self, _id: str, text: str):
+    def _base_df(self, term: str) -> int:
+        row = self._base_terms.get(term)
+        if row is None:
+            return 0
+        return int(self._base_offsets[row + 1] - self._base_offsets[row])
+
+    def _code(self, field: str, value: Any) -> int:
+        codes = self._field_codes[field]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(self._field_values[field])
+            self._field_values[field].append(value)
+        return code
+
+    def _append(self, _id: str, tokens: List[str], fields: Optional[Dict[str, Any]] = None):
+        old = self._index.get(_id)
+        if old is not None:
+            self._kill(old)
+        idx = len(self.ids)
         self.ids.append(_id)
-        self.docs_tokens.append(_tok(text))
-        # Rebuild BM25 index, efficient for small datasets
-        self._bm25 = BM25Okapi(self.docs_tokens)
+        self._index[_id] = idx
+        self._alive.append(1)
+        self._doc_len.append(len(tokens))
+        for f, codes in self._fields.items():
+            value = fields.get(f) if fields else None
+            codes.append(0 if value is None else self._code(f, value))
+        self._total_len += len(tokens)
+        for term, tf in Counter(tokens).items():
+            p = self._postings.get(term)
+            if p is None:
+                p = self._postings[term] = (array("I"), array("I"))
+            df = self._base_df(term) + len(p[0])
+            if df:
+                self._df_hist[df] -= 1
+            p[0].append(idx)
+            p[1].append(tf)
+            self._df_hist[df + 1] += 1
+        # the idf floor depends on every term's idf, recompute lazily on next search
+        self._idf_floor = None
+
+    def _floor(self, n_docs: int) -> float:
+        """
+        epsilon * average idf over the vocabulary, as in BM25Okapi._calc_idf.
+        Computed from the df histogram, so the cost is the number of distinct df values.
+        Tombstoned documents still count in the histogram until the next save().
+        """
+        if self._idf_floor is None:
+            dfs = np.array([min(d, n_docs) for d, c in self._df_hist.items() if c > 0], dtype=np.float64)
+            counts = np.array([c for c in self._df_hist.values() if c > 0], dtype=np.float64)
+            if counts.sum() == 0:
+                self._idf_floor = 0.0
+            else:
+                idf = np.log(n_docs - dfs + 0.5) - np.log(dfs + 0.5)
+                self._idf_floor = self.epsilon * float((idf * counts).sum() / counts.sum())
+        return self._idf_floor
+
+    def _term_postings(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """(doc indices, term frequencies) of a term across both segments, as fresh arrays."""
+        docs, tfs = [], []
+        row = self._base_terms.get(term)
+        if row is not None:
+            s, e = self._base_offsets[row], self._base_offsets[row + 1]
+            docs.append(self._base_docs[s:e])
+            tfs.append(self._base_tfs[s:e])
+        tail = self._postings.get(term)
+        if tail is not None:
+            docs.append(np.frombuffer(tail[0], dtype=np.uint32))
+            tfs.append(np.frombuffer(tail[1], dtype=np.uint32))
+        if not docs:
+            return None
+        # concatenate copies, so no view outlives the lock on the tail buffers
+        return np.concatenate(docs), np.concatenate(tfs).astype(np.float64)
+
+    def _conditions(self, filters: Optional[Dict[str, Any]]) -> Optional[List[Tuple[np.ndarray, int]]]:
+        """
+        (per-document codes, required code) for each filter; None if a value is not in the index,
+        so nothing can match. Raises ValueError for a field that is not in FILTER_FIELDS.
+        """
+        conds = []
+        for f, value in (filters or {}).items():
+            if f not in self._fields:
+                raise ValueError(f"BM25 cannot filter on {f!r}; filterable fields: {', '.join(FILTER_FIELDS)}")
+            code = self._field_codes[f].get(value)
+            if code is None:
+                return None
+            conds.append((np.frombuffer(self._fields[f], dtype=np.uint32), code))
+        return conds
+
+    def _score(self, q_terms: Counter, conds: Sequence[Tuple[np.ndarray, int]] = ()) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score only the documents in the postings of the query terms that match every condition.
+        Returns (doc indices, scores) for documents with at least one query term.
+        Must be called with the lock held: the numpy views borrow the posting buffers.
+        """
+        n_docs = len(self._index)
+        avgdl = self._total_len / n_docs if n_docs else 0.0
+        if avgdl == 0:
+            return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.float64)
+        doc_len = np.frombuffer(self._doc_len, dtype=np.uint32)
+        alive = np.frombuffer(self._alive, dtype=np.bool_) if n_docs < len(self.ids) else None
+        k1, b = self.k1, self.b
+
+        doc_parts, score_parts = [], []
+        for term, qtf in q_terms.items():
+            p = self._term_postings(term)
+            if p is None:
+                continue
+            docs, tf = p
+            if alive is not None:
+                keep = alive[docs]
+                docs, tf = docs[keep], tf[keep]
+            df = len(docs)
+            if not df:
+                continue
+            idf = math.log(n_docs - df + 0.5) - math.log(df + 0.5)
+            if idf < 0:
+                idf = self._floor(n_docs)
+            if conds:
+                keep = np.ones(len(docs), dtype=np.bool_)
+                for codes, code in conds:
+                    keep &= codes[docs] == code
+                docs, tf = docs[keep], tf[keep]
+                if not len(docs):
+                    continue
+            norm = k1 * (1 - b + b * doc_len[docs] / avgdl)
+            doc_parts.append(docs)
+            score_parts.append(qtf * idf * (tf * (k1 + 1) / (tf + norm)))
 
-    def search(self, query: str, top_k: int = 10):
-        if not self._bm25 or not self.ids:
+        if not doc_parts:
+            return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.float64)
+        if len(doc_parts) == 1:
+            return doc_parts[0], score_parts[0]
+        # accumulate per document over the union of the postings
+        uniq, inv = np.unique(np.concatenate(doc_parts), return_inverse=True)
+        return uniq, np.bincount(inv, weights=np.concatenate(score_parts), minlength=len(uniq))
+
+    def search(self, query: str, top_k: int = 10, filters: Optional[Dict[str, Any]] = None):
+        """
+        Top documents for a query. filters: {field: value} over FILTER_FIELDS, all must match;
+        they are applied to the postings before ranking, so top_k counts matching documents only.
+        """
+        q = Counter(_tok(query))
+        if not q or top_k <= 0:
             return []
-        q = _tok(query)
-        scores = self._bm25.get_scores(q)
-        # Get top-k indices based on scores
-        idxs = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:top_k]
-        return [{"id": self.ids[i], "bm25": float(scores[i])} for i in idxs]
+        with self._lock:
+            if not self._index:
+                return []
+            conds = self._conditions(filters)
+            if conds is None:
+                return []
+            docs, scores = self._score(q, conds)
+            ids = self.ids
+            if len(docs) > top_k:
+                part = np.argpartition(-scores, top_k - 1)[:top_k]
+                docs, scores = docs[part], scores[part]
+            # highest score first, ties broken by insertion order
+            order = np.lexsort((docs, -scores))
+            return [{"id": ids[docs[i]], "bm25": float(scores[i])} for i in order]
+
+    def _meta(self) -> Dict:
+        return {
+            "version": SNAPSHOT_VERSION,
+            "token_pattern": _token.pattern,
+            "k1": self.k1,
+            "b": self.b,
+            "epsilon": self.epsilon,
+            "filter_fields": list(FILTER_FIELDS),
+        }
+
+    def save(self, path: str, extra: Optional[Dict] = None):
+        """
+        Write a snapshot: the tokenized corpus compacted into CSR arrays (.npy, memory-mappable)
+        plus the term dictionary, ids and index statistics. Written to a temp dir, then swapped in.
+        Tombstoned documents are dropped and the rest renumbered. `extra` is stored in meta.json
+        and comes back as snapshot_meta on load().
+        """
+        out = Path(path)
+        tmp = out.with_name(out.name + ".tmp")
+        with self._lock:
+            alive = np.frombuffer(self._alive, dtype=np.bool_)
+            # old doc index -> new doc index of the live documents
+            remap = (np.cumsum(alive) - 1).astype(np.uint32)
+            compact = len(self._index) < len(self.ids)
+            terms, docs_parts, tfs_parts, sizes = [], [], [], [0]
+            for term in sorted(set(self._base_terms) | set(self._postings)):
+                docs, tfs = self._term_postings(term)
+                if compact:
+                    keep = alive[docs]
+                    docs, tfs = remap[docs[keep]], tfs[keep]
+                    if not len(docs):
+                        continue
+                terms.append(term)
+                docs_parts.append(docs)
+                tfs_parts.append(tfs.astype(np.uint32))
+                sizes.append(len(docs))
+            offsets = np.cumsum(np.array(sizes, dtype=np.int64))
+            ids = [i for i, a in zip(self.ids, self._alive) if a] if compact else self.ids
+            doc_len = np.frombuffer(self._doc_len, dtype=np.uint32)[alive].copy()
+            fields = {f: np.frombuffer(c, dtype=np.uint32)[alive].copy() for f, c in self._fields.items()}
+            self.snapshot_meta = dict(extra or {})
+            meta = dict(self._meta(), count=len(ids), total_len=self._total_len, watermark=self.watermark,
+                        field_values=self._field_values, extra=self.snapshot_meta)
+            if tmp.exists():
+                shutil.rmtree(tmp)
+            tmp.mkdir(parents=True)
+            np.save(tmp / "offsets.npy", offsets)
+            np.save(tmp / "docs.npy", np.concatenate(docs_parts) if docs_parts else np.empty(0, np.uint32))
+            np.save(tmp / "tfs.npy", np.concatenate(tfs_parts) if tfs_parts else np.empty(0, np.uint32))
+            np.save(tmp / "doc_len.npy", doc_len)
+            for f, codes in fields.items():
+                np.save(tmp / f"field_{f}.npy", codes)
+            (tmp / "terms.json").write_text(json.dumps(terms))
+            (tmp / "ids.json").write_text(json.dumps(ids))
+            # meta last: a snapshot without meta.json is treated as missing
+            (tmp / "meta.json").write_text(json.dumps(meta))
+        if out.exists():
+            shutil.rmtree(out)
+        os.replace(tmp, out)
+
+    def load(self, path: str) -> bool:
+        """
+        Load a snapshot written by save(), memory-mapping the posting arrays.
+        Returns False (leaving the store untouched) if it is missing or incompatible.
+        """
+        src = Path(path)
+        try:
+            meta = json.loads((src / "meta.json").read_text())
+        except (OSError, ValueError):
+            return False
+        if any(meta.get(k) != v for k, v in self._meta().items()):
+            return False
+
+        terms = json.loads((src / "terms.json").read_text())
+        ids = json.loads((src / "ids.json").read_text())
+        offsets = np.load(src / "offsets.npy", mmap_mode="r")
+        doc_len = np.load(src / "doc_len.npy")
+        fields = {f: np.load(src / f"field_{f}.npy") for f in FILTER_FIELDS}
+        if len(ids) != meta["count"] or len(doc_len) != len(ids) or len(offsets) != len(terms) + 1:
+            return False
+        if any(len(codes) != len(ids) for codes in fields.values()):
+            return False
+
+        with self._lock:
+            self._reset()
+            self.ids = ids
+            self._index = {_id: i for i, _id in enumerate(ids)}
+            self._alive = bytearray(b"\x01") * len(ids)
+            self._doc_len = array("I", doc_len.astype(np.uint32).tobytes())
+            self._total_len = int(meta["total_len"])
+            self._field_values = {f: list(meta["field_values"][f]) for f in FILTER_FIELDS}
+            self._field_codes = {f: {v: c for c, v in enumerate(vals) if c} for f, vals in self._field_values.items()}
+            self._fields = {f: array("I", codes.astype(np.uint32).tobytes()) for f, codes in fields.items()}
+            self._base_terms = {t: i for i, t in enumerate(terms)}
+            self._base_offsets = offsets
+            self._base_docs = np.load(src / "docs.npy", mmap_mode="r")
+            self._base_tfs = np.load(src / "tfs.npy", mmap_mode="r")
+            dfs, counts = np.unique(np.diff(offsets), return_counts=True)
+            self._df_hist = Counter({int(d): int(c) for d, c in zip(dfs, counts)})
+            self.watermark = meta.get("watermark")
+            self.snapshot_meta = meta.get("extra") or {}
+        return True
 
 bm25_store = BM25Store()
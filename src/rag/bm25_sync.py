@@ -0,0 +1,251 @@
+import fcntl
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import orjson
+import structlog
+
+from src.rag.bm25_store import BM25Store, bm25_store
+from src.utils.metrics import BM25_SYNC_APPLIED, BM25_SYNC_COMPACTIONS
+from src.utils.settings import settings
+
+logger = structlog.get_logger()
+
+class BM25Sync:
+    """
+    Keeps the BM25 store of every worker process on one host in sync.
+
+    Shared state is the memory-mapped snapshot (bm25_snapshot_dir) plus an append-only change
+    log (NDJSON, one "add" or "del" entry per line). Writers append under an exclusive flock and
+    apply their own entries at once; every worker tails the log from a background thread, so
+    changes made by other workers are visible within bm25_sync_interval_s.
+
+    When the log grows past bm25_changelog_max_bytes the writer holding the lock compacts:
+    it saves a snapshot tagged with a fresh log id and starts a new log with that id. Workers
+    that see a new log id reload the snapshot (the page cache is shared) and tail the new log.
+
+    Until start() is called, changes are applied to the local store only.
+
+    Change listeners hear about the changes other workers made, with the affected ids as they
+    are applied, or with None when those are unknown (the snapshot was reloaded after another
+    worker's compaction), so per-process caches of the same points can drop stale entries.
+    """
+    def __init__(self, store: BM25Store):
+        self.store = store
+        self.enabled = False
+        self._tlock = threading.RLock()
+        self._depth = 0
+        self._lock_fd: Optional[int] = None
+        self._log_id: Optional[str] = None
+        self._offset = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # tags this process's log entries, so only other workers' changes reach the listeners
+        self._writer = uuid.uuid4().hex
+        self._change_listeners: List[Callable[[Optional[List[str]]], None]] = []
+
+    def add_change_listener(self, fn: Callable[[Optional[List[str]]], None]):
+        self._change_listeners.append(fn)
+
+    def _notify(self, ids: Optional[List[str]]):
+        for fn in self._change_listeners:
+            try:
+                fn(ids)
+            except Exception:
+                logger.exception("bm25_sync_listener_failed")
+
+    @property
+    def _log(self) -> Path:
+        return Path(settings.bm25_changelog_path)
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """Exclusive across threads and processes (re-entrant within the holding thread)."""
+        with self._tlock:
+            if self._depth == 0:
+                if self._lock_fd is None:
+                    self._lock_fd = os.open(str(self._log) + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    # ---- loading ----
+
+    def load(self) -> bool:
+        """
+        Load the snapshot and replay the log written since it; call with locked() held.
+        Returns False if there is no usable snapshot. If the log does not belong to the
+        snapshot (missing, or a crash between snapshot and log swap), compact() afterwards.
+        """
+        if not self.store.load(settings.bm25_snapshot_dir):
+            self._log_id = None
+            return False
+        self._log_id = self.store.snapshot_meta.get("log_id")
+        self._offset = self.store.snapshot_meta.get("log_offset", 0)
+        self.poll()
+        return True
+
+    @property
+    def in_sync(self) -> bool:
+        """True if the loaded snapshot and the current log belong together."""
+        return self._log_id is not None and self._log_id == self._read_header()[0]
+
+    def _read_header(self) -> Tuple[Optional[str], int]:
+        try:
+            with open(self._log, "rb") as f:
+                line = f.readline()
+        except OSError:
+            return None, 0
+        if not line.endswith(b"\n"):
+            return None, 0
+        return orjson.loads(line).get("log_id"), len(line)
+
+    # ---- tailing ----
+
+    def poll(self) -> int:
+        """Apply log entries written since the last poll; reloads the snapshot after a compaction."""
+        with self._tlock:
+            try:
+                f = open(self._log, "rb")
+            except OSError:
+                return 0
+            with f:
+                header = f.readline()
+                log_id = orjson.loads(header).get("log_id") if header.endswith(b"\n") else None
+                if log_id is None:
+                    return 0
+                if log_id != self._log_id:
+                    # compacted by another worker: the new snapshot includes everything before
+                    with self.locked():
+                        self.store.load(settings.bm25_snapshot_dir)
+                        self._log_id = self.store.snapshot_meta.get("log_id")
+                        self._offset = self.store.snapshot_meta.get("log_offset", 0)
+                        if not self.in_sync:
+                            # log and snapshot do not belong together (interrupted compaction)
+                            self.compact()
+                            self._notify(None)
+                            return 0
+                    self._notify(None)
+                    return self.poll()
+                f.seek(self._offset)
+                data = f.read()
+            end = data.rfind(b"\n") + 1  # a partially written last line is read next time
+            if end == 0:
+                return 0
+            n = self._apply(data[:end].splitlines())
+            self._offset += end
+            return n
+
+    def _apply(self, lines: Iterable[bytes]) -> int:
+        n = 0
+        changed: List[str] = []
+        for line in lines:
+            e = orjson.loads(line)
+            if e["op"] == "add":
+                self.store.add(e["id"], e["text"], updated_at=e.get("ts"), fields=e.get("f"))
+                ids = [e["id"]]
+            elif e["op"] == "del":
+                self.store.delete(e["ids"])
+                ids = e["ids"]
+            else:
+                ids = []
+            if e.get("w") != self._writer:
+                changed.extend(ids)
+            n += 1
+        BM25_SYNC_APPLIED.inc(n)
+        if changed:
+            self._notify(changed)
+        return n
+
+    def _run(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("bm25_sync_poll_failed")
+
+    def start(self, interval: Optional[float] = None):
+        """Route changes through the shared log and tail it in a background thread (once)."""
+        self.enabled = True
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval or settings.bm25_sync_interval_s,),
+                                        name="bm25-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.enabled = False
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    # ---- writing ----
+
+    def add_many(self, rows: List[Tuple[str, str, Optional[str], Optional[Dict[str, Any]]]]):
+        """rows: [(id, text, updated_at, filter fields), ...]; one log append for the whole batch."""
+        if not rows:
+            return
+        if not self.enabled:
+            for _id, text, ts, fields in rows:
+                self.store.add(_id, text, updated_at=ts, fields=fields)
+            return
+        self._append([{"op": "add", "id": _id, "text": text, "ts": ts, "f": fields, "w": self._writer}
+                      for _id, text, ts, fields in rows])
+
+    def delete(self, ids: List[str]):
+        if not ids:
+            return
+        if not self.enabled:
+            self.store.delete(ids)
+            return
+        self._append([{"op": "del", "ids": list(ids), "w": self._writer}])
+
+    def _append(self, entries: List[dict]):
+        data = b"".join(orjson.dumps(e) + b"\n" for e in entries)
+        with self.locked():
+            # catch up first (reloading after another worker's compaction), so local entries
+            # apply in log order; a missing log is started from the current store
+            self.poll()
+            if not self.in_sync:
+                self.compact()
+            fd = os.open(self._log, os.O_WRONLY | os.O_APPEND)
+            try:
+                os.write(fd, data)
+            finally:
+                os.close(fd)
+            self.poll()
+            if self._offset > settings.bm25_changelog_max_bytes:
+                self.compact()
+
+    def compact(self):
+        """Save the current store as a snapshot and start an empty log for it."""
+        with self.locked():
+            if self.in_sync:
+                self.poll()
+            log_id = uuid.uuid4().hex
+            header = orjson.dumps({"log_id": log_id}) + b"\n"
+            self.store.save(settings.bm25_snapshot_dir, extra={"log_id": log_id, "log_offset": len(header)})
+            tmp = self._log.with_name(self._log.name + ".tmp")
+            tmp.write_bytes(header)
+            os.replace(tmp, self._log)
+            # reload to drop tombstones and share the snapshot pages with the other workers
+            self.store.load(settings.bm25_snapshot_dir)
+            self._log_id, self._offset = log_id, len(header)
+            BM25_SYNC_COMPACTIONS.inc()
+            logger.info("bm25_compacted", count=len(self.store))
+
+bm25_sync = BM25Sync(bm25_store)
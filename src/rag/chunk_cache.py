@@ -0,0 +1,116 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from src.utils.settings import settings
+from src.utils.metrics import CHUNK_CACHE_HITS, CHUNK_CACHE_MISSES, CHUNK_CACHE_BYTES, CHUNK_CACHE_ENTRIES
+
+# rough bookkeeping cost per entry on top of the vector row and payload text
+_ENTRY_OVERHEAD = 512
+
+class ChunkCache:
+    """
+    In-process copy of chunk vectors and payloads keyed by point id.
+    Vectors are rows of one float32 (or float16) matrix; slots of evicted entries are reused.
+    Bounded by max_bytes (rows + approximate payload size), evicting least recently used.
+    """
+    def __init__(self, dim: int, max_bytes: int, dtype: str = "float32"):
+        self.dim = dim
+        self.max_bytes = max_bytes
+        self.dtype = np.dtype(dtype)
+        self._lock = threading.Lock()
+        self._mat = np.empty((0, dim), dtype=self.dtype)
+        self._slots: "OrderedDict[str, int]" = OrderedDict()
+        self._payloads: Dict[str, Dict[str, Any]] = {}
+        self._sizes: Dict[str, int] = {}
+        self._free: List[int] = []
+        self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    @property
+    def full(self) -> bool:
+        return self._bytes >= self.max_bytes
+
+    def _entry_bytes(self, payload: Dict[str, Any]) -> int:
+        return self.dim * self.dtype.itemsize + len(payload.get("text") or "") + _ENTRY_OVERHEAD
+
+    def _slot(self) -> int:
+        if self._free:
+            return self._free.pop()
+        n = len(self._slots)
+        if n >= len(self._mat):
+            grown = np.empty((max(64, 2 * len(self._mat)), self.dim), dtype=self.dtype)
+            grown[:len(self._mat)] = self._mat
+            self._mat = grown
+        return n
+
+    def _drop(self, pid: str):
+        self._free.append(self._slots.pop(pid))
+        self._payloads.pop(pid, None)
+        self._bytes -= self._sizes.pop(pid)
+
+    def put_many(self, ids: List[str], vectors: np.ndarray, payloads: List[Dict[str, Any]]):
+        with self._lock:
+            for pid, vec, payload in zip(ids, vectors, payloads):
+                if pid in self._slots:
+                    self._drop(pid)
+                slot = self._slot()
+                self._mat[slot] = vec
+                self._slots[pid] = slot
+                self._payloads[pid] = payload
+                self._sizes[pid] = self._entry_bytes(payload)
+                self._bytes += self._sizes[pid]
+            while self._bytes > self.max_bytes and self._slots:
+                self._drop(next(iter(self._slots)))
+            self._report()
+
+    def update_payloads(self, payloads: List[Dict[str, Any]]):
+        with self._lock:
+            for p in payloads:
+                if p["id"] in self._slots:
+                    self._payloads[p["id"]] = p
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            for pid in ids:
+                if pid in self._slots:
+                    self._drop(pid)
+            self._report()
+
+    def clear(self):
+        with self._lock:
+            self._slots.clear()
+            self._payloads.clear()
+            self._sizes.clear()
+            self._free.clear()
+            self._bytes = 0
+            self._report()
+
+    def get_many(self, ids: List[str]) -> Tuple[Dict[str, np.ndarray], Dict[str, Dict[str, Any]]]:
+        """(float32 vector by id, payload by id) for the ids present."""
+        vecs, payloads = {}, {}
+        with self._lock:
+            hit = [pid for pid in ids if pid in self._slots]
+            if hit:
+                rows = self._mat[[self._slots[pid] for pid in hit]].astype(np.float32)
+                for pid, row in zip(hit, rows):
+                    self._slots.move_to_end(pid)
+                    vecs[pid] = row
+                    payloads[pid] = self._payloads[pid]
+        CHUNK_CACHE_HITS.inc(len(vecs))
+        CHUNK_CACHE_MISSES.inc(len(ids) - len(vecs))
+        return vecs, payloads
+
+    def _report(self):
+        CHUNK_CACHE_BYTES.set(self._bytes)
+        CHUNK_CACHE_ENTRIES.set(len(self._slots))
+
+chunk_cache = ChunkCache(
+    dim=settings.embedding_dim,
+    max_bytes=settings.chunk_cache_max_bytes,
+    dtype=settings.chunk_cache_dtype,
+)
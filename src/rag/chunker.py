@@ -0,0 +1,146 @@
+import re
+from collections import deque
+from functools import lru_cache
+from typing import Deque, Dict, Iterable, Iterator, List, Tuple
+
+import structlog
+
+from src.utils.settings import settings
+
+logger = structlog.get_logger()
+
+# conservative stand-in for BPE when tiktoken (or its encoding files) is unavailable:
+# one token per punctuation run or digit triple, ~4 characters per token for words
+_PIECE = re.compile(r"[A-Za-z\u00c0-\uffff]+|\d{1,3}|[^\sA-Za-z\d\u00c0-\uffff]+")
+_SENTENCE_END = re.compile(r"(?<=[.!?;:])\s+")
+_WORD = re.compile(r"\S+")
+
+class _Estimator:
+    def encode(self, text: str) -> List[str]:
+        out = []
+        for piece in _PIECE.findall(text):
+            out.extend(piece[i:i + 4] for i in range(0, len(piece), 4))
+        return out
+
+@lru_cache(maxsize=1)
+def _encoding():
+    """The embedding model's BPE (tiktoken caches it on disk), or the estimator as a fallback."""
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(settings.embedding_model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:  # not installed, or the encoding file cannot be fetched
+        logger.warning("tokenizer_fallback", reason=str(e))
+        return _Estimator()
+
+@lru_cache(maxsize=65536)
+def count_tokens(text: str) -> int:
+    return len(_encoding().encode(text))
+
+def _split_tokens(text: str, max_tokens: int) -> List[str]:
+    """Hard split of a single unit that exceeds max_tokens on its own."""
+    enc = _encoding()
+    if isinstance(enc, _Estimator):
+        # split on words so the pieces stay readable; long words count as several tokens
+        parts, cur, n = [], [], 0
+        for word in text.split():
+            w = count_tokens(word)
+            if cur and n + w > max_tokens:
+                parts.append(" ".join(cur))
+                cur, n = [], 0
+            cur.append(word)
+            n += w
+        if cur:
+            parts.append(" ".join(cur))
+        return parts
+    toks = enc.encode(text)
+    return [enc.decode(toks[i:i + max_tokens]).strip() for i in range(0, len(toks), max_tokens)]
+
+def _tail(text: str, budget: int) -> Tuple[str, int]:
+    """
+    The end of a unit within budget tokens, as (text, tokens), cut from the original text:
+    starting at a sentence if that fills at least half the budget, else at a word, else (one
+    long word, e.g. a hard-split piece) at a token when the BPE is available.
+    """
+    def longest(starts: List[int]) -> str:
+        # the suffixes shrink as the start moves right: find the first one that fits
+        lo, hi = 0, len(starts)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if count_tokens(text[starts[mid]:]) <= budget:
+                hi = mid
+            else:
+                lo = mid + 1
+        return text[starts[lo]:] if lo < len(starts) else ""
+
+    tail = longest([m.end() for m in _SENTENCE_END.finditer(text)])
+    if count_tokens(tail) * 2 < budget:
+        tail = longest([m.start() for m in _WORD.finditer(text)])
+    enc = _encoding()
+    if count_tokens(tail) * 2 < budget and not isinstance(enc, _Estimator):
+        toks = enc.encode(text)
+        keep = budget
+        tail = enc.decode(toks[-keep:])
+        while keep > 0 and count_tokens(tail) > budget:  # decoding may re-tokenize differently
+            keep -= 1
+            tail = enc.decode(toks[-keep:]) if keep else ""
+    return tail, count_tokens(tail)
+
+def _units(paras: Iterable[str], limit: int) -> Iterable[Tuple[str, int]]:
+    """(text, tokens) per paragraph; paragraphs over limit are split at sentence boundaries."""
+    for p in paras:
+        n = count_tokens(p)
+        if n <= limit:
+            yield p, n
+            continue
+        for sent in _SENTENCE_END.split(p):
+            n = count_tokens(sent)
+            if n <= limit:
+                yield sent, n
+            else:
+                for part in _split_tokens(sent, limit):
+                    yield part, count_tokens(part)
+
+def iter_chunks(paras: Iterable[str], target_tokens: int = 400, overlap_tokens: int = 80) -> Iterator[str]:
+    """
+    Pack paragraphs into chunks of at most target_tokens model tokens, in one pass.
+    Consecutive chunks share up to overlap_tokens of text: the trailing paragraphs/sentences
+    that fit whole, then the end of the unit before them, cut at a sentence or word boundary.
+    Every unit enters and leaves the window once, so the cost is linear in the input;
+    paragraphs are consumed lazily and only the current window is held in memory.
+    """
+    target = max(1, min(target_tokens, settings.embedding_max_tokens))
+    overlap = max(0, min(overlap_tokens, target // 2))
+    window: Deque[Tuple[str, int]] = deque()
+    size = 0
+
+    # units leave room for the overlap, so every chunk can start with one
+    for text, n in _units(paras, target - overlap):
+        if window and size + n > target:
+            yield " ".join(t for t, _ in window)
+            # keep the longest tail within the overlap budget that leaves room for this unit
+            dropped = None
+            while window and (size > overlap or size + n > target):
+                dropped = window.popleft()
+                size -= dropped[1]
+            room = min(overlap, target - n) - size
+            if dropped is not None and room > 0:
+                tail, m = _tail(dropped[0], room)
+                if tail:
+                    window.appendleft((tail, m))
+                    size += m
+        window.append((text, n))
+        size += n
+    if window:
+        yield " ".join(t for t, _ in window)
+
+def chunk_paragraphs(paras: Iterable[str], target_tokens: int = 400, overlap_tokens: int = 80) -> List[str]:
+    return list(iter_chunks(paras, target_tokens, overlap_tokens))
+
+def chunk_params(product: str) -> Tuple[int, int]:
+    """(target, overlap) tokens for a product: CHUNK_PROFILES entry, else the defaults."""
+    prof: Dict[str, int] = settings.chunk_profiles.get(product, {})
+    return (prof.get("target", settings.chunk_target_tokens),
+            prof.get("overlap", settings.chunk_overlap_tokens))
@@ -0,0 +1,128 @@
+import re
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from src.rag.chunk_cache import chunk_cache
+from src.rag.chunker import count_tokens
+from src.utils.metrics import CONTEXT_TOKENS
+from src.utils.settings import settings
+
+_ANCHOR_NUM = re.compile(r"(\d+)$")
+
+def _anchor_num(payload: Dict[str, Any]) -> Optional[int]:
+    m = _ANCHOR_NUM.search(payload.get("anchor_id") or "")
+    return int(m.group(1)) if m else None
+
+def snippet_ids(sn: Dict[str, Any]) -> List[str]:
+    """Point ids behind a snippet: the merged chunks of a packed snippet, else its own id."""
+    return sn.get("ids") or [sn["id"]]
+
+def _join(a: str, b: str, adjacent: bool) -> Optional[str]:
+    """
+    a followed by b without the text they share: chunks of a section overlap by whole
+    paragraphs/sentences, so b's head repeats a's tail. None if b neither overlaps a nor follows it.
+    """
+    if b in a:
+        return a
+    if a in b:
+        return b
+    head = b[:32]
+    i = a.find(head)
+    while i != -1:  # the earliest match is the longest overlap
+        if (i == 0 or a[i - 1] == " ") and b.startswith(a[i:]):
+            return a[:i] + b
+        i = a.find(head, i + 1)
+    return f"{a} {b}" if adjacent else None
+
+def _merge(group: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Merge runs of overlapping or consecutive chunks of one doc section, in document order."""
+    group = sorted(group, key=lambda sn: (_anchor_num(sn["payload"]) is None, _anchor_num(sn["payload"]) or 0))
+    runs: List[List[Any]] = []  # [text, members, last anchor number]
+    for sn in group:
+        text = sn["payload"].get("text") or ""
+        num = _anchor_num(sn["payload"])
+        if runs:
+            last = runs[-1]
+            joined = _join(last[0], text, num is not None and last[2] is not None and num == last[2] + 1)
+            if joined is not None:
+                last[0], last[2] = joined, num
+                last[1].append(sn)
+                continue
+        runs.append([text, [sn], num])
+
+    out = []
+    for text, members, _ in runs:
+        if len(members) == 1:
+            out.append(members[0])
+            continue
+        best = max(members, key=lambda sn: sn.get("score_merged", 0.0))
+        out.append(dict(best, ids=[sn["id"] for sn in members], payload=dict(best["payload"], text=text)))
+    return out
+
+def _unit_vectors(units: List[Dict[str, Any]], vectors: Dict[str, np.ndarray]) -> np.ndarray:
+    """Normalized mean vector per unit (zeros when none of its chunks has a vector)."""
+    dim = len(next(iter(vectors.values()))) if vectors else 1
+    out = np.zeros((len(units), dim), dtype=np.float32)
+    for i, u in enumerate(units):
+        rows = [vectors[pid] for pid in snippet_ids(u) if pid in vectors]
+        if rows:
+            v = np.mean(rows, axis=0)
+            norm = np.linalg.norm(v)
+            out[i] = v / norm if norm else v
+    return out
+
+def _tokens(sn: Dict[str, Any]) -> int:
+    p = sn["payload"]
+    return count_tokens(p.get("text") or "") + count_tokens(f"{p.get('doc', '')} {p.get('section', '')}")
+
+def pack_context(snippets: List[Dict[str, Any]], budget_tokens: Optional[int] = None,
+                 mmr_lambda: Optional[float] = None, dup_threshold: Optional[float] = None,
+                 vectors: Optional[Dict[str, np.ndarray]] = None) -> List[Dict[str, Any]]:
+    """
+    Snippets for the prompt, from merged search hits (best first):
+    1. overlapping or consecutive chunks of the same doc_id/section are merged into one snippet,
+       which keeps its best chunk's id and score and lists every chunk id in "ids";
+    2. snippets are picked by MMR (relevance vs. cosine similarity to those already picked),
+       skipping near-duplicates (similarity >= dup_threshold) and snippets that no longer fit
+       budget_tokens; the best snippet is always kept.
+    Vectors come from the chunk cache unless given; snippets without one are never duplicates.
+    Defaults: CONTEXT_MAX_TOKENS (0 = no budget), CONTEXT_MMR_LAMBDA, CONTEXT_DUP_THRESHOLD.
+    """
+    if not snippets:
+        return []
+    budget = settings.context_max_tokens if budget_tokens is None else budget_tokens
+    lam = settings.context_mmr_lambda if mmr_lambda is None else mmr_lambda
+    dup = settings.context_dup_threshold if dup_threshold is None else dup_threshold
+
+    groups: Dict[Any, List[Dict[str, Any]]] = {}
+    for sn in snippets:
+        p = sn.get("payload") or {}
+        groups.setdefault((p.get("doc_id") or p.get("doc"), p.get("section")), []).append(sn)
+    units = [u for g in groups.values() for u in _merge(g)]
+
+    if vectors is None:
+        vectors, _ = chunk_cache.get_many([pid for u in units for pid in snippet_ids(u)])
+    vecs = _unit_vectors(units, vectors)
+    scores = np.array([u.get("score_merged", 0.0) for u in units], dtype=np.float64)
+    spread = scores.max() - scores.min()
+    rel = (scores - scores.min()) / spread if spread > 0 else np.ones(len(units))
+    tokens = [_tokens(u) for u in units]
+
+    picked: List[int] = []
+    max_sim = np.zeros(len(units))
+    todo = set(range(len(units)))
+    left = budget
+    while todo:
+        cand = sorted(todo)
+        i = cand[int(np.argmax(lam * rel[cand] - (1 - lam) * max_sim[cand]))]
+        todo.discard(i)
+        if picked and (max_sim[i] >= dup or (budget and tokens[i] > left)):
+            continue
+        picked.append(i)
+        left -= tokens[i]
+        max_sim = np.maximum(max_sim, vecs @ vecs[i])
+
+    CONTEXT_TOKENS.labels("retrieved").observe(sum(_tokens(sn) for sn in snippets))
+    CONTEXT_TOKENS.labels("packed").observe(sum(tokens[i] for i in picked))
+    return [units[i] for i in picked]
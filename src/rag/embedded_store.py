@@ -0,0 +1,516 @@
+import asyncio
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+import orjson
+import structlog
+
+from src.rag.bm25_store import FILTER_FIELDS, filter_fields
+from src.rag.chunk_cache import chunk_cache
+from src.rag.vector_store import VectorStore
+from src.utils.settings import settings
+
+logger = structlog.get_logger()
+
+_MIN_ROWS = 1024
+
+class EmbeddedStore(VectorStore):
+    """
+    In-process VectorStore persisted to a local directory, for collections that fit one box:
+      meta.json    vector size and dtype (float32, or float16 to halve the file)
+      vectors.bin  normalized vectors, one row per point, memory-mapped (grown by doubling)
+      points.log   NDJSON, one entry per write: {"id", "row", "payload"} or {"id", "del": 1}
+
+    Search is exact: cosine scores by blocked matmul over the mapped rows, with product/lang
+    filters as per-row value codes (other payload keys are matched row by row). With
+    EMBEDDED_HNSW_MIN_POINTS set and hnswlib installed, larger stores are searched through an
+    HNSW graph instead, built from the vectors on first use (it is not persisted).
+
+    Writers append under an exclusive flock on the directory; every call first replays entries
+    other processes appended, so several workers on one host share the store. The log is
+    compacted on open once most of its entries are superseded.
+    """
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = Path(path)
+        self.dim = settings.embedding_dim
+        self.dtype = np.dtype(settings.embedded_store_dtype)
+        self._tlock = threading.RLock()
+        self._lock_fd: Optional[int] = None
+        self._depth = 0
+        self._open = False
+        self._mat: Optional[np.memmap] = None
+        self._live = np.zeros(0, dtype=bool)
+        self._codes = {f: np.zeros(0, dtype=np.int32) for f in FILTER_FIELDS}
+        self._writes = 0  # bumped by every applied change, see search_batch
+        self._clear()
+
+    def _clear(self):
+        """Forget every point (the mapped matrix is kept); the log is replayed from the start."""
+        self._n = 0  # rows in use: every row below was assigned at some point
+        self._rows: Dict[str, int] = {}
+        self._ids: List[Optional[str]] = []
+        self._payloads: List[Optional[Dict[str, Any]]] = []
+        self._free: Set[int] = set()
+        self._values: Dict[str, Dict[str, int]] = {f: {} for f in FILTER_FIELDS}
+        self._live[:] = False
+        for codes in self._codes.values():
+            codes[:] = 0
+        self._offset = 0
+        self._inode: Optional[int] = None
+        self._entries = 0
+        self._writes += 1
+        self._graph = None
+        self._graph_deleted: Set[int] = set()
+        self._graph_unavailable = False
+
+    @property
+    def _log(self) -> Path:
+        return self.path / "points.log"
+
+    @property
+    def _vectors_file(self) -> Path:
+        return self.path / "vectors.bin"
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """Exclusive across threads and processes (re-entrant within the holding thread)."""
+        with self._tlock:
+            if self._depth == 0:
+                if self._lock_fd is None:
+                    self.path.mkdir(parents=True, exist_ok=True)
+                    self._lock_fd = os.open(str(self.path / "store.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    # ---- storage ----
+
+    def ensure_collection(self):
+        """
+        Open the store, creating it if missing. The dtype of an existing store is kept,
+        but its vector size must match EMBEDDING_DIM.
+        """
+        with self._tlock:
+            meta_path = self.path / "meta.json"
+            with self.locked():
+                if meta_path.exists():
+                    meta = json.loads(meta_path.read_text())
+                    if meta["dim"] != settings.embedding_dim:
+                        raise RuntimeError(f"embedded store {str(self.path)!r} has {meta['dim']}-d vectors, "
+                                           f"EMBEDDING_DIM is {settings.embedding_dim}")
+                else:
+                    meta = {"dim": settings.embedding_dim, "dtype": settings.embedded_store_dtype}
+                    meta_path.write_text(json.dumps(meta))
+                self.dim, self.dtype = meta["dim"], np.dtype(meta["dtype"])
+                self._mat = None
+                self._live = np.zeros(0, dtype=bool)
+                self._codes = {f: np.zeros(0, dtype=np.int32) for f in FILTER_FIELDS}
+                self._clear()
+                self._map(0)
+                self._poll()
+                if self._entries > 2 * len(self._rows) + _MIN_ROWS:
+                    self._compact()
+            self._open = True
+            logger.info("embedded_store_opened", path=str(self.path), points=len(self._rows), dtype=self.dtype.name)
+
+    def _ready(self):
+        if not self._open:
+            self.ensure_collection()
+
+    def _map(self, rows: int):
+        """Map vectors.bin with room for at least `rows` rows, growing the file if needed."""
+        row_bytes = self.dim * self.dtype.itemsize
+        f = self._vectors_file
+        capacity = f.stat().st_size // row_bytes if f.exists() else 0
+        if rows > capacity or capacity == 0:
+            capacity = max(_MIN_ROWS, 2 * capacity, rows)
+            with open(f, "ab") as fh:
+                fh.truncate(capacity * row_bytes)
+        if self._mat is not None and len(self._mat) == capacity:
+            return
+        self._mat = np.memmap(f, dtype=self.dtype, mode="r+", shape=(capacity, self.dim))
+        grow = capacity - len(self._live)
+        if grow > 0:
+            self._live = np.concatenate([self._live, np.zeros(grow, dtype=bool)])
+            self._codes = {k: np.concatenate([v, np.zeros(grow, dtype=np.int32)]) for k, v in self._codes.items()}
+        if self._graph is not None:
+            self._graph.resize_index(capacity)
+
+    def _poll(self):
+        """Apply log entries appended since the last call (all of them after a compaction)."""
+        with self._tlock:
+            try:
+                st = os.stat(self._log)
+            except FileNotFoundError:
+                return
+            if st.st_ino != self._inode:
+                if self._inode is not None:
+                    self._clear()
+                self._inode = st.st_ino
+            if st.st_size <= self._offset:
+                return
+            with open(self._log, "rb") as f:
+                f.seek(self._offset)
+                data = f.read()
+            end = data.rfind(b"\n") + 1  # a partially written last line is read next time
+            for line in data[:end].splitlines():
+                self._apply(orjson.loads(line))
+            self._offset += end
+
+    def _code(self, field: str, value: Any) -> int:
+        if value is None:
+            return 0
+        values = self._values[field]
+        if value not in values:
+            values[value] = len(values) + 1
+        return values[value]
+
+    def _apply(self, e: Dict[str, Any]):
+        self._entries += 1
+        self._writes += 1
+        pid = e["id"]
+        old = self._rows.get(pid)
+        if e.get("del"):
+            if old is not None:
+                self._free_row(old)
+            return
+        row = e["row"]
+        if old is not None and old != row:
+            self._free_row(old)
+        if row >= len(self._live):
+            self._map(row + 1)
+        while len(self._ids) <= row:
+            self._ids.append(None)
+            self._payloads.append(None)
+        self._n = max(self._n, row + 1)
+        self._free.discard(row)
+        self._rows[pid] = row
+        self._ids[row] = pid
+        self._payloads[row] = e["payload"]
+        self._live[row] = True
+        fields = filter_fields(e["payload"])
+        for f in FILTER_FIELDS:
+            self._codes[f][row] = self._code(f, fields.get(f))
+        if self._graph is not None and e.get("v", 1):
+            self._graph_add([row])
+
+    def _free_row(self, row: int):
+        self._rows.pop(self._ids[row], None)
+        self._ids[row] = None
+        self._payloads[row] = None
+        self._live[row] = False
+        for codes in self._codes.values():
+            codes[row] = 0
+        self._free.add(row)
+        if self._graph is not None and row not in self._graph_deleted:
+            self._graph.mark_deleted(row)
+            self._graph_deleted.add(row)
+
+    def _append(self, entries: List[Dict[str, Any]]):
+        """Append entries to the log and apply them; call with locked() held, after _poll()."""
+        if not entries:
+            return
+        data = b"".join(orjson.dumps(e) + b"\n" for e in entries)
+        fd = os.open(self._log, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+            if self._inode is None:
+                self._inode = os.fstat(fd).st_ino
+        finally:
+            os.close(fd)
+        for e in entries:
+            self._apply(e)
+        self._offset += len(data)
+
+    def _compact(self):
+        """Rewrite the log with one entry per live point; call with locked() held."""
+        tmp = self._log.with_name(self._log.name + ".tmp")
+        with open(tmp, "wb") as f:
+            for row in range(self._n):
+                if self._live[row]:
+                    f.write(orjson.dumps({"id": self._ids[row], "row": row, "payload": self._payloads[row]}) + b"\n")
+        entries = len(self._rows)
+        os.replace(tmp, self._log)
+        self._inode, self._offset = os.stat(self._log).st_ino, os.stat(self._log).st_size
+        self._entries = entries
+        logger.info("embedded_store_compacted", points=entries)
+
+    def drop(self):
+        """Delete every point and the store's files (ensure_collection creates it again)."""
+        with self._tlock:
+            with self.locked():
+                for name in ("points.log", "vectors.bin", "meta.json"):
+                    (self.path / name).unlink(missing_ok=True)
+                ids = list(self._rows)
+                self._mat = None
+                self._live = np.zeros(0, dtype=bool)
+                self._codes = {f: np.zeros(0, dtype=np.int32) for f in FILTER_FIELDS}
+                self._clear()
+                self._open = False
+        if ids:
+            self._deleted(ids)
+
+    def is_healthy(self) -> bool:
+        return self._open and self._vectors_file.exists()
+
+    # ---- writes ----
+
+    @staticmethod
+    def _normalized(vectors) -> np.ndarray:
+        x = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+        norms = np.linalg.norm(x, axis=1, keepdims=True)
+        return x / np.where(norms > 0, norms, 1.0)
+
+    def upsert(self, ids: List[str], vectors, payloads: List[Dict[str, Any]], wait: bool = True):
+        """Write vectors (normalized, as Qdrant does for cosine) and payloads; wait is implied."""
+        self._ready()
+        vecs = self._normalized(vectors)
+        with self.locked():
+            self._poll()
+            assigned: Dict[str, int] = {}
+            next_row = self._n
+            for pid in ids:
+                if pid in assigned:
+                    continue
+                if pid in self._rows:
+                    assigned[pid] = self._rows[pid]
+                elif self._free:
+                    assigned[pid] = self._free.pop()
+                else:
+                    assigned[pid] = next_row
+                    next_row += 1
+            rows = [assigned[pid] for pid in ids]
+            self._map(next_row)
+            self._mat[rows] = vecs.astype(self.dtype, copy=False)
+            self._mat.flush()  # vectors are on disk before the log entries that point at them
+            self._append([{"id": pid, "row": row, "payload": p} for pid, row, p in zip(ids, rows, payloads)])
+        self._written(ids, vecs, payloads)
+
+    def upsert_many(self, ids: List[str], vectors, payloads: List[Dict[str, Any]], chunk: int = 64, wait: bool = True):
+        """Same as upsert: one log append for the whole batch (chunk does not apply)."""
+        self.upsert(ids, vectors, payloads, wait=wait)
+
+    def overwrite_payloads(self, payloads: List[Dict[str, Any]], wait: bool = True):
+        self._ready()
+        with self.locked():
+            self._poll()
+            found = [p for p in payloads if p["id"] in self._rows]
+            self._append([{"id": p["id"], "row": self._rows[p["id"]], "payload": p, "v": 0} for p in found])
+        self._payloads_written(payloads)
+
+    def delete(self, ids: List[str], wait: bool = True):
+        self._ready()
+        with self.locked():
+            self._poll()
+            self._append([{"id": pid, "del": 1} for pid in dict.fromkeys(ids) if pid in self._rows])
+        self._deleted(ids)
+
+    # ---- search ----
+
+    def _mask(self, filters: Optional[Dict[str, Any]]) -> np.ndarray:
+        n = self._n
+        mask = self._live[:n].copy()
+        for key, value in (filters or {}).items():
+            if key in self._codes:
+                code = self._values[key].get(value)
+                if code is None:
+                    return np.zeros(n, dtype=bool)
+                mask &= self._codes[key][:n] == code
+            else:
+                mask &= np.fromiter((p is not None and p.get(key) == value for p in self._payloads[:n]),
+                                    dtype=bool, count=n)
+        return mask
+
+    def _exact(self, q: np.ndarray, k: int, mask: np.ndarray,
+               mat: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (rows, scores) of the k best masked rows per query, best first; blocks of
+        EMBEDDED_SEARCH_BLOCK_ROWS over the first len(mask) rows of mat (default: the mapped matrix).
+        """
+        m, n, block = len(q), len(mask), max(1, settings.embedded_search_block_rows)
+        mat = self._mat if mat is None else mat
+        best_r = np.empty((m, 0), dtype=np.int64)
+        best_s = np.empty((m, 0), dtype=np.float32)
+        for start in range(0, n, block):
+            stop = min(start + block, n)
+            keep = mask[start:stop]
+            if not keep.any():
+                continue
+            s = q @ np.asarray(mat[start:stop], dtype=np.float32).T
+            s[:, ~keep] = -np.inf
+            r = np.broadcast_to(np.arange(start, stop), s.shape)
+            s, r = np.concatenate([best_s, s], axis=1), np.concatenate([best_r, r], axis=1)
+            if s.shape[1] > k:
+                top = np.argpartition(-s, k - 1, axis=1)[:, :k]
+                s, r = np.take_along_axis(s, top, axis=1), np.take_along_axis(r, top, axis=1)
+            best_s, best_r = s, r
+        order = np.argsort(-best_s, axis=1, kind="stable")
+        return np.take_along_axis(best_r, order, axis=1), np.take_along_axis(best_s, order, axis=1)
+
+    def _hnsw(self):
+        """The HNSW graph once the store holds embedded_hnsw_min_points (built on first use), else None."""
+        if settings.embedded_hnsw_min_points is None or len(self._rows) < settings.embedded_hnsw_min_points:
+            return None
+        if self._graph is None:
+            if self._graph_unavailable:
+                return None
+            try:
+                import hnswlib
+            except ImportError as e:  # exact search it is
+                logger.warning("hnsw_unavailable", reason=str(e))
+                self._graph_unavailable = True
+                return None
+            graph = hnswlib.Index(space="ip", dim=self.dim)
+            graph.init_index(max_elements=len(self._live), ef_construction=200, M=settings.embedded_hnsw_m)
+            self._graph = graph
+            self._graph_add(np.flatnonzero(self._live[:self._n]))
+            logger.info("embedded_hnsw_built", points=len(self._rows))
+        return self._graph
+
+    def _graph_add(self, rows):
+        for start in range(0, len(rows), 4096):
+            part = rows[start:start + 4096]
+            for row in part:
+                if row in self._graph_deleted:
+                    self._graph.unmark_deleted(int(row))
+                    self._graph_deleted.discard(row)
+            self._graph.add_items(np.asarray(self._mat[part], dtype=np.float32), part)
+
+    def _graph_search(self, graph, q: np.ndarray, k: int, mask: np.ndarray,
+                      filtered: bool) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Graph neighbours; filtered searches oversample and fall back to exact if too few pass."""
+        want = min(len(self._rows), k * 4 if filtered else k)
+        graph.set_ef(max(settings.embedded_hnsw_ef, want))
+        labels, dist = graph.knn_query(q, k=want)
+        out = []
+        for i in range(len(q)):
+            keep = mask[labels[i]]
+            rows, scores = labels[i][keep][:k], 1.0 - dist[i][keep][:k]
+            if len(rows) < min(k, int(mask.sum())):
+                r, s = self._exact(q[i:i + 1], k, mask)
+                rows, scores = r[0], s[0]
+            out.append((rows, scores))
+        return out
+
+    def search_batch(self, query_vecs, top_ks: List[int],
+                     filters: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Hits per query vector, each with its own limit; one matmul per block for all queries.
+        Exact scoring runs outside the store lock, so concurrent searches overlap: it reads the
+        rows and filter mask as of the call, and scores again under the lock if a write was applied
+        meanwhile. Graph searches (about a millisecond) hold the lock, as hnswlib cannot query
+        while a write resizes the graph.
+        """
+        self._ready()
+        q = self._normalized(query_vecs)
+        k = max(top_ks, default=0)
+        with self._tlock:
+            self._poll()
+            if not self._rows or k <= 0:
+                return [[] for _ in top_ks]
+            mask = self._mask(filters)
+            graph = self._hnsw()
+            if graph is not None:
+                return self._hits(self._graph_search(graph, q, k, mask, bool(filters)), top_ks)
+            mat, writes = self._mat, self._writes
+        found = self._exact(q, k, mask, mat)
+        with self._tlock:
+            if self._writes != writes:
+                found = self._exact(q, k, self._mask(filters))
+            return self._hits(list(zip(*found)), top_ks)
+
+    def _hits(self, found: List[Tuple[np.ndarray, np.ndarray]], top_ks: List[int]) -> List[List[Dict[str, Any]]]:
+        return [[{"id": self._ids[r], "score": float(s), "payload": self._payloads[r]}
+                 for r, s in zip(rows[:limit], scores[:limit]) if s > -np.inf]
+                for (rows, scores), limit in zip(found, top_ks)]
+
+    def search(self, query_vec, top_k: int = 5, filters: Optional[Dict[str, Any]] = None):
+        return self.search_batch([query_vec], [top_k], filters)[0]
+
+    async def asearch(self, query_vec, top_k: int = 5, filters: Optional[Dict[str, Any]] = None):
+        return await asyncio.to_thread(self.search, query_vec, top_k, filters)
+
+    async def asearch_batch(self, query_vecs, top_ks: List[int],
+                            filters: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        return await asyncio.to_thread(self.search_batch, query_vecs, top_ks, filters)
+
+    # ---- reads ----
+
+    def count(self) -> int:
+        self._ready()
+        self._poll()
+        return len(self._rows)
+
+    def scroll_all_texts(self, batch: int = 512, updated_since: Optional[str] = None) -> List[Dict[str, Any]]:
+        self._ready()
+        out = []
+        with self._tlock:
+            self._poll()
+            for pid, payload in zip(self._ids, self._payloads):
+                if pid is None or not payload.get("text"):
+                    continue
+                if updated_since and (payload.get("updated_at") or "") < updated_since:
+                    continue
+                out.append({"id": payload.get("id") or pid, "text": payload["text"],
+                            "updated_at": payload.get("updated_at"), "fields": filter_fields(payload)})
+        return out
+
+    def scroll_text_ids(self, batch: int = 1024) -> List[str]:
+        self._ready()
+        with self._tlock:
+            self._poll()
+            return [payload.get("id") or pid for pid, payload in zip(self._ids, self._payloads)
+                    if pid is not None and payload.get("text")]
+
+    def warm_cache(self, batch: int = 256) -> int:
+        self._ready()
+        with self._tlock:
+            self._poll()
+            rows = np.flatnonzero(self._live[:self._n])
+            n = 0
+            for start in range(0, len(rows), batch):
+                if chunk_cache.full:
+                    break
+                part = rows[start:start + batch]
+                chunk_cache.put_many([self._ids[r] for r in part], np.asarray(self._mat[part], dtype=np.float32),
+                                     [self._payloads[r] for r in part])
+                n += len(part)
+        return n
+
+    def get_points_by_ids(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        self._ready()
+        with self._tlock:
+            self._poll()
+            found = [(pid, self._rows[pid]) for pid in ids if pid in self._rows]
+            if not found:
+                return {}
+            mat = np.asarray(self._mat[[row for _, row in found]], dtype=np.float32)
+            return {pid: {"vector": vec, "payload": self._payloads[row]} for (pid, row), vec in zip(found, mat)}
+
+    async def aget_points_by_ids(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        # takes the store locks and polls the log: off the event loop, like asearch
+        return await asyncio.to_thread(self.get_points_by_ids, ids)
+
+    def get_vectors_by_ids(self, ids: List[str]) -> Dict[str, np.ndarray]:
+        return {pid: p["vector"] for pid, p in self.get_points_by_ids(ids).items()}
+
+    async def aget_vectors_by_ids(self, ids: List[str]) -> Dict[str, np.ndarray]:
+        return await asyncio.to_thread(self.get_vectors_by_ids, ids)
+
+    async def aclose(self):
+        with self._tlock:
+            if self._lock_fd is not None:
+                os.close(self._lock_fd)
+                self._lock_fd = None
@@ -1,11 +1,121 @@
+import asyncio
+import base64
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
 import numpy as np
-from openai import OpenAI
-from typing import List
+from typing import Dict, List, Optional, Set, Tuple
+from src.utils.clients import openai_client, aopenai_client
 from src.utils.settings import settings
+from src.utils.metrics import (
+    EMBED_CACHE_HITS, EMBED_CACHE_MISSES, EMBED_CACHE_EVICTIONS, EMBED_CACHE_BYTES,
+    EMBED_BATCH_SIZE, EMBED_QUEUE_WAIT, EMBED_BATCH_ERRORS,
+)
 
+# rough per-entry bookkeeping cost (key, tuple, OrderedDict node) on top of the vector bytes
+_ENTRY_OVERHEAD = 200
 
-# Initialize OpenAI client
-client = OpenAI(api_key=settings.openai_api_key)
+# full output size per model; a smaller EMBEDDING_DIM asks the API for shortened vectors
+_NATIVE_DIMS = {"text-embedding-3-small": 1536, "text-embedding-3-large": 3072, "text-embedding-ada-002": 1536}
+
+def _create_kwargs() -> Dict[str, object]:
+    kwargs: Dict[str, object] = {"model": settings.embedding_model, "encoding_format": "base64"}
+    if settings.embedding_dim != _NATIVE_DIMS.get(settings.embedding_model, settings.embedding_dim):
+        kwargs["dimensions"] = settings.embedding_dim
+    return kwargs
+
+def _cache_model() -> str:
+    """Cache namespace: shortened vectors must not collide with full-size ones."""
+    kw = _create_kwargs()
+    return f"{kw['model']}@{kw['dimensions']}" if "dimensions" in kw else settings.embedding_model
+
+def _normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache keyed by sha256(model, normalized text).
+    Memory tier: LRU with TTL and a byte budget. Disk tier (optional): SQLite table of
+    float32 rows, consulted on memory misses and never expired (embeddings are
+    deterministic per model).
+    """
+    def __init__(self, max_bytes: int, ttl_s: float, path: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._mem: "OrderedDict[str, Tuple[float, np.ndarray]]" = OrderedDict()
+        self._bytes = 0
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vec BLOB NOT NULL)")
+            self._db.commit()
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def _put_mem(self, key: str, vec: np.ndarray):
+        old = self._mem.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1].nbytes + _ENTRY_OVERHEAD
+        self._mem[key] = (time.monotonic() + self.ttl_s, vec)
+        self._bytes += vec.nbytes + _ENTRY_OVERHEAD
+        while self._bytes > self.max_bytes and self._mem:
+            _, (_, ev) = self._mem.popitem(last=False)
+            self._bytes -= ev.nbytes + _ENTRY_OVERHEAD
+            EMBED_CACHE_EVICTIONS.labels(reason="size").inc()
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        now = time.monotonic()
+        with self._lock:
+            for k in keys:
+                hit = self._mem.get(k)
+                if hit is None:
+                    continue
+                if hit[0] < now:
+                    del self._mem[k]
+                    self._bytes -= hit[1].nbytes + _ENTRY_OVERHEAD
+                    EMBED_CACHE_EVICTIONS.labels(reason="ttl").inc()
+                    continue
+                self._mem.move_to_end(k)
+                found[k] = hit[1]
+            EMBED_CACHE_HITS.labels(tier="memory").inc(len(found))
+
+            rest = [k for k in keys if k not in found]
+            for i in range(0, len(rest) if self._db is not None else 0, 500):
+                part = rest[i:i + 500]
+                marks = ",".join("?" * len(part))
+                rows = self._db.execute(f"SELECT key, vec FROM embeddings WHERE key IN ({marks})", part).fetchall()
+                for k, blob in rows:
+                    vec = np.frombuffer(blob, dtype=np.float32)
+                    found[k] = vec
+                    self._put_mem(k, vec)
+                EMBED_CACHE_HITS.labels(tier="disk").inc(len(rows))
+            EMBED_CACHE_BYTES.set(self._bytes)
+        return found
+
+    def put_many(self, items: List[Tuple[str, np.ndarray]]):
+        with self._lock:
+            for k, vec in items:
+                self._put_mem(k, vec)
+            if self._db is not None and items:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vec) VALUES (?, ?)",
+                    [(k, vec.astype(np.float32).tobytes()) for k, vec in items],
+                )
+                self._db.commit()
+            EMBED_CACHE_BYTES.set(self._bytes)
+
+embedding_cache = EmbeddingCache(
+    max_bytes=settings.embedding_cache_max_bytes,
+    ttl_s=settings.embedding_cache_ttl_s,
+    path=settings.embedding_cache_path,
+)
 
 def _l2_normalize(vec: np.ndarray) -> np.ndarray:
     norm = np.linalg.norm(vec)
@@ -13,18 +123,169 @@ def _l2_normalize(vec: np.ndarray) -> np.ndarray:
         return vec
     return vec / norm
 
-def embed_texts(texts: List[str]) -> np.ndarray:
-    """
-    batch embedding texts using OpenAI's API.
-    """
-    res = client.embeddings.create(
-        model=settings.embedding_model,
-        input=texts,
-        encoding_format="float"
-    )
-    arr = np.array([d.embedding for d in res.data], dtype=np.float32)
+def _to_matrix(res) -> np.ndarray:
+    # base64 rows decode straight into float32, skipping per-float JSON/pydantic parsing
+    arr = np.stack([np.frombuffer(base64.b64decode(d.embedding), dtype=np.float32) for d in res.data])
     # Normalize the embeddings
     norms = np.linalg.norm(arr, axis=1, keepdims=True)
     norms[norms == 0] = 1.0
     arr = arr / norms
     return arr
+
+def _lookup(texts: List[str]) -> Tuple[List[str], Dict[str, np.ndarray], Dict[str, str]]:
+    """
+    Returns (keys per text, cached vectors by key, texts still to embed by key).
+    """
+    norm = [_normalize_text(t) for t in texts]
+    model = _cache_model()
+    keys = [embedding_cache.key(model, t) for t in norm]
+    found = embedding_cache.get_many(keys)
+    missing: Dict[str, str] = {}
+    for k, t in zip(keys, norm):
+        if k not in found:
+            missing.setdefault(k, t)
+    EMBED_CACHE_MISSES.inc(len(missing))
+    return keys, found, missing
+
+def _store(found: Dict[str, np.ndarray], missing: Dict[str, str], arr: np.ndarray):
+    fresh = list(zip(missing.keys(), arr))
+    embedding_cache.put_many(fresh)
+    found.update(fresh)
+
+def embed_texts(texts: List[str]) -> np.ndarray:
+    """
+    batch embedding texts using OpenAI's API; texts already in the embedding cache are not sent.
+    """
+    keys, found, missing = _lookup(texts)
+    if missing:
+        res = openai_client().embeddings.create(input=list(missing.values()), **_create_kwargs())
+        _store(found, missing, _to_matrix(res))
+    return np.stack([found[k] for k in keys])
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent single-text embedding requests into one API call.
+    Requests wait in a bounded queue (callers block when it is full); a collector task
+    sends a batch once window_ms has passed since its first request or max_size is reached,
+    with at most max_inflight batches outstanding and a per-batch timeout.
+    Rows are already L2-normalized when they are handed back. close() lets batches already sent
+    finish and fails the requests that were not.
+    """
+    def __init__(self, window_ms: float, max_size: int, max_queue: int, max_inflight: int, timeout_s: float):
+        self.window_s = window_ms / 1000
+        self.max_size = max_size
+        self.max_queue = max_queue
+        self.max_inflight = max_inflight
+        self.timeout_s = timeout_s
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._inflight: Optional[asyncio.Semaphore] = None
+        self._task: Optional[asyncio.Task] = None
+        # futures of requests not yet handed to a batch (queued, or waiting to be put)
+        self._waiting: Set[asyncio.Future] = set()
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            # (re)bind to the current event loop, e.g. after a restart in tests/benchmarks
+            self._loop = loop
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._inflight = asyncio.Semaphore(self.max_inflight)
+            self._task = loop.create_task(self._collect())
+
+    async def submit(self, text: str) -> np.ndarray:
+        self._ensure_started()
+        fut = self._loop.create_future()
+        self._waiting.add(fut)
+        try:
+            await self._queue.put((text, fut, time.monotonic()))
+            return await fut
+        finally:
+            self._waiting.discard(fut)
+
+    async def close(self):
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        queue, failed = self._queue, set(self._waiting)
+        for fut in failed:
+            if not fut.done():
+                fut.set_exception(RuntimeError("embedding batcher closed"))
+        # callers blocked on a full queue only see the failure once their put goes through
+        while failed & self._waiting:
+            while not queue.empty():
+                queue.get_nowait()
+            await asyncio.sleep(0)
+        # wait for the batches in flight: every permit back
+        for _ in range(self.max_inflight):
+            await self._inflight.acquire()
+        for _ in range(self.max_inflight):
+            self._inflight.release()
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window_s
+            while len(batch) < self.max_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._inflight.acquire()
+            self._waiting.difference_update(fut for _, fut, _ in batch)
+            loop.create_task(self._flush(batch))
+
+    async def _flush(self, batch: List[Tuple[str, asyncio.Future, float]]):
+        try:
+            now = time.monotonic()
+            for _, _, t in batch:
+                EMBED_QUEUE_WAIT.observe(now - t)
+            texts = list(dict.fromkeys(t for t, _, _ in batch))
+            EMBED_BATCH_SIZE.observe(len(texts))
+            try:
+                res = await asyncio.wait_for(
+                    aopenai_client().embeddings.create(input=texts, **_create_kwargs()),
+                    self.timeout_s,
+                )
+                rows = dict(zip(texts, _to_matrix(res)))
+            except Exception as e:
+                EMBED_BATCH_ERRORS.inc()
+                for _, fut, _ in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                return
+            for text, fut, _ in batch:
+                if not fut.done():
+                    fut.set_result(rows[text])
+        finally:
+            self._inflight.release()
+
+embedding_batcher = EmbeddingBatcher(
+    window_ms=settings.embedding_batch_window_ms,
+    max_size=settings.embedding_batch_max_size,
+    max_queue=settings.embedding_batch_max_queue,
+    max_inflight=settings.embedding_batch_max_inflight,
+    timeout_s=settings.embedding_batch_timeout_s,
+)
+
+async def aembed_texts(texts: List[str]) -> np.ndarray:
+    """
+    Async variant of embed_texts. A single uncached text goes through the micro-batcher,
+    so concurrent queries share one API call.
+    """
+    keys, found, missing = _lookup(texts)
+    if len(missing) == 1 and embedding_batcher.window_s > 0:
+        _store(found, missing, np.stack([await embedding_batcher.submit(next(iter(missing.values())))]))
+    elif missing:
+        res = await aopenai_client().embeddings.create(input=list(missing.values()), **_create_kwargs())
+        _store(found, missing, _to_matrix(res))
+    return np.stack([found[k] for k in keys])
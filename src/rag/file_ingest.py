@@ -1,137 +1,499 @@
-import os, uuid, re, time
+import os, uuid, re, time, queue, threading, hashlib, json
+from concurrent.futures import Executor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import List, Dict, Any, Iterable, Tuple
-from bs4 import BeautifulSoup
-from pdfminer.high_level import extract_text as pdf_extract_text
+from itertools import groupby
+from typing import List, Dict, Any, Iterable, Iterator, Tuple, Optional
+import structlog
+from lxml import etree
+from pdfminer.high_level import extract_pages as pdf_extract_pages
+from pdfminer.layout import LTTextContainer
 
+from src.rag.chunker import chunk_params, iter_chunks
 from src.rag.embedding import embed_texts
-from src.rag.qdrant_store import qdrant_store
+from src.rag.store import vector_store
+from src.rag.ingest_manifest import ingest_manifest
 from src.utils.settings import settings
+from src.utils.metrics import INGEST_STAGE_ITEMS, STAGE_LATENCY
+from src.utils.tracing import span
 
+logger = structlog.get_logger()
+
+_SUPPORTED = (".md", ".txt", ".html", ".htm", ".pdf")
+# namespace for deterministic point ids: uuid5(source path + chunk hash)
+_ID_NS = uuid.UUID("6f1c1b1e-3d5a-4e8e-9a57-2b7d8c0f4e21")
 _HEADING = re.compile(r"^(#{1,6})\s+(.*)$")
 _WS = re.compile(r"\s+")
 
-def _read_text_from_file(path: Path) -> str:
+_SKIP_TAGS = {"script", "style", "noscript", "template"}
+_HEADING_TAGS = {f"h{i}": i for i in range(1, 7)}
+# elements whose remaining text (after nested blocks were emitted) forms one paragraph
+_BLOCK_TAGS = {"p", "li", "pre", "blockquote", "td", "th", "dd", "dt", "caption", "figcaption", "title",
+               "div", "section", "article", "main", "header", "footer", "aside", "nav", "body"}
+
+def _iter_html_lines(path: Path) -> Iterator[str]:
+    """
+    Incremental HTML extraction with lxml.iterparse: each block element becomes a paragraph and
+    each h1-h6 a markdown heading, emitted when the element closes and then freed, so memory
+    stays bounded by the largest block rather than the document.
+    """
+    for _, el in etree.iterparse(str(path), events=("end",), html=True, recover=True, huge_tree=True):
+        tag = el.tag if isinstance(el.tag, str) else ""
+        if tag in _SKIP_TAGS:
+            el.clear(keep_tail=True)
+            continue
+        if tag not in _HEADING_TAGS and tag not in _BLOCK_TAGS:
+            continue
+        text = _WS.sub(" ", "".join(el.itertext())).strip()
+        if text:
+            yield f"{'#' * _HEADING_TAGS[tag]} {text}" if tag in _HEADING_TAGS else text
+            yield ""
+        # free the emitted element; its tail still belongs to the parent's text
+        el.clear(keep_tail=True)
+        if el.tail:
+            el.tail = " " + el.tail
+        # and the processed siblings before it, unless their tail text is still pending
+        parent = el.getparent()
+        if parent is not None:
+            prev = el.getprevious()
+            while prev is not None and not (prev.tail or "").strip() and prev is parent[0]:
+                del parent[0]
+                prev = el.getprevious()
+
+def _iter_pdf_lines(path: Path) -> Iterator[str]:
+    """Page by page with pdfminer's extract_pages; text boxes become paragraphs."""
+    for page in pdf_extract_pages(str(path)):
+        for element in page:
+            if isinstance(element, LTTextContainer):
+                yield from element.get_text().splitlines()
+                yield ""
+
+def _iter_lines(path: Path) -> Iterator[str]:
+    """Lines of a supported file, extracted lazily (one page / HTML block at a time)."""
     suf = path.suffix.lower()
     if suf in [".md", ".txt"]:
-        return path.read_text(encoding="utf-8", errors="ignore")
+        with open(path, encoding="utf-8", errors="ignore") as f:
+            for ln in f:
+                yield ln.rstrip("\n")
+        return
     if suf in [".html", ".htm"]:
-        html = path.read_text(encoding="utf-8", errors="ignore")
-        soup = BeautifulSoup(html, "lxml")
-        # keep visible text only
-        for tag in soup(["script", "style", "noscript"]):
-            tag.extract()
-        return _WS.sub(" ", soup.get_text("\n")).strip()
+        yield from _iter_html_lines(path)
+        return
     if suf == ".pdf":
-        return pdf_extract_text(str(path)) or ""
+        yield from _iter_pdf_lines(path)
+        return
     raise ValueError(f"Unsupported file type: {suf}")
 
+def _read_text_from_file(path: Path) -> str:
+    return "\n".join(_iter_lines(path))
+
+def _iter_paragraphs(lines: Iterable[str]) -> Iterator[Tuple[int, str, str]]:
+    """
+    (section number, section title, paragraph) from a stream of lines.
+    Markdown-style headings start sections; blank lines separate paragraphs.
+    Only the current paragraph is buffered.
+    """
+    sec, title = 0, "INTRO"
+    buf: List[str] = []
+    headings: List[str] = []
+    emitted = False
+    for ln in lines:
+        stripped = ln.strip()
+        m = _HEADING.match(stripped)
+        if m or not stripped:
+            if buf:
+                yield sec, title, "\n".join(buf).strip()
+                buf, emitted = [], True
+            if m:
+                sec, title = sec + 1, m.group(2).strip()
+                headings.append(stripped)
+            continue
+        buf.append(ln)
+    if buf:
+        yield sec, title, "\n".join(buf).strip()
+    elif not emitted:
+        # headings only: keep them as the body
+        for h in headings:
+            yield 0, "BODY", h
+
 def _split_into_sections(text: str) -> List[Tuple[str, List[str]]]:
     """
     Return list of (section_title, paragraphs[])
     Markdown-style headings win; fallback to blank-line paragraphs.
     """
-    lines = text.splitlines()
-    sections: List[Tuple[str, List[str]]] = []
-    cur_title = "INTRO"
-    cur_buf: List[str] = []
+    return [(title, [p for _, _, p in group])
+            for (_, title), group in groupby(_iter_paragraphs(text.splitlines()), key=lambda x: x[:2])]
 
-    def flush():
-        nonlocal cur_title, cur_buf, sections
-        if cur_buf:
-            paras = [p.strip() for p in "\n".join(cur_buf).split("\n\n") if p.strip()]
-            sections.append((cur_title, paras))
-            cur_buf = []
+def _now_iso() -> str:
+    # microseconds: BM25 reconcile re-indexes rows strictly newer than its watermark, so a rewrite
+    # in the same second as the snapshot must still sort after it
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
 
-    for ln in lines:
-        m = _HEADING.match(ln.strip())
-        if m:
-            flush()
-            cur_title = m.group(2).strip()
-        else:
-            cur_buf.append(ln)
-    flush()
-    if not sections:
-        paras = [p.strip() for p in text.split("\n\n") if p.strip()]
-        sections.append(("BODY", paras))
-    return sections
-
-def _chunk_paragraphs(paras: List[str], target_tokens: int = 400, overlap_tokens: int = 80) -> List[str]:
-    """
-    Very simple token-ish chunker by words length; good enough for now.
-    """
-    chunks = []
-    buf, count = [], 0
-    for p in paras:
-        w = p.split()
-        if count + len(w) > target_tokens and buf:
-            chunks.append(" ".join(buf))
-            # overlap
-            back = " ".join(" ".join(buf).split()[-overlap_tokens:])
-            buf, count = ([back] if back else []), len(back.split())
-        buf.append(p)
-        count += len(w)
-    if buf:
-        chunks.append(" ".join(buf))
-    return chunks
+def _sha256_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
 
-def _now_iso() -> str:
-    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+def _payload_hash(p: Dict[str, Any]) -> str:
+    # everything that ends up in Qdrant except the timestamp
+    meta = {k: v for k, v in p.items() if k != "updated_at"}
+    return hashlib.sha1(json.dumps(meta, sort_keys=True).encode("utf-8")).hexdigest()
 
-def build_payloads_from_file(file_path: Path, product: str = "domains", lang: str = "en") -> List[Dict[str, Any]]:
-    text = _read_text_from_file(file_path)
-    sections = _split_into_sections(text)
+def iter_payloads_from_file(file_path: Path, product: str = "domains", lang: str = "en",
+                            source: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Chunk a file into payloads with deterministic ids: doc_id from the source path,
+    point id from the source path plus the chunk's content hash.
+    source overrides the file's resolved path as its identity (e.g. for uploads in temp dirs).
+    Extraction, sectioning and chunking are streamed, so payloads come out while the
+    file is still being read.
+    """
+    source = source or str(file_path.resolve())
     doc_title = file_path.stem
-    doc_id = f"{doc_title}-{uuid.uuid4().hex[:8]}"
+    doc_id = f"{doc_title}-{hashlib.sha1(source.encode('utf-8')).hexdigest()[:8]}"
 
-    payloads: List[Dict[str, Any]] = []
     para_counter = 1
+    seen: Dict[str, int] = {}
+    target, overlap = chunk_params(product)
 
-    for section_title, paras in sections:
-        for chunk in _chunk_paragraphs(paras):
+    for (_, section_title), group in groupby(_iter_paragraphs(_iter_lines(file_path)), key=lambda x: x[:2]):
+        for chunk in iter_chunks((p for _, _, p in group), target, overlap):
             anchor_id = f"para-{para_counter:04d}"
-            payloads.append({
+            chunk_hash = hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+            # identical chunks within one file get distinct ids
+            dup = seen.get(chunk_hash, 0)
+            seen[chunk_hash] = dup + 1
+            yield {
+                "id": str(uuid.uuid5(_ID_NS, f"{source}\n{chunk_hash}\n{dup}")),
                 "ref_id": f"{doc_id}-{anchor_id}",
                 "doc": doc_title,
                 "doc_id": doc_id,
                 "section": section_title,
                 "anchor_id": anchor_id,
                 "text": chunk,
+                "chunk_hash": chunk_hash,
                 "product": product,
                 "lang": lang,
-                "source_path": str(file_path),
+                "source_path": source,
                 "updated_at": _now_iso(),
-            })
+            }
             para_counter += 1
-    return payloads
 
-def ingest_file(file_path: Path, product: str = "domains", lang: str = "en", batch: int = 64) -> Dict[str, Any]:
-    payloads = build_payloads_from_file(file_path, product=product, lang=lang)
-    if not payloads:
+def build_payloads_from_file(file_path: Path, product: str = "domains", lang: str = "en",
+                             source: Optional[str] = None) -> List[Dict[str, Any]]:
+    return list(iter_payloads_from_file(file_path, product, lang, source))
+
+def _plan(file_path: Path, file_sha: str, payloads: List[Dict[str, Any]], product: str, lang: str,
+          source: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Diff freshly built payloads against the manifest entry of the file:
+    new ids need embedding, known ids whose payload changed (e.g. shifted anchors) only need
+    a payload overwrite, and ids no longer produced by the file are deleted.
+    """
+    source = source or str(file_path.resolve())
+    old = (ingest_manifest.get(source) or {}).get("chunks", {})
+    chunks = {p["id"]: _payload_hash(p) for p in payloads}
+    return {
+        "source": source,
+        "new": [p for p in payloads if p["id"] not in old],
+        "updates": [p for p in payloads if p["id"] in old and old[p["id"]] != chunks[p["id"]]],
+        "removed": [pid for pid in old if pid not in chunks],
+        "entry": _entry(file_path, file_sha, product, lang, payloads[0]["doc_id"], chunks),
+    }
+
+def _entry(file_path: Path, file_sha: str, product: str, lang: str, doc_id: str,
+           chunks: Dict[str, str]) -> Dict[str, Any]:
+    st = file_path.stat()
+    return {"mtime": st.st_mtime_ns, "size": st.st_size, "sha256": file_sha, "product": product,
+            "lang": lang, "doc_id": doc_id, "chunks": chunks}
+
+def _apply_plan(plan: Dict[str, Any]):
+    """Payload overwrites and deletions; call once the new chunks are upserted."""
+    if plan["updates"]:
+        vector_store.overwrite_payloads(plan["updates"])
+    if plan["removed"]:
+        vector_store.delete(plan["removed"])
+    ingest_manifest.record(plan["source"], plan["entry"])
+
+def _result(file: str, plan: Dict[str, Any]) -> Dict[str, Any]:
+    return {"ok": True, "file": file, "doc_id": plan["entry"]["doc_id"], "chunks": len(plan["entry"]["chunks"]),
+            "embedded": len(plan["new"]), "deleted": len(plan["removed"])}
+
+def _skipped(file: str, entry: Dict[str, Any]) -> Dict[str, Any]:
+    return {"ok": True, "file": file, "doc_id": entry["doc_id"], "chunks": len(entry["chunks"]), "skipped": True}
+
+def _same_content(file_path: Path, file_sha: str, product: str, lang: str,
+                  source: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Manifest entry if only the file's mtime changed; the entry's stat is refreshed."""
+    source = source or str(file_path.resolve())
+    entry = ingest_manifest.get(source)
+    if entry and entry["sha256"] == file_sha and entry["product"] == product and entry["lang"] == lang:
+        st = file_path.stat()
+        ingest_manifest.record(source, dict(entry, mtime=st.st_mtime_ns, size=st.st_size))
+        return entry
+    return None
+
+def ingest_file(file_path: Path, product: str = "domains", lang: str = "en", batch: int = 64,
+                source: Optional[str] = None, pool: Optional[Executor] = None) -> Dict[str, Any]:
+    """
+    Incrementally ingest one file: unchanged files are skipped, and only chunks whose
+    text changed since the last ingest are embedded; chunks removed from the file are deleted.
+    source: identity of the file when its path is not stable (uploads); such files are
+    compared by content hash only. pool: executor to parse the file in (e.g. a process pool).
+    """
+    entry = ingest_manifest.unchanged(file_path, product, lang) if source is None else None
+    if entry is None:
+        file_sha = _sha256_file(file_path)
+        entry = _same_content(file_path, file_sha, product, lang, source)
+    if entry is not None:
+        ingest_manifest.save()
+        return _skipped(str(file_path), entry)
+
+    if pool is None:
+        # streamed: new chunks are embedded while the rest of the file is still being parsed
+        payloads: Iterable[Dict[str, Any]] = iter_payloads_from_file(file_path, product, lang, source)
+    else:
+        with span("ingest", "parse"):
+            payloads = pool.submit(build_payloads_from_file, file_path, product, lang, source).result()
+
+    upserted: List[str] = []
+
+    def flush(part: List[Dict[str, Any]]):
+        with span("ingest", "embed"):
+            vecs = embed_texts([p["text"] for p in part])
+        with span("ingest", "upsert"):
+            vector_store.upsert(ids=[p["id"] for p in part], vectors=vecs, payloads=part)
+        upserted.extend(p["id"] for p in part)
+
+    # diff against the manifest on the fly; only ids and hashes are kept for the whole file
+    source_id = source or str(file_path.resolve())
+    old = (ingest_manifest.get(source_id) or {}).get("chunks", {})
+    chunks: Dict[str, str] = {}
+    new: List[str] = []
+    updates: List[Dict[str, Any]] = []
+    part: List[Dict[str, Any]] = []
+    doc_id = None
+    try:
+        for p in payloads:
+            doc_id = doc_id or p["doc_id"]
+            h = chunks[p["id"]] = _payload_hash(p)
+            if p["id"] not in old:
+                new.append(p["id"])
+                part.append(p)
+                if len(part) >= batch:
+                    flush(part)
+                    part = []
+            elif old[p["id"]] != h:
+                updates.append(p)
+        if part:
+            flush(part)
+    except Exception:
+        # a parse/embed failure part way through: no manifest entry points at the chunks
+        # upserted so far, so remove them; the previous version of the file stays as it was
+        if upserted:
+            try:
+                vector_store.delete(upserted)
+            except Exception:
+                logger.exception("ingest_cleanup_failed", file=str(file_path), points=len(upserted))
+        raise
+    if not chunks:
         return {"ok": False, "reason": "no_chunks", "file": str(file_path)}
 
-    ids = [str(uuid.uuid4()) for _ in payloads]
+    plan = {"source": source_id, "new": new, "updates": updates,
+            "removed": [pid for pid in old if pid not in chunks],
+            "entry": _entry(file_path, file_sha, product, lang, doc_id, chunks)}
+    _apply_plan(plan)
+    ingest_manifest.save()
+
+    return _result(str(file_path), plan)
+
+
+def _parse_file(path: Path, product: str, lang: str,
+                known_sha: Optional[str]) -> Tuple[Optional[List[Dict[str, Any]]], str, float]:
+    """
+    Hash, parse + chunk one file; runs in a worker process.
+    Returns (payloads, file sha256, seconds); payloads is None when the hash equals known_sha.
+    """
+    t0 = time.perf_counter()
+    file_sha = _sha256_file(path)
+    if file_sha == known_sha:
+        return None, file_sha, time.perf_counter() - t0
+    payloads = build_payloads_from_file(path, product=product, lang=lang)
+    return payloads, file_sha, time.perf_counter() - t0
 
-    for i, p in enumerate(payloads):
-        p["id"] = ids[i]
-        p["ref_id"] = f"{p['doc_id']}-{p['anchor_id']}"
+class _StageStats:
+    def __init__(self, stage: str):
+        self._seconds = STAGE_LATENCY.labels("ingest", stage)
+        self._items = INGEST_STAGE_ITEMS.labels(stage)
+        self.items = 0
+        self.busy_s = 0.0
+        self._lock = threading.Lock()
 
-    texts = [p["text"] for p in payloads]
-    total = len(texts)
-    for i in range(0, total, batch):
-        vecs = embed_texts(texts[i:i+batch])
-        qdrant_store.upsert(ids=ids[i:i+batch], vectors=vecs, payloads=payloads[i:i+batch])
+    def record(self, items: int, seconds: float):
+        with self._lock:
+            self.items += items
+            self.busy_s += seconds
+        self._seconds.observe(seconds)
+        self._items.inc(items)
 
-    return {"ok": True, "file": str(file_path), "doc_id": payloads[0]["doc_id"], "chunks": len(payloads)}
+    def report(self, wall_s: float) -> Dict[str, Any]:
+        return {"items": self.items, "busy_s": round(self.busy_s, 3),
+                "per_s": round(self.items / wall_s, 2) if wall_s else 0.0}
 
+_DONE = object()
 
-def ingest_folder(folder: Path, product: str = "domains", lang: str = "en") -> List[Dict[str, Any]]:
-    supported = (".md",".txt",".html",".htm",".pdf")
-    results = []
-    for path in folder.rglob("*"):
-        if path.is_file() and path.suffix.lower() in supported:
+def ingest_folder(folder: Path, product: str = "domains", lang: str = "en",
+                  stats: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    Ingest every supported file under folder with a staged pipeline:
+    parse/chunk in a process pool -> embed with N concurrent batches -> upsert in parallel (wait=False).
+    Stages are connected by bounded queues. Returns one result dict per file (same shape as
+    ingest_file), then one per file ingested from the folder earlier that is gone now (its chunks
+    are deleted, "removed": True); per-stage throughput is logged and written into `stats` if given.
+    """
+    paths = sorted(p for p in folder.rglob("*") if p.is_file() and p.suffix.lower() in _SUPPORTED)
+    results: Dict[str, Dict[str, Any]] = {}
+    plans: Dict[str, Dict[str, Any]] = {}
+    pending: Dict[str, int] = {}  # file -> batches not yet upserted
+    lock = threading.Lock()
+    embed_q: queue.Queue = queue.Queue(maxsize=settings.ingest_queue_size)
+    upsert_q: queue.Queue = queue.Queue(maxsize=settings.ingest_queue_size)
+    st = {k: _StageStats(k) for k in ("parse", "embed", "upsert")}
+
+    def fail(file: str, e: Exception):
+        with lock:
+            pending.pop(file, None)
+            results[file] = {"ok": False, "file": file, "error": str(e)}
+
+    def finish(file: str):
+        try:
+            _apply_plan(plans[file])
+        except Exception as e:
+            fail(file, e)
+            return
+        results[file] = _result(file, plans[file])
+
+    def embed_worker():
+        while (item := embed_q.get()) is not _DONE:
+            file, part = item
+            if file not in pending:
+                continue  # an earlier batch of this file failed
+            t = time.perf_counter()
             try:
-                results.append(ingest_file(path, product=product, lang=lang))
+                vecs = embed_texts([p["text"] for p in part])
             except Exception as e:
-                results.append({"ok": False, "file": str(path), "error": str(e)})
-    return results
+                fail(file, e)
+                continue
+            st["embed"].record(len(part), time.perf_counter() - t)
+            upsert_q.put((file, part, vecs))
+
+    def upsert_worker():
+        while (item := upsert_q.get()) is not _DONE:
+            file, part, vecs = item
+            if file not in pending:
+                continue
+            t = time.perf_counter()
+            try:
+                vector_store.upsert(ids=[p["id"] for p in part], vectors=vecs, payloads=part, wait=False)
+            except Exception as e:
+                fail(file, e)
+                continue
+            st["upsert"].record(len(part), time.perf_counter() - t)
+            with lock:
+                done = file in pending and pending[file] == 1
+                if file in pending:
+                    pending[file] -= 1
+                    if done:
+                        del pending[file]
+            if done:
+                finish(file)
+
+    embedders = [threading.Thread(target=embed_worker, daemon=True) for _ in range(settings.ingest_embed_concurrency)]
+    upserters = [threading.Thread(target=upsert_worker, daemon=True) for _ in range(settings.ingest_upsert_concurrency)]
+    for th in embedders + upserters:
+        th.start()
+
+    t0 = time.perf_counter()
+    batch = settings.ingest_batch_size
+    with ProcessPoolExecutor(max_workers=settings.ingest_parse_workers or None) as pool:
+        todo = iter(paths)
+        inflight: Dict[Any, Path] = {}
+        while True:
+            # keep a bounded window of files being parsed
+            while len(inflight) < settings.ingest_queue_size:
+                path = next(todo, None)
+                if path is None:
+                    break
+                entry = ingest_manifest.unchanged(path, product, lang)
+                if entry is not None:
+                    results[str(path)] = _skipped(str(path), entry)
+                    continue
+                known = ingest_manifest.get(str(path.resolve())) or {}
+                known_sha = known.get("sha256") if (known.get("product"), known.get("lang")) == (product, lang) else None
+                inflight[pool.submit(_parse_file, path, product, lang, known_sha)] = path
+            if not inflight:
+                break
+            done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+            for fut in done:
+                path = inflight.pop(fut)
+                file = str(path)
+                try:
+                    payloads, file_sha, secs = fut.result()
+                    st["parse"].record(1, secs)
+                    if payloads is None:
+                        results[file] = _skipped(file, _same_content(path, file_sha, product, lang))
+                        continue
+                    if not payloads:
+                        results[file] = {"ok": False, "reason": "no_chunks", "file": file}
+                        continue
+                    plan = plans[file] = _plan(path, file_sha, payloads, product, lang)
+                except Exception as e:
+                    fail(file, e)
+                    continue
+                new = plan["new"]
+                if not new:
+                    finish(file)
+                    continue
+                with lock:
+                    pending[file] = (len(new) + batch - 1) // batch
+                for i in range(0, len(new), batch):
+                    embed_q.put((file, new[i:i + batch]))
+
+    for _ in embedders:
+        embed_q.put(_DONE)
+    for th in embedders:
+        th.join()
+    for _ in upserters:
+        upsert_q.put(_DONE)
+    for th in upserters:
+        th.join()
+
+    removed = _remove_missing(folder, paths)
+    ingest_manifest.save()
+    wall = time.perf_counter() - t0
+    report = {"files": len(paths), "removed": len(removed), "wall_s": round(wall, 3),
+              **{k: v.report(wall) for k, v in st.items()}}
+    logger.info("ingest_folder_done", folder=str(folder), **report)
+    if stats is not None:
+        stats.update(report)
+    return [results[str(p)] for p in paths] + removed
+
+def _remove_missing(folder: Path, paths: List[Path]) -> List[Dict[str, Any]]:
+    """Delete the chunks of files ingested from under folder that are no longer there."""
+    root, seen = folder.resolve(), {str(p.resolve()) for p in paths}
+    out = []
+    for source in ingest_manifest.sources():
+        if source in seen or root not in Path(source).parents:
+            continue
+        entry = ingest_manifest.get(source)
+        try:
+            vector_store.delete(list(entry["chunks"]))
+        except Exception as e:
+            out.append({"ok": False, "file": source, "error": str(e)})
+            continue
+        ingest_manifest.forget(source)
+        out.append({"ok": True, "file": source, "doc_id": entry["doc_id"], "deleted": len(entry["chunks"]),
+                    "removed": True})
+    return out
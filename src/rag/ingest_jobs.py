@@ -0,0 +1,124 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import structlog
+
+from src.rag.file_ingest import ingest_file, _now_iso
+from src.utils.settings import settings
+
+logger = structlog.get_logger()
+
+def upload_source(name: str, product: str, lang: str, content_sha: str, source_id: Optional[str] = None) -> str:
+    """
+    Manifest identity (and point id namespace) of an uploaded file.
+    Replacing a document requires a source_id: a re-upload under the same source_id replaces the
+    previous version (chunks it no longer has are deleted). Without one, uploads are keyed by
+    product, lang, name and content hash: identical re-uploads are skipped, but an upload with
+    changed content is a new document and the chunks of the earlier upload are kept.
+    """
+    if source_id:
+        return f"upload:{source_id}"
+    return f"upload:{product}/{lang}/{name}#{content_sha[:16]}"
+
+class IngestJobs:
+    """
+    Runs file ingestion off the event loop: each file is parsed in a process pool (so PDF
+    parsing does not hold the API process's GIL) and embedded/upserted from a thread pool.
+    Background jobs record their status as JSON files in jobs_dir, so any worker process
+    can answer a status query; finished jobs are removed after ingest_job_ttl_s.
+    """
+    def __init__(self, jobs_dir: str, workers: int, ttl_s: float):
+        self.jobs_dir = Path(jobs_dir)
+        self.workers = workers
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._procs: Optional[ProcessPoolExecutor] = None
+
+    def _pools(self):
+        with self._lock:
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ingest-job")
+                self._procs = ProcessPoolExecutor(max_workers=self.workers)
+            return self._threads, self._procs
+
+    def new_upload_path(self, filename: str) -> Path:
+        """Unique temp location keeping the original file name (its stem becomes the doc title)."""
+        name = Path(filename or "upload").name
+        return Path(tempfile.mkdtemp(prefix="ingest-", dir=settings.ingest_upload_dir)) / name
+
+    def _ingest(self, path: Path, product: str, lang: str, source: str) -> Dict[str, Any]:
+        _, procs = self._pools()
+        try:
+            return ingest_file(path, product=product, lang=lang, source=source, pool=procs)
+        finally:
+            shutil.rmtree(path.parent, ignore_errors=True)
+
+    def run(self, path: Path, product: str, lang: str, source: str) -> Future:
+        """Ingest an uploaded file in the worker pool; the file's temp dir is removed afterwards."""
+        threads, _ = self._pools()
+        return threads.submit(self._ingest, path, product, lang, source)
+
+    def submit(self, path: Path, product: str, lang: str, source: str) -> Dict[str, Any]:
+        """Start a background job and return its initial status."""
+        self._prune()
+        job = {"job_id": uuid.uuid4().hex, "status": "queued", "file": path.name, "bytes": path.stat().st_size,
+               "created_at": _now_iso()}
+        self._write(job)
+        threads, _ = self._pools()
+        threads.submit(self._run_job, job, path, product, lang, source)
+        return job
+
+    def _run_job(self, job: Dict[str, Any], path: Path, product: str, lang: str, source: str):
+        self._write(dict(job, status="running", started_at=_now_iso()))
+        t0 = time.perf_counter()
+        try:
+            result = self._ingest(path, product, lang, source)
+            job = dict(job, status="done" if result.get("ok") else "failed", result=result)
+        except Exception as e:
+            logger.exception("ingest_job_failed", job_id=job["job_id"], file=job["file"])
+            job = dict(job, status="failed", error=str(e))
+        self._write(dict(job, finished_at=_now_iso(), seconds=round(time.perf_counter() - t0, 3)))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if not job_id.isalnum():
+            return None
+        try:
+            return json.loads((self.jobs_dir / f"{job_id}.json").read_text())
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, job: Dict[str, Any]):
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        out = self.jobs_dir / f"{job['job_id']}.json"
+        tmp = out.with_name(out.name + ".tmp")
+        tmp.write_text(json.dumps(job))
+        os.replace(tmp, out)
+
+    def _prune(self):
+        if not self.jobs_dir.exists():
+            return
+        cutoff = time.time() - self.ttl_s
+        for p in self.jobs_dir.glob("*.json"):
+            try:
+                if p.stat().st_mtime < cutoff:
+                    p.unlink()
+            except OSError:
+                pass
+
+    def close(self):
+        with self._lock:
+            for pool in (self._threads, self._procs):
+                if pool is not None:
+                    pool.shutdown(wait=False, cancel_futures=True)
+            self._threads = self._procs = None
+
+ingest_jobs = IngestJobs(settings.ingest_jobs_dir, settings.ingest_job_workers, settings.ingest_job_ttl_s)
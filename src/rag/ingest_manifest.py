@@ -0,0 +1,62 @@
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from src.utils.settings import settings
+
+class IngestManifest:
+    """
+    Local record of ingested files: per source path its mtime/size/sha256, product/lang,
+    doc_id and the point ids of its chunks (with a hash of each chunk's payload).
+    Lets re-ingest skip unchanged files, embed only new chunks and delete removed ones
+    (and the chunks of files that are gone, see ingest_folder).
+    """
+    VERSION = 1
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._files: Dict[str, Dict[str, Any]] = {}
+        try:
+            data = json.loads(self.path.read_text())
+            if data.get("version") == self.VERSION:
+                self._files = data.get("files", {})
+        except (OSError, ValueError):
+            pass
+
+    def get(self, source: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._files.get(source)
+
+    def unchanged(self, path: Path, product: str, lang: str) -> Optional[Dict[str, Any]]:
+        """The manifest entry if the file's mtime and size (and product/lang) match it, else None."""
+        entry = self.get(str(path.resolve()))
+        if entry is None or entry.get("product") != product or entry.get("lang") != lang:
+            return None
+        st = path.stat()
+        if entry.get("mtime") == st.st_mtime_ns and entry.get("size") == st.st_size:
+            return entry
+        return None
+
+    def sources(self) -> List[str]:
+        with self._lock:
+            return list(self._files)
+
+    def record(self, source: str, entry: Dict[str, Any]):
+        with self._lock:
+            self._files[source] = entry
+
+    def forget(self, source: str):
+        with self._lock:
+            self._files.pop(source, None)
+
+    def save(self):
+        with self._lock:
+            data = json.dumps({"version": self.VERSION, "files": self._files})
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(data)
+        os.replace(tmp, self.path)
+
+ingest_manifest = IngestManifest(settings.ingest_manifest_path)
@@ -1,33 +1,64 @@
-from typing import Dict, Any, List, Optional
+import asyncio
+from itertools import chain
+from typing import Dict, Any, List, Optional, Callable, Sequence, Tuple
 import numpy as np
 
-from src.rag.embedding import embed_texts
-from src.rag.qdrant_store import qdrant_store
+from src.rag.embedding import embed_texts, aembed_texts
+from src.rag.store import vector_store
 from src.rag.bm25_store import bm25_store
+from src.rag.chunk_cache import chunk_cache
+from src.rag.warmup import warmup
+from src.utils.metrics import RETRIEVAL_CANDIDATES, SEARCH_DEGRADED
+from src.utils.tracing import span, trace
 
-def _minmax_norm(values: List[float]) -> List[float]:
-    if not values:
-        return values
-    vmin, vmax = min(values), max(values)
-    if vmax == vmin:
-        return [1.0 for _ in values]
-    return [(v - vmin) / (vmax - vmin) for v in values]
+def _minmax(x: np.ndarray) -> np.ndarray:
+    if x.size == 0:
+        return x
+    lo, hi = x.min(), x.max()
+    if hi == lo:
+        return np.ones_like(x)
+    return (x - lo) / (hi - lo)
 
-def search_merged(query: str, top_k: int = 8, filters: Optional[Dict[str, Any]] = None,
-                  alpha: float = 0.7) -> List[Dict[str, Any]]:
-    """
-    alpha: semantic weight; (1-alpha) is BM25 weight
-    """
-    # 1. Calculate query vector
-    q_vec = embed_texts([query])[0]
+def _zscore(x: np.ndarray) -> np.ndarray:
+    std = x.std()
+    if std == 0:
+        return np.zeros_like(x)
+    return (x - x.mean()) / std
+
+def _ranks(x: np.ndarray) -> np.ndarray:
+    """1-based rank of each element, highest value first."""
+    r = np.empty(len(x), dtype=np.float64)
+    r[np.argsort(-x, kind="stable")] = np.arange(1, len(x) + 1)
+    return r
+
+def fuse_minmax(sem: np.ndarray, bm25: np.ndarray, in_bm25: np.ndarray, alpha: float) -> np.ndarray:
+    """Weighted sum of min-max normalized scores (BM25 is 0 for semantic-only candidates)."""
+    return alpha * _minmax(sem) + (1 - alpha) * _minmax(bm25)
 
-    # 2. Qdrant semantic recall
-    sem_hits = qdrant_store.search(q_vec, top_k=top_k * 4, filters=filters)
+def fuse_zscore(sem: np.ndarray, bm25: np.ndarray, in_bm25: np.ndarray, alpha: float) -> np.ndarray:
+    """Weighted sum of z-score normalized scores; robust to a single outlier stretching the range."""
+    return alpha * _zscore(sem) + (1 - alpha) * _zscore(bm25)
 
-    # 3. BM25 keyword recall
-    bm25_hits = bm25_store.search(query, top_k=top_k * 4)
+def fuse_rrf(sem: np.ndarray, bm25: np.ndarray, in_bm25: np.ndarray, alpha: float, k: int = 60) -> np.ndarray:
+    """Weighted Reciprocal Rank Fusion; candidates missing from the BM25 list get no BM25 term."""
+    bm25_term = np.where(in_bm25, 1.0 / (k + _ranks(np.where(in_bm25, bm25, -np.inf))), 0.0)
+    return alpha / (k + _ranks(sem)) + (1 - alpha) * bm25_term
 
-    # 4. Prepare combined candidates
+FUSION_STRATEGIES: Dict[str, Callable[[np.ndarray, np.ndarray, np.ndarray, float], np.ndarray]] = {
+    "minmax": fuse_minmax,
+    "rrf": fuse_rrf,
+    "zscore": fuse_zscore,
+}
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Indices of the top_k scores, highest first (argpartition, then sort only the k)."""
+    if len(scores) > top_k:
+        idx = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        idx = np.arange(len(scores))
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+def _collect(sem_hits: List[Dict[str, Any]], bm25_hits: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
     cand: Dict[str, Dict[str, Any]] = {}
     for h in sem_hits:
         pid = h["id"]
@@ -36,30 +67,189 @@ def search_merged(query: str, top_k: int = 8, filters: Optional[Dict[str, Any]]
     for h in bm25_hits:
         pid = h["id"]
         cand.setdefault(pid, {}).update({"id": pid, "bm25": float(h["bm25"])})
+    RETRIEVAL_CANDIDATES.labels("semantic").observe(len(sem_hits))
+    RETRIEVAL_CANDIDATES.labels("bm25").observe(len(bm25_hits))
+    RETRIEVAL_CANDIDATES.labels("union").observe(len(cand))
+    return cand
+
+def _only_bm25(cand: Dict[str, Dict[str, Any]]) -> List[str]:
+    return [pid for pid, v in cand.items() if "semantic" not in v]
+
+def _from_cache(cands: Sequence[Dict[str, Dict[str, Any]]]) -> Tuple[Dict[str, np.ndarray], List[str]]:
+    """
+    Vectors and payloads of BM25-only candidates from the local chunk cache.
+    Payloads are set on the candidates; returns (vectors by id, ids still to fetch from the vector store).
+    With several candidate sets (one per query), a snippet shared by several is looked up once.
+    """
+    ids = list(dict.fromkeys(pid for cand in cands for pid in _only_bm25(cand)))
+    vecs, payloads = chunk_cache.get_many(ids)
+    for cand in cands:
+        for pid in _only_bm25(cand):
+            if pid in payloads:
+                cand[pid]["payload"] = payloads[pid]
+    missing = [pid for pid in ids if pid not in vecs]
+    RETRIEVAL_CANDIDATES.labels("fetched").observe(len(missing))
+    return vecs, missing
+
+def _add_fetched(cands: Sequence[Dict[str, Dict[str, Any]]], vecs: Dict[str, np.ndarray],
+                 pts: Dict[str, Dict[str, Any]]):
+    """Merge points fetched from the vector store into the candidates and the chunk cache."""
+    if not pts:
+        return
+    ids = list(pts)
+    mat = _as_matrix([p["vector"] for p in pts.values()])
+    chunk_cache.put_many(ids, mat, [p["payload"] for p in pts.values()])
+    for pid, row in zip(ids, mat):
+        vecs[pid] = row
+    for cand in cands:
+        for pid in _only_bm25(cand):
+            if pid in pts:
+                cand[pid]["payload"] = pts[pid]["payload"]
+
+def _as_matrix(rows: List[Any]) -> np.ndarray:
+    """Stack candidate vectors (float lists from Qdrant, or arrays) into one float32 matrix."""
+    if isinstance(rows[0], np.ndarray):
+        return np.stack(rows).astype(np.float32, copy=False)
+    # one pass over the floats; ~25% faster than np.asarray on a list of lists
+    dim = len(rows[0])
+    return np.fromiter(chain.from_iterable(rows), dtype=np.float32, count=len(rows) * dim).reshape(len(rows), dim)
+
+def _fuse(cand: Dict[str, Dict[str, Any]], q_vec: np.ndarray, vecs: Dict[str, list],
+          top_k: int, alpha: float, fusion: str = "minmax") -> List[Dict[str, Any]]:
+    items = list(cand.values())
+    if not items or top_k <= 0:
+        return []
+    sem = np.array([v.get("semantic", 0.0) for v in items], dtype=np.float64)
+    bm25 = np.array([v.get("bm25", 0.0) for v in items], dtype=np.float64)
+    in_bm25 = np.array(["bm25" in v for v in items])
+
+    # Semantic scores for BM25-only candidates: stack their vectors and score with one matmul
+    rows, idx = [], []
+    for i, v in enumerate(items):
+        if "semantic" not in v and vecs.get(v["id"]) is not None:
+            rows.append(vecs[v["id"]])
+            idx.append(i)
+    if rows:
+        sem[idx] = _as_matrix(rows) @ q_vec.astype(np.float32)
+
+    merged = FUSION_STRATEGIES[fusion](sem, bm25, in_bm25, alpha)
+    out = []
+    for i in top_k_indices(merged, top_k):
+        v = items[i]
+        v["semantic"] = float(sem[i])
+        v["score_merged"] = float(merged[i])
+        v.setdefault("payload", {})
+        out.append(v)
+    return out
+
+def search_merged(query: str, top_k: int = 8, filters: Optional[Dict[str, Any]] = None,
+                  alpha: float = 0.7, fusion: str = "minmax") -> List[Dict[str, Any]]:
+    """
+    alpha: semantic weight; (1-alpha) is BM25 weight
+    fusion: score fusion strategy, one of FUSION_STRATEGIES
+    """
+    with trace("search_merged_trace", fusion=fusion, top_k=top_k):
+        # 1. Calculate query vector
+        with span("search", "embed"):
+            q_vec = embed_texts([query])[0]
+
+        # 2. Vector store semantic recall
+        with span("search", "semantic"):
+            sem_hits = vector_store.search(q_vec, top_k=top_k * 4, filters=filters)
+
+        # 3. BM25 keyword recall
+        bm25_hits = _bm25_search(query, top_k * 4, filters)
+
+        # 4. Prepare combined candidates
+        cand = _collect(sem_hits, bm25_hits)
+
+        # 5. Vectors and payloads for BM25-only candidates: local cache first, one store call for the rest
+        with span("search", "fetch_vectors"):
+            vecs, missing = _from_cache([cand])
+            if missing:
+                _add_fetched([cand], vecs, vector_store.get_points_by_ids(missing))
+
+        # 6. Normalize, merge and take top_k
+        with span("search", "fusion"):
+            return _fuse(cand, q_vec, vecs, top_k, alpha, fusion)
+
+async def _aembed_query(query: str) -> np.ndarray:
+    with span("search", "embed"):
+        return (await aembed_texts([query]))[0]
+
+def _bm25_search(query: str, top_k: int, filters: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # vector-only (degraded) until the startup warmup has built the BM25 index
+    if not warmup.bm25_available:
+        SEARCH_DEGRADED.inc()
+        return []
+    with span("search", "bm25"):
+        return bm25_store.search(query, top_k, filters=filters)
+
+async def asearch_merged(query: str, top_k: int = 8, filters: Optional[Dict[str, Any]] = None,
+                         alpha: float = 0.7, fusion: str = "minmax") -> List[Dict[str, Any]]:
+    """
+    Async variant of search_merged: the query embedding and BM25 recall run concurrently.
+    """
+    with trace("search_merged_trace", fusion=fusion, top_k=top_k):
+        # 1. Query vector and BM25 keyword recall (CPU-bound, off the event loop) in parallel
+        q_vec, bm25_hits = await asyncio.gather(
+            _aembed_query(query),
+            asyncio.to_thread(_bm25_search, query, top_k * 4, filters),
+        )
+
+        # 2. Vector store semantic recall
+        with span("search", "semantic"):
+            sem_hits = await vector_store.asearch(q_vec, top_k=top_k * 4, filters=filters)
+
+        # 3. Combine candidates, vectors and payloads for BM25-only ones
+        cand = _collect(sem_hits, bm25_hits)
+        with span("search", "fetch_vectors"):
+            vecs, missing = _from_cache([cand])
+            if missing:
+                _add_fetched([cand], vecs, await vector_store.aget_points_by_ids(missing))
+
+        # 4. Normalize, merge and take top_k
+        with span("search", "fusion"):
+            return _fuse(cand, q_vec, vecs, top_k, alpha, fusion)
+
+def _bm25_search_many(queries: Sequence[str], top_ks: Sequence[int],
+                      filters: Optional[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    if not warmup.bm25_available:
+        SEARCH_DEGRADED.inc(len(queries))
+        return [[] for _ in queries]
+    with span("search", "bm25"):
+        return [bm25_store.search(q, k, filters=filters) for q, k in zip(queries, top_ks)]
+
+async def asearch_merged_batch(queries: Sequence[str], top_ks: Sequence[int], filters: Optional[Dict[str, Any]] = None,
+                               alpha: float = 0.7, fusion: str = "minmax",
+                               q_vecs: Optional[np.ndarray] = None) -> List[List[Dict[str, Any]]]:
+    """
+    Batch variant of asearch_merged (same hits per query): one embeddings call for all queries
+    (skipped if q_vecs is given), BM25 for all of them in one worker thread, one vector store batch
+    search, and one cache lookup / store fetch for the BM25-only candidates of all queries,
+    so a snippet recalled by several queries is fetched once.
+    """
+    if not queries:
+        return []
+    with trace("search_merged_batch_trace", fusion=fusion, queries=len(queries)):
+        wide = [k * 4 for k in top_ks]
+
+        async def embed() -> np.ndarray:
+            if q_vecs is not None:
+                return q_vecs
+            with span("search", "embed"):
+                return await aembed_texts(list(queries))
+
+        vecs_q, bm25_lists = await asyncio.gather(embed(), asyncio.to_thread(_bm25_search_many, queries, wide, filters))
+
+        with span("search", "semantic"):
+            sem_lists = await vector_store.asearch_batch(vecs_q, wide, filters=filters)
+
+        cands = [_collect(sem, bm) for sem, bm in zip(sem_lists, bm25_lists)]
+        with span("search", "fetch_vectors"):
+            vecs, missing = _from_cache(cands)
+            if missing:
+                _add_fetched(cands, vecs, await vector_store.aget_points_by_ids(missing))
 
-    # 5. Get vectors for BM25-only candidates
-    only_bm25_ids = [pid for pid, v in cand.items() if "semantic" not in v]
-    if only_bm25_ids:
-        vecs = qdrant_store.get_vectors_by_ids(only_bm25_ids)
-        for pid in only_bm25_ids:
-            vec = vecs.get(pid)
-            if vec is not None:
-                # calculate semantic score for BM25-only candidates
-                sem = float(np.dot(q_vec, np.array(vec, dtype=np.float32)))
-                cand[pid]["semantic"] = sem
-            else:
-                cand[pid]["semantic"] = 0.0
-
-    # 6. Normalize semantic and BM25 scores, then merge
-    sem_scores = [v.get("semantic", 0.0) for v in cand.values()]
-    bm25_scores = [v.get("bm25", 0.0) for v in cand.values()]
-    sem_norm = _minmax_norm(sem_scores)
-    bm25_norm = _minmax_norm(bm25_scores)
-
-    for (pid, v), s, b in zip(cand.items(), sem_norm, bm25_norm):
-        v["score_merged"] = alpha * s + (1 - alpha) * b
-
-    # 7. Sort candidates by merged score and return top_k
-    merged = sorted(cand.values(), key=lambda x: x["score_merged"], reverse=True)[:top_k]
-
-    return merged
+        with span("search", "fusion"):
+            return [_fuse(cand, q, vecs, k, alpha, fusion) for cand, q, k in zip(cands, vecs_q, top_ks)]
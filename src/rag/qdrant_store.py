@@ -1,26 +1,118 @@
+import threading
 from typing import List, Dict, Any, Optional
-from qdrant_client import QdrantClient
+import numpy as np
+from qdrant_client import QdrantClient, AsyncQdrantClient
 from qdrant_client.http import models as qm
 from src.utils.settings import settings
+from src.rag.chunk_cache import chunk_cache
+from src.rag.bm25_store import FILTER_FIELDS, filter_fields
+from src.rag.vector_store import VectorStore
 
-class QdrantStore:
+# payload indexes kept on the collection: the search filters, and the reconcile range on updated_at
+PAYLOAD_INDEXES = {**{f: qm.PayloadSchemaType.KEYWORD for f in FILTER_FIELDS},
+                   "updated_at": qm.PayloadSchemaType.DATETIME}
+
+def _batch(ids: List[str], vectors: np.ndarray, payloads: List[Dict[str, Any]]) -> qm.Batch:
+    # built without validation: validating ~100k floats per batch costs more than the tolist()
+    return qm.Batch.model_construct(ids=ids, vectors=np.asarray(vectors, dtype=np.float32).tolist(), payloads=payloads)
+
+def vectors_config() -> qm.VectorParams:
+    """Collection vector layout from Settings (size, on-disk storage, HNSW, quantization)."""
+    hnsw = None
+    if settings.qdrant_hnsw_m is not None or settings.qdrant_hnsw_ef_construct is not None:
+        hnsw = qm.HnswConfigDiff(m=settings.qdrant_hnsw_m, ef_construct=settings.qdrant_hnsw_ef_construct)
+    quant = None
+    if settings.qdrant_quantization == "scalar":
+        quant = qm.ScalarQuantization(scalar=qm.ScalarQuantizationConfig(
+            type=qm.ScalarType.INT8, quantile=0.99, always_ram=settings.qdrant_quantization_always_ram))
+    elif settings.qdrant_quantization == "binary":
+        quant = qm.BinaryQuantization(binary=qm.BinaryQuantizationConfig(
+            always_ram=settings.qdrant_quantization_always_ram))
+    return qm.VectorParams(
+        size=settings.embedding_dim,
+        distance=qm.Distance.COSINE,
+        on_disk=settings.qdrant_on_disk or None,
+        hnsw_config=hnsw,
+        quantization_config=quant,
+    )
+
+def search_params() -> Optional[qm.SearchParams]:
+    quant = None
+    if settings.qdrant_quantization:
+        quant = qm.QuantizationSearchParams(rescore=settings.qdrant_search_rescore,
+                                            oversampling=settings.qdrant_search_oversampling)
+    if quant is None and settings.qdrant_search_hnsw_ef is None:
+        return None
+    return qm.SearchParams(hnsw_ef=settings.qdrant_search_hnsw_ef, quantization=quant)
+
+def _client_kwargs() -> Dict[str, Any]:
+    return dict(host=settings.qdrant_host, port=settings.qdrant_port, grpc_port=settings.qdrant_grpc_port,
+                prefer_grpc=settings.qdrant_prefer_grpc, timeout=5.0)
+
+class QdrantStore(VectorStore):
+    """
+    VectorStore on a Qdrant server (QDRANT_HOST), over HTTP or gRPC.
+    The clients are built on first use, so the store can be created before Qdrant is up.
+    """
     def __init__(self):
-        self.client = QdrantClient(
-            host=settings.qdrant_host,
-            port=settings.qdrant_port,
-            timeout=5.0,
-        )
+        super().__init__()
+        self._lock = threading.Lock()
+        self._client: Optional[QdrantClient] = None
+        self._aclient: Optional[AsyncQdrantClient] = None
+
+    @property
+    def client(self) -> QdrantClient:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = QdrantClient(**_client_kwargs())
+        return self._client
+
+    @client.setter
+    def client(self, value: QdrantClient):
+        self._client = value
+
+    @property
+    def aclient(self) -> AsyncQdrantClient:
+        if self._aclient is None:
+            with self._lock:
+                if self._aclient is None:
+                    self._aclient = AsyncQdrantClient(**_client_kwargs())
+        return self._aclient
+
+    @aclient.setter
+    def aclient(self, value: AsyncQdrantClient):
+        self._aclient = value
 
     def ensure_collection(self):
+        """
+        Create the collection with vectors_config() if it is missing. The layout of an existing
+        collection is kept (changing it needs a re-ingest), but its vector size must match.
+        """
         collections = {c.name for c in self.client.get_collections().collections}
         if settings.qdrant_collection not in collections:
             self.client.recreate_collection(
                 collection_name=settings.qdrant_collection,
-                vectors_config=qm.VectorParams(
-                    size=settings.embedding_dim,
-                    distance=qm.Distance.COSINE,
-                ),
+                vectors_config=vectors_config(),
             )
+        else:
+            params = self.client.get_collection(settings.qdrant_collection).config.params.vectors
+            if isinstance(params, qm.VectorParams) and params.size != settings.embedding_dim:
+                raise RuntimeError(f"collection {settings.qdrant_collection!r} has {params.size}-d vectors, "
+                                   f"EMBEDDING_DIM is {settings.embedding_dim}")
+        self.ensure_payload_indexes()
+
+    def ensure_payload_indexes(self):
+        """Create the missing PAYLOAD_INDEXES, so filtered searches do not scan payloads."""
+        info = self.client.get_collection(settings.qdrant_collection)
+        for field, schema in PAYLOAD_INDEXES.items():
+            if field not in (info.payload_schema or {}):
+                self.client.create_payload_index(
+                    collection_name=settings.qdrant_collection,
+                    field_name=field,
+                    field_schema=schema,
+                    wait=True,
+                )
 
     def is_healthy(self) -> bool:
         try:
@@ -29,36 +121,62 @@ class QdrantStore:
         except Exception:
             return False
 
-    def upsert(self, ids: List[str], vectors, payloads: List[Dict[str, Any]]):
+    def upsert(self, ids: List[str], vectors, payloads: List[Dict[str, Any]], wait: bool = True):
         """
         Upsert vectors into the Qdrant collection.
         :param ids: List of unique identifiers for the vectors.
         :param vectors: List of vectors to be upserted.
         :param payloads: List of payloads associated with each vector.
+        :param wait: If False, return once Qdrant has accepted the batch, without waiting for indexing.
         """
-        points = qm.Batch(
-            ids=ids,
-            vectors=vectors.tolist(),
-            payloads=payloads
-        )
         self.client.upsert(
             collection_name=settings.qdrant_collection,
-            points=points
+            points=_batch(ids, vectors, payloads),
+            wait=wait
         )
+        self._written(ids, vectors, payloads)
 
-    def search(self, query_vec, top_k: int = 5, filters: Optional[Dict[str, Any]] = None):
-        cond = None
-        if filters:
-            must = [qm.FieldCondition(key=k, match=qm.MatchValue(value=v)) for k, v in filters.items()]
-            cond = qm.Filter(must=must)
+    def upsert_many(self, ids: List[str], vectors, payloads: List[Dict[str, Any]], chunk: int = 64, wait: bool = True):
+        """
+        Upsert a large batch as several qm.Batch requests of `chunk` points each;
+        the caches and BM25 are updated once for the whole batch.
+        """
+        for i in range(0, len(ids), chunk):
+            self.client.upsert(
+                collection_name=settings.qdrant_collection,
+                points=_batch(ids[i:i + chunk], vectors[i:i + chunk], payloads[i:i + chunk]),
+                wait=wait
+            )
+        self._written(ids, vectors, payloads)
 
-        res = self.client.search(
+    def overwrite_payloads(self, payloads: List[Dict[str, Any]], wait: bool = True):
+        """
+        Replace the payloads of existing points (payload["id"]) in one request, keeping their vectors.
+        """
+        ops = [
+            qm.OverwritePayloadOperation(overwrite_payload=qm.SetPayload(payload=p, points=[p["id"]]))
+            for p in payloads
+        ]
+        self.client.batch_update_points(collection_name=settings.qdrant_collection, update_operations=ops, wait=wait)
+        self._payloads_written(payloads)
+
+    def delete(self, ids: List[str], wait: bool = True):
+        self.client.delete(
             collection_name=settings.qdrant_collection,
-            query_vector=query_vec.tolist(),
-            limit=top_k,
-            with_payload=True,
-            query_filter=cond
+            points_selector=qm.PointIdsList(points=ids),
+            wait=wait
         )
+        self._deleted(ids)
+
+    @staticmethod
+    def _filter(filters: Optional[Dict[str, Any]]) -> Optional[qm.Filter]:
+        if not filters:
+            return None
+        must = [qm.FieldCondition(key=k, match=qm.MatchValue(value=v)) for k, v in filters.items()]
+        return qm.Filter(must=must)
+
+    @staticmethod
+    def _hits(res) -> List[Dict[str, Any]]:
         return [
             {
                 "id": str(r.id),
@@ -68,15 +186,77 @@ class QdrantStore:
             for r in res
         ]
 
-    def scroll_all_texts(self, batch: int = 512) -> List[Dict[str, Any]]:
+    @staticmethod
+    def _points(res) -> Dict[str, Dict[str, Any]]:
+        m = {}
+        for pt in res:
+            vec = pt.vector
+            if isinstance(vec, dict):
+                vec = list(vec.values())[0]
+            m[str(pt.id)] = {"vector": vec, "payload": pt.payload or {}}
+        return m
+
+    @staticmethod
+    def _vectors(res) -> Dict[str, list]:
+        m = {}
+        for pt in res:
+            key = str(pt.id)
+            vec = pt.vector
+            if isinstance(vec, dict):
+                vec = list(vec.values())[0]
+            m[key] = vec
+        return m
+
+    def search(self, query_vec, top_k: int = 5, filters: Optional[Dict[str, Any]] = None):
+        res = self.client.search(
+            collection_name=settings.qdrant_collection,
+            query_vector=query_vec.tolist(),
+            limit=top_k,
+            with_payload=True,
+            query_filter=self._filter(filters),
+            search_params=search_params(),
+        )
+        return self._hits(res)
+
+    async def asearch(self, query_vec, top_k: int = 5, filters: Optional[Dict[str, Any]] = None):
+        res = await self.aclient.search(
+            collection_name=settings.qdrant_collection,
+            query_vector=query_vec.tolist(),
+            limit=top_k,
+            with_payload=True,
+            query_filter=self._filter(filters),
+            search_params=search_params(),
+        )
+        return self._hits(res)
+
+    async def asearch_batch(self, query_vecs, top_ks: List[int],
+                            filters: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        """Several searches in one request; hits per query vector, each with its own limit."""
+        flt, params = self._filter(filters), search_params()
+        res = await self.aclient.search_batch(
+            collection_name=settings.qdrant_collection,
+            requests=[qm.SearchRequest(vector=q.tolist(), limit=k, with_payload=True, filter=flt, params=params)
+                      for q, k in zip(query_vecs, top_ks)],
+        )
+        return [self._hits(r) for r in res]
+
+    def count(self) -> int:
+        return self.client.count(collection_name=settings.qdrant_collection, exact=True).count
+
+    def scroll_all_texts(self, batch: int = 512, updated_since: Optional[str] = None) -> List[Dict[str, Any]]:
         """
         Get all texts from the Qdrant collection.
+        :param updated_since: only return points whose payload updated_at is >= this ISO timestamp.
         """
+        cond = None
+        if updated_since:
+            cond = qm.Filter(must=[qm.FieldCondition(key="updated_at", range=qm.DatetimeRange(gte=updated_since))])
         out = []
         next_page = None
         while True:
             res, next_page = self.client.scroll(
                 collection_name=settings.qdrant_collection,
+                scroll_filter=cond,
                 with_payload=True,
                 with_vectors=False,
                 limit=batch,
@@ -87,11 +267,76 @@ class QdrantStore:
                 pid = payload.get("id") or str(pt.id)
                 text = payload.get("text")
                 if text:
-                    out.append({"id": pid, "text": text})
+                    out.append({"id": pid, "text": text, "updated_at": payload.get("updated_at"),
+                                "fields": filter_fields(payload)})
             if next_page is None:
                 break
         return out
 
+    def scroll_text_ids(self, batch: int = 1024) -> List[str]:
+        has_text = qm.Filter(must_not=[qm.IsEmptyCondition(is_empty=qm.PayloadField(key="text")),
+                                       qm.FieldCondition(key="text", match=qm.MatchValue(value=""))])
+        out = []
+        next_page = None
+        while True:
+            res, next_page = self.client.scroll(
+                collection_name=settings.qdrant_collection,
+                scroll_filter=has_text,
+                with_payload=qm.PayloadSelectorInclude(include=["id"]),
+                with_vectors=False,
+                limit=batch,
+                offset=next_page,
+            )
+            out.extend((pt.payload or {}).get("id") or str(pt.id) for pt in res)
+            if next_page is None:
+                break
+        return out
+
+    def warm_cache(self, batch: int = 256) -> int:
+        """
+        Fill the local chunk cache by scrolling vectors and payloads, until the cache is full.
+        Returns the number of points cached.
+        """
+        n = 0
+        next_page = None
+        while not chunk_cache.full:
+            res, next_page = self.client.scroll(
+                collection_name=settings.qdrant_collection,
+                with_payload=True,
+                with_vectors=True,
+                limit=batch,
+                offset=next_page,
+            )
+            pts = self._points(res)
+            if pts:
+                vecs = np.array([p["vector"] for p in pts.values()], dtype=np.float32)
+                chunk_cache.put_many(list(pts), vecs, [p["payload"] for p in pts.values()])
+                n += len(pts)
+            if next_page is None:
+                break
+        return n
+
+    def get_points_by_ids(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Retrieve vectors and payloads by ID: {id: {"vector": [...], "payload": {...}}}.
+        """
+        res = self.client.retrieve(
+            collection_name=settings.qdrant_collection,
+            ids=ids,
+            with_vectors=True,
+            with_payload=True,
+        )
+        return self._points(res)
+
+    async def aget_points_by_ids(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        res = await self.aclient.retrieve(
+            collection_name=settings.qdrant_collection,
+            ids=ids,
+            with_vectors=True,
+            with_payload=True,
+        )
+        return self._points(res)
+
     def get_vectors_by_ids(self, ids: List[str]) -> Dict[str, list]:
             """
             Retrieve vectors by their IDs from the Qdrant collection.
@@ -105,15 +350,22 @@ class QdrantStore:
                 with_vectors=True,
                 with_payload=False,
             )
-            m = {}
-            for pt in res:
-                key = str(pt.id)
-                vec = pt.vector
-                if isinstance(vec, dict):
-                    vec = list(vec.values())[0]
-                m[key] = vec
-
-            return m
+            return self._vectors(res)
 
+    async def aget_vectors_by_ids(self, ids: List[str]) -> Dict[str, list]:
+            """
+            Async variant of get_vectors_by_ids.
+            """
+            res = await self.aclient.retrieve(
+                collection_name=settings.qdrant_collection,
+                ids=ids,
+                with_vectors=True,
+                with_payload=False,
+            )
+            return self._vectors(res)
 
-qdrant_store = QdrantStore()
+    async def aclose(self):
+        if self._aclient is not None:
+            await self._aclient.close()
+        if self._client is not None:
+            self._client.close()
@@ -0,0 +1,12 @@
+from src.rag.vector_store import VectorStore
+from src.utils.settings import settings
+
+def make_vector_store() -> VectorStore:
+    """The VectorStore selected by VECTOR_BACKEND."""
+    if settings.vector_backend == "embedded":
+        from src.rag.embedded_store import EmbeddedStore
+        return EmbeddedStore(settings.embedded_store_dir)
+    from src.rag.qdrant_store import QdrantStore
+    return QdrantStore()
+
+vector_store = make_vector_store()
@@ -0,0 +1,124 @@
+from typing import Any, Callable, Dict, List, Optional
+
+from src.rag.chunk_cache import chunk_cache
+from src.rag.bm25_sync import bm25_sync
+from src.rag.bm25_store import filter_fields
+
+def _bm25_rows(ids: List[str], payloads: List[Dict[str, Any]]) -> List[tuple]:
+    return [(i, p["text"], p.get("updated_at"), filter_fields(p)) for i, p in zip(ids, payloads) if p.get("text")]
+
+class VectorStore:
+    """
+    Chunk vectors + payloads behind search and ingestion; one backend is selected by
+    Settings.vector_backend (see src/rag/store.py).
+
+    Search is cosine similarity over the collection, filtered by exact payload matches
+    (product/lang). Hits are {"id", "score", "payload"}; points are {id: {"vector", "payload"}}.
+    Backends implement the storage calls; after every write they call _written/_deleted, which
+    keep the chunk cache and the shared BM25 change log in step and notify change listeners.
+    Writes by other workers arrive through the change log (_changed_elsewhere).
+    """
+    def __init__(self):
+        # called with the ids of points that were upserted, updated or deleted, here or by
+        # another worker; None when another worker's changes are not known one by one
+        self._change_listeners: List[Callable[[Optional[List[str]]], None]] = []
+        bm25_sync.add_change_listener(self._changed_elsewhere)
+
+    def add_change_listener(self, fn: Callable[[Optional[List[str]]], None]):
+        self._change_listeners.append(fn)
+
+    def _changed(self, ids: Optional[List[str]]):
+        for fn in self._change_listeners:
+            fn(ids)
+
+    def _written(self, ids: List[str], vectors, payloads: List[Dict[str, Any]]):
+        chunk_cache.put_many(ids, vectors, payloads)
+        # one BM25 change-log append per batch, shared with the other workers
+        bm25_sync.add_many(_bm25_rows(ids, payloads))
+        self._changed(ids)
+
+    def _payloads_written(self, payloads: List[Dict[str, Any]]):
+        ids = [p["id"] for p in payloads]
+        chunk_cache.update_payloads(payloads)
+        # the filter fields may have changed; re-adding replaces the BM25 documents
+        bm25_sync.add_many(_bm25_rows(ids, payloads))
+        self._changed(ids)
+
+    def _deleted(self, ids: List[str]):
+        chunk_cache.delete(ids)
+        bm25_sync.delete(ids)
+        self._changed(ids)
+
+    def _changed_elsewhere(self, ids: Optional[List[str]]):
+        """Points another worker wrote or deleted (None: unknown, drop everything)."""
+        if ids is None:
+            chunk_cache.clear()
+        else:
+            chunk_cache.delete(ids)
+        self._changed(ids)
+
+    # ---- backend interface ----
+
+    def ensure_collection(self):
+        """Create the collection if it is missing; its vector size must match EMBEDDING_DIM."""
+        raise NotImplementedError
+
+    def is_healthy(self) -> bool:
+        raise NotImplementedError
+
+    def upsert(self, ids: List[str], vectors, payloads: List[Dict[str, Any]], wait: bool = True):
+        raise NotImplementedError
+
+    def upsert_many(self, ids: List[str], vectors, payloads: List[Dict[str, Any]], chunk: int = 64, wait: bool = True):
+        raise NotImplementedError
+
+    def overwrite_payloads(self, payloads: List[Dict[str, Any]], wait: bool = True):
+        """Replace the payloads of existing points (payload["id"]), keeping their vectors."""
+        raise NotImplementedError
+
+    def delete(self, ids: List[str], wait: bool = True):
+        raise NotImplementedError
+
+    def search(self, query_vec, top_k: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def asearch(self, query_vec, top_k: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def asearch_batch(self, query_vecs, top_ks: List[int],
+                            filters: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        """Hits per query vector, each with its own limit."""
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def scroll_all_texts(self, batch: int = 512, updated_since: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        {"id", "text", "updated_at", "fields"} of every point with a text.
+        :param updated_since: only return points whose payload updated_at is >= this ISO timestamp.
+        """
+        raise NotImplementedError
+
+    def scroll_text_ids(self, batch: int = 1024) -> List[str]:
+        """Ids of every point with a text (the documents the BM25 index should hold), payloads not fetched."""
+        raise NotImplementedError
+
+    def warm_cache(self, batch: int = 256) -> int:
+        """Fill the local chunk cache until it is full; returns the number of points cached."""
+        raise NotImplementedError
+
+    def get_points_by_ids(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def aget_points_by_ids(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        raise NotImplementedError
+
+    def get_vectors_by_ids(self, ids: List[str]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def aget_vectors_by_ids(self, ids: List[str]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def aclose(self):
+        pass
@@ -0,0 +1,188 @@
+import asyncio
+import time
+from typing import Any, Dict, Optional
+
+import structlog
+
+from src.rag.bm25_store import filter_fields
+from src.rag.bm25_sync import BM25Sync, bm25_sync
+from src.rag.store import vector_store
+from src.rag.vector_store import VectorStore
+from src.utils.settings import settings
+
+logger = structlog.get_logger()
+
+class Warmup:
+    """
+    Startup work that runs in the background while the app already serves requests:
+    1. ensure the vector store collection, retrying with backoff until the store is reachable
+       (a vector size mismatch is a configuration error and is not retried);
+    2. load or build the BM25 index (see warm_bm25) in a worker thread, retrying with the same
+       backoff when it fails;
+    3. fill the chunk cache (CHUNK_CACHE_WARM_ON_STARTUP).
+    The app is ready once step 1 is done. Until step 2 is, bm25_available is False and merged
+    search is vector-only (degraded). report() is the /ready body, with the progress of each step.
+    """
+    def __init__(self, store: VectorStore, sync: BM25Sync):
+        self.store = store
+        self.sync = sync
+        self.store_ready = False
+        # BM25 recall is used unless a warmup is in progress (or retrying after a failure)
+        self.bm25_available = True
+        self.state: Dict[str, Dict[str, Any]] = {
+            "vector_store": {"status": "pending"},
+            "bm25": {"status": "pending"},
+            "chunk_cache": {"status": "pending"},
+        }
+        self._t0 = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+
+    def _set(self, step: str, **values):
+        self.state[step] = dict(self.state[step], **values)
+
+    def _elapsed(self) -> float:
+        return round(time.monotonic() - self._t0, 3)
+
+    def report(self) -> Dict[str, Any]:
+        return {"ready": self.store_ready, "degraded": self.store_ready and not self.bm25_available,
+                "uptime_s": self._elapsed(), **self.state}
+
+    def start(self):
+        self._t0 = time.monotonic()
+        self.bm25_available = False
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self):
+        if not await self._ensure_store():
+            return
+        await self._ensure_bm25()
+        if settings.chunk_cache_warm_on_startup:
+            self._set("chunk_cache", status="warming")
+            try:
+                n = await asyncio.to_thread(self.store.warm_cache)
+                self._set("chunk_cache", status="ready", count=n)
+                logger.info("chunk_cache_warmed", count=n)
+            except Exception as e:
+                logger.exception("chunk_cache_warmup_failed")
+                self._set("chunk_cache", status="failed", error=str(e))
+        else:
+            self._set("chunk_cache", status="skipped")
+        logger.info("warmup_done", seconds=self._elapsed())
+
+    async def _ensure_store(self) -> bool:
+        delay, attempts = settings.startup_retry_initial_s, 0
+        while True:
+            attempts += 1
+            try:
+                await asyncio.to_thread(self.store.ensure_collection)
+                break
+            except RuntimeError as e:  # e.g. vector size mismatch: retrying will not help
+                logger.error("vector_store_unusable", error=str(e))
+                self._set("vector_store", status="failed", error=str(e), attempts=attempts)
+                return False
+            except Exception as e:
+                logger.warning("vector_store_unavailable", error=str(e), attempts=attempts, retry_in_s=delay)
+                self._set("vector_store", status="retrying", error=str(e), attempts=attempts)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, settings.startup_retry_max_s)
+        self.store_ready = True
+        self._set("vector_store", status="ready", attempts=attempts, seconds=self._elapsed())
+        logger.info("vector_store_ready", backend=settings.vector_backend, attempts=attempts)
+        return True
+
+    async def _ensure_bm25(self):
+        delay, attempts = settings.startup_retry_initial_s, 0
+        while True:
+            attempts += 1
+            try:
+                await asyncio.to_thread(self.warm_bm25)
+                break
+            except Exception as e:
+                logger.exception("bm25_warmup_failed", attempts=attempts, retry_in_s=delay)
+                self._set("bm25", status="retrying", error=str(e), attempts=attempts)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, settings.startup_retry_max_s)
+        self.bm25_available = True
+        self._set("bm25", status="ready", attempts=attempts, seconds=self._elapsed())
+
+    def warm_bm25(self):
+        """
+        Load the shared BM25 snapshot + change log and reconcile it against the vector store:
+        points updated since the snapshot watermark are (re-)added, then the id sets are compared,
+        dropping documents whose points are gone and fetching points the snapshot is missing.
+        A full scroll happens when the snapshot is missing or incompatible, or most of it is missing.
+        Runs under the change-log lock, so with several workers only the first one rebuilds;
+        the log is tailed from then on, and writes made meanwhile wait for the lock.
+        """
+        self._set("bm25", status="waiting_for_lock")
+        with self.sync.locked():
+            self.sync.start()
+            self._set("bm25", status="loading_snapshot")
+            if self.sync.load() and self._reconcile():
+                return
+            self._rebuild()
+
+    def _reconcile(self) -> bool:
+        """Bring a loaded snapshot up to date; False if a full rebuild is cheaper."""
+        bm25 = self.sync.store
+        changed = not self.sync.in_sync
+        self._set("bm25", status="reconciling", indexed=len(bm25))
+        if bm25.watermark:
+            watermark, updated = bm25.watermark, 0
+            for row in self.store.scroll_all_texts(updated_since=watermark):
+                # updated_since is inclusive: rows at the watermark were indexed already
+                if row["id"] not in bm25 or (row.get("updated_at") or "") > watermark:
+                    bm25.add(row["id"], row["text"], updated_at=row.get("updated_at"), fields=row.get("fields"))
+                    updated += 1
+            logger.info("bm25_snapshot_delta", updated=updated)
+            changed = changed or updated > 0
+
+        store_ids = set(self.store.scroll_text_ids())
+        indexed = set(bm25.doc_ids())
+        gone = list(indexed - store_ids)
+        missing = list(store_ids - indexed)
+        self._set("bm25", total=len(store_ids))
+        if len(missing) > len(store_ids) // 2:
+            logger.info("bm25_snapshot_stale", snapshot=len(indexed), store=len(store_ids))
+            return False
+        bm25.delete(gone)
+        for i in range(0, len(missing), 256):
+            points = self.store.get_points_by_ids(missing[i:i + 256])
+            for pid, p in points.items():
+                payload = p["payload"]
+                if not payload.get("text"):
+                    continue
+                bm25.add(payload.get("id") or pid, payload["text"], updated_at=payload.get("updated_at"),
+                         fields=filter_fields(payload))
+        if gone or missing:
+            logger.info("bm25_snapshot_reconciled", deleted=len(gone), added=len(missing))
+        if changed or gone or missing:
+            self.sync.compact()
+        self._set("bm25", indexed=len(bm25))
+        logger.info("bm25_snapshot_loaded", count=len(bm25))
+        return True
+
+    def _rebuild(self):
+        bm25 = self.sync.store
+        self._set("bm25", status="scrolling", indexed=0)
+        rows = self.store.scroll_all_texts()
+        self._set("bm25", status="building", total=len(rows))
+        bm25.build([])
+        for i, row in enumerate(rows, 1):
+            bm25.add(row["id"], row["text"], updated_at=row.get("updated_at"), fields=row.get("fields"))
+            if i % 1000 == 0:
+                self._set("bm25", indexed=i)
+        self._set("bm25", status="saving_snapshot", indexed=len(rows))
+        self.sync.compact()
+        logger.info("bm25_built", count=len(rows))
+
+warmup = Warmup(vector_store, bm25_sync)
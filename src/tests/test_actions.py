@@ -0,0 +1,99 @@
+import json
+import re
+
+import pytest
+
+from src.core import answer_cache as answer_cache_module
+from src.core.actions import RuleEngine, enforce_action, rule_engine
+from src.core.answer_cache import AnswerCache
+
+# the hand-written rules the bundled action_rules.json replaces
+_ABUSE = re.compile(r"\b(abuse|malware|phishing|spam|fraud)\b", re.I)
+_BILL = re.compile(r"\b(billing|refund|chargeback|invoice)\b", re.I)
+_IDV = re.compile(r"\b(verification|ownership|identity|id check)\b", re.I)
+_SUSP = re.compile(r"\b(suspend|suspension|suspended)\b", re.I)
+
+def _legacy(text, snippets, llm_action):
+    if _SUSP.search(text) or _ABUSE.search(text):
+        return "escalate_to_abuse_team"
+    for sn in snippets:
+        title = (sn.get("payload") or {}).get("doc", "").lower()
+        if "suspension" in title or "abuse" in title:
+            return "escalate_to_abuse_team"
+    if _BILL.search(text):
+        return "escalate_to_billing_team"
+    if _IDV.search(text):
+        return "escalate_to_support_level_2"
+    return llm_action or "no_escalation_needed"
+
+TICKETS = [
+    "My domain was SUSPENDED yesterday",
+    "Please refund the renewal invoice",
+    "Refund after the phishing report?",
+    "How do I prove ownership of example.com?",
+    "We need an ID check before the transfer",
+    "Can I change my nameservers?",
+    "Suspensions are listed where?",          # no whole-word match
+    "refunds and verification",               # "refunds" is not a keyword, "verification" is
+    "",
+]
+SNIPPETS = [
+    [],
+    [{"id": "a", "payload": {"doc": "Domain Suspension Policy"}}],
+    [{"id": "b", "payload": {"doc": "DNS basics"}}, {"id": "c", "payload": {"doc": "Abuse reporting"}}],
+    [{"id": "d", "payload": {}}],
+]
+
+def test_matches_legacy_rules():
+    for text in TICKETS:
+        for snippets in SNIPPETS:
+            for llm_action in ("request_more_information", None):
+                assert enforce_action(text, snippets, llm_action) == _legacy(text, snippets, llm_action), text
+
+def test_classify_reports_rule_and_batch_agrees():
+    d = rule_engine.classify("Refund after the phishing report?")
+    assert d == {"rule": "abuse_or_suspension", "action": "escalate_to_abuse_team", "keyword": "phishing"}
+    assert rule_engine.classify("Can I change my nameservers?", SNIPPETS[1])["rule"] == "abuse_policy_snippet"
+    for snippets in SNIPPETS:
+        batch = rule_engine.classify_many(TICKETS, [snippets] * len(TICKETS))
+        assert batch == [rule_engine.classify(t, snippets) for t in TICKETS]
+
+def test_rules_file_and_canned_answer(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"rules": [
+        {"name": "whois", "action": "no_escalation_needed", "keywords": ["whois privacy"],
+         "answer": "WHOIS privacy is included with every domain."},
+        {"name": "billing", "action": "escalate_to_billing_team", "keywords": ["invoice"]},
+    ]}))
+    engine = RuleEngine.from_file(str(path))
+    d = engine.classify("Invoice question about Whois Privacy")
+    assert d["rule"] == "whois" and d["answer"].startswith("WHOIS privacy")
+    assert engine.classify("invoice") == {"rule": "billing", "action": "escalate_to_billing_team", "keyword": "invoice"}
+
+    with pytest.raises(ValueError):
+        RuleEngine([{"name": "bad", "action": "escalate_to_nobody", "keywords": ["x"]}])
+    with pytest.raises(ValueError):
+        RuleEngine([{"name": "empty", "action": "no_escalation_needed", "keywords": []}])
+
+def test_overlapping_keywords_keep_rule_priority():
+    engine = RuleEngine([
+        {"name": "billing", "action": "escalate_to_billing_team", "keywords": ["refund"]},
+        {"name": "policy", "action": "request_more_information", "keywords": ["no refund policy", "policy"]},
+        {"name": "titles", "action": "escalate_to_abuse_team", "scope": "snippet_title", "keywords": ["abuse"]},
+    ])
+    # the lower-priority "no refund policy" starts first and contains "refund"
+    tickets = ["Is there a no refund policy on renewals?", "what is the policy"]
+    assert engine.classify(tickets[0])["rule"] == "billing"
+    assert [d["rule"] for d in engine.classify_many(tickets)] == ["billing", "policy"]
+    assert engine.classify("policy", [{"payload": {"doc": "Abuse reporting"}}])["rule"] == "policy"
+    assert engine.classify("hello", [{"payload": {"doc": "Abuse reporting"}}])["keyword"] == "abuse"
+
+def test_answer_cache_key_follows_the_rules(monkeypatch):
+    a = RuleEngine([{"name": "billing", "action": "escalate_to_billing_team", "keywords": ["refund"]}])
+    b = RuleEngine([{"name": "billing", "action": "escalate_to_support_level_2", "keywords": ["refund"]}])
+    assert a.version == RuleEngine(a.rules).version != b.version
+    keys = []
+    for engine in (a, b):
+        monkeypatch.setattr(answer_cache_module, "rule_engine", engine)
+        keys.append(AnswerCache.key("refund please", []))
+    assert keys[0] != keys[1]
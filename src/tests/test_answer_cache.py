@@ -0,0 +1,100 @@
+import numpy as np
+
+from src.api.schemas import TicketResponse
+from src.core import answer_cache as cache_module
+from src.core.answer_cache import AnswerCache
+from src.rag import vector_store as store_module
+from src.rag.bm25_store import BM25Store
+from src.rag.bm25_sync import BM25Sync
+from src.rag.chunk_cache import ChunkCache
+from src.rag.vector_store import VectorStore
+from src.utils.settings import settings
+
+def _resp(answer):
+    return TicketResponse(answer=answer, references=["Transfers · 2"], action_required="no_escalation_needed")
+
+def _snippets(*ids):
+    return [{"id": pid, "payload": {"text": pid}} for pid in ids]
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_exact_hits_expiry_and_lru(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "monotonic", clock)
+    cache = AnswerCache(max_entries=2, ttl_s=60)
+    key = AnswerCache.key("How do I  move my DOMAIN?", _snippets("a", "b"))
+    assert key == AnswerCache.key("how do i move my domain?", _snippets("b", "a"))  # normalized, unordered
+    assert key != AnswerCache.key("how do i move my domain?", _snippets("a"))
+
+    assert cache.get(key) is None
+    cache.put(key, _resp("Unlock it first."), _snippets("a", "b"))
+    hit = cache.get(key)
+    assert hit.answer == "Unlock it first."
+    hit.answer = "mutated"  # callers get a copy
+    assert cache.get(key).answer == "Unlock it first."
+
+    clock.now += 61
+    assert cache.get(key) is None and not cache._entries and not cache._by_chunk
+
+    for k in ("k1", "k2"):
+        cache.put(k, _resp(f"answer {k}"), _snippets(k))
+    cache.get("k1")  # k2 becomes the least recently used
+    cache.put("k3", _resp("answer k3"), _snippets("k3"))
+    assert [k for k in ("k1", "k2", "k3") if cache.get(k)] == ["k1", "k3"]
+    assert "k2" not in cache._by_chunk
+
+def test_invalidation_by_chunk_id():
+    cache = AnswerCache(max_entries=8, ttl_s=60)
+    cache.put("t1", _resp("answer one"), [{"id": "packed", "ids": ["a", "b"]}])
+    cache.put("t2", _resp("answer two"), _snippets("b", "c"))
+    cache.put("t3", _resp("answer three"), _snippets("d"))
+    cache.invalidate_chunks(["a", "zzz"])
+    assert cache.get("t1") is None and cache.get("t2") and cache.get("t3")
+    cache.invalidate_chunks(["c"])
+    assert cache.get("t2") is None and set(cache._by_chunk) == {"d"}
+    cache.invalidate_chunks(None)
+    assert not cache._entries and not cache._by_chunk
+
+def test_semantic_match_threshold():
+    cache = AnswerCache(max_entries=4, ttl_s=60, semantic_threshold=0.95)
+    q = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+    assert cache.get_similar(q) is None
+    cache.put("t1", _resp("answer one"), _snippets("a"), q_vec=q)
+    near = np.array([0.96, 0.28, 0.0], dtype=np.float32)  # cosine 0.96
+    far = np.array([0.94, 0.34, 0.0], dtype=np.float32)  # cosine 0.94
+    assert cache.get_similar(near).answer == "answer one"
+    assert cache.get_similar(far) is None
+
+    # an invalidated entry frees its vector slot for the next one
+    cache.invalidate_chunks(["a"])
+    assert cache.get_similar(q) is None and cache._free == [0]
+    cache.put("t2", _resp("answer two"), _snippets("b"), q_vec=far)
+    assert cache._slot_keys == ["t2"] and cache.get_similar(far).answer == "answer two"
+    assert AnswerCache(max_entries=4, ttl_s=60).get_similar(q) is None  # exact-only cache
+
+def test_other_workers_writes_invalidate_answers(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "bm25_snapshot_dir", str(tmp_path / "idx"))
+    monkeypatch.setattr(settings, "bm25_changelog_path", str(tmp_path / "idx.log"))
+    other, mine = BM25Sync(BM25Store()), BM25Sync(BM25Store())
+    other.enabled = mine.enabled = True
+    with other.locked():
+        other.compact()
+    with mine.locked():
+        assert mine.load()
+    monkeypatch.setattr(store_module, "chunk_cache", ChunkCache(dim=4, max_bytes=0))
+    monkeypatch.setattr(store_module, "bm25_sync", mine)
+    cache = AnswerCache(max_entries=8, ttl_s=60)
+    VectorStore().add_change_listener(cache.invalidate_chunks)
+
+    cache.put("t1", _resp("answer one"), _snippets("a"))
+    cache.put("t2", _resp("answer two"), _snippets("b"))
+    other.delete(["a"])
+    mine.poll()
+    assert cache.get("t1") is None and cache.get("t2")
+    other.stop()
+    mine.stop()
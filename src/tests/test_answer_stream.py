@@ -0,0 +1,46 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from src.core import orchestrator
+from src.core.answer_cache import AnswerCache
+
+ANSWER = '  Unlock the domain, then request the "EPP" code:\n1. Sign in\\2. Copy it — done ✓ 🚀  '
+
+def _chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))], usage=None)
+
+def _deltas(raw, size):
+    return [raw[i:i + size] for i in range(0, len(raw), size)]
+
+def test_token_events_carry_only_the_answer_text(monkeypatch):
+    # references before the answer, one quoting a decoy "answer" key; json.dumps escapes the
+    # non-ASCII characters (the emoji as a surrogate pair)
+    raw = json.dumps({"references": ['Transfers ["answer": "no"] · 2 · sn-1'], "answer": ANSWER,
+                      "action_required": "no_escalation_needed"})
+    assert "\\ud83d" in raw
+
+    for size in (1, 3, 7, len(raw)):
+        async def create(**kwargs):
+            async def gen():
+                for d in _deltas(raw, size):
+                    yield _chunk(d)
+                yield SimpleNamespace(choices=[], usage=None)
+            return gen()
+
+        async def snippets(ticket_text, top_k=8):
+            return [{"id": "sn-1", "payload": {"doc": "Transfers", "section": "2", "text": "auth code"}}]
+
+        client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        monkeypatch.setattr(orchestrator, "aopenai_client", lambda: client)
+        monkeypatch.setattr(orchestrator, "_apick_snippets", snippets)
+        monkeypatch.setattr(orchestrator, "answer_cache", AnswerCache(max_entries=8, ttl_s=60))
+
+        async def run():
+            return [e async for e in orchestrator.astream_resolve_ticket("how do I move my domain out")]
+        events = asyncio.run(run())
+        final = events[-1][1]
+        tokens = [data for event, data in events if event == "token"]
+        assert events[0][0] == "references" and events[-1][0] == "final"
+        assert "".join(tokens) == final["answer"] == ANSWER.strip()
+        assert len(tokens) > 1 or size == len(raw)  # streamed as the deltas arrive
@@ -0,0 +1,140 @@
+import random
+
+import numpy as np
+import pytest
+from rank_bm25 import BM25Okapi
+
+from src.rag.bm25_store import BM25Store, _tok
+
+_WORDS = ["domain", "whois", "suspended", "transfer", "renewal", "dns", "abuse", "billing",
+          "refund", "verification", "registrant", "email", "policy", "lock", "expired", "the", "a"]
+_WORDS += [f"term{i}" for i in range(200)]
+
+def _corpus(n: int, seed: int = 7):
+    rng = random.Random(seed)
+    return [(f"doc-{i}", " ".join(rng.choices(_WORDS, k=rng.randint(3, 40)))) for i in range(n)]
+
+def test_scores_match_bm25okapi():
+    items = _corpus(300)
+    store = BM25Store()
+    store.build(items[:100])
+    for _id, text in items[100:]:
+        store.add(_id, text)
+
+    ref = BM25Okapi([_tok(t) for _, t in items])
+    for query in ["suspended domain whois", "refund billing billing", "the dns lock", "unknown words"]:
+        expected = ref.get_scores(_tok(query))
+        hits = store.search(query, top_k=len(items))
+        got = {h["id"]: h["bm25"] for h in hits}
+        for i, (_id, _) in enumerate(items):
+            assert np.isclose(got.get(_id, 0.0), expected[i], atol=1e-9)
+
+def test_search_orders_top_k():
+    items = _corpus(200)
+    store = BM25Store()
+    store.build(items)
+    hits = store.search("whois verification", top_k=5)
+    assert len(hits) == 5
+    scores = [h["bm25"] for h in hits]
+    assert scores == sorted(scores, reverse=True)
+
+    ref = BM25Okapi([_tok(t) for _, t in items]).get_scores(_tok("whois verification"))
+    assert np.isclose(scores[0], ref.max())
+
+def test_empty_store_and_query():
+    store = BM25Store()
+    assert store.search("domain") == []
+    store.add("x", "domain suspended")
+    assert store.search("") == []
+    assert store.search("domain")[0]["id"] == "x"
+
+def test_snapshot_roundtrip_and_append(tmp_path):
+    items = _corpus(150)
+    store = BM25Store()
+    for _id, text in items[:100]:
+        store.add(_id, text, updated_at="2025-01-01T00:00:00Z")
+    store.save(str(tmp_path / "idx"))
+
+    loaded = BM25Store()
+    assert loaded.load(str(tmp_path / "idx"))
+    assert len(loaded) == 100 and "doc-5" in loaded
+    assert loaded.watermark == "2025-01-01T00:00:00Z"
+    # appends after load go to the tail segment and are scored together with the snapshot
+    for _id, text in items[100:]:
+        loaded.add(_id, text)
+
+    ref = BM25Okapi([_tok(t) for _, t in items])
+    expected = ref.get_scores(_tok("whois term3 suspended"))
+    got = {h["id"]: h["bm25"] for h in loaded.search("whois term3 suspended", top_k=len(items))}
+    for i, (_id, _) in enumerate(items):
+        assert np.isclose(got.get(_id, 0.0), expected[i], atol=1e-9)
+
+    # a re-saved snapshot (base + tail compacted) loads back to the same results
+    loaded.save(str(tmp_path / "idx"))
+    again = BM25Store()
+    assert again.load(str(tmp_path / "idx"))
+    assert again.search("whois term3 suspended", top_k=10) == loaded.search("whois term3 suspended", top_k=10)
+
+def test_snapshot_missing_or_incompatible(tmp_path):
+    store = BM25Store()
+    assert store.load(str(tmp_path / "nope")) is False
+    store.add("a", "domain whois")
+    store.save(str(tmp_path / "idx"))
+    assert BM25Store(k1=1.2).load(str(tmp_path / "idx")) is False
+
+def test_delete_and_replace_match_bm25okapi(tmp_path):
+    items = _corpus(200)
+    store = BM25Store()
+    store.build(items)
+    assert store.delete([f"doc-{i}" for i in range(0, 200, 3)] + ["missing"]) == 67
+    store.add("doc-1", "whois verification term7")
+    live = dict(items)
+    for i in range(0, 200, 3):
+        del live[f"doc-{i}"]
+    live["doc-1"] = "whois verification term7"
+    assert len(store) == len(live) and "doc-0" not in store
+
+    ids = list(live)
+    ref = BM25Okapi([_tok(live[i]) for i in ids])
+    # rare terms: per-term idf and lengths are exact before compaction
+    expected = ref.get_scores(_tok("term7 verification"))
+    got = {h["id"]: h["bm25"] for h in store.search("term7 verification", top_k=len(items))}
+    for i, _id in enumerate(ids):
+        assert np.isclose(got.get(_id, 0.0), expected[i], atol=1e-9)
+
+    # save() drops the tombstones; the snapshot matches BM25Okapi on the live documents exactly
+    store.save(str(tmp_path / "idx"))
+    loaded = BM25Store()
+    assert loaded.load(str(tmp_path / "idx"))
+    assert len(loaded) == len(live)
+    expected = ref.get_scores(_tok("the whois domain"))
+    got = {h["id"]: h["bm25"] for h in loaded.search("the whois domain", top_k=len(items))}
+    for i, _id in enumerate(ids):
+        assert np.isclose(got.get(_id, 0.0), expected[i], atol=1e-9)
+
+def test_filters_apply_before_top_k(tmp_path):
+    items = _corpus(300)
+    products = ["domains", "hosting", "email"]
+    store = BM25Store()
+    store.build([(_id, text, {"product": products[i % 3], "lang": "en"}) for i, (_id, text) in enumerate(items)])
+    store.add("nolang", "whois verification", fields={"product": "domains"})
+
+    everything = store.search("whois verification", top_k=len(items) + 1)
+    expected = [h for h in everything if h["id"] != "nolang" and int(h["id"].split("-")[1]) % 3 == 1][:5]
+    # scores are the unfiltered ones: filtering only drops non-matching documents
+    assert store.search("whois verification", top_k=5, filters={"product": "hosting"}) == expected
+    assert all(h["id"] != "nolang" for h in store.search("whois verification", top_k=400, filters={"lang": "en"}))
+    assert store.search("whois", filters={"product": "unknown"}) == []
+    with pytest.raises(ValueError):
+        store.search("whois", filters={"doc_id": "x"})
+
+    # field codes survive deletes, replacement and a snapshot round trip
+    store.delete(["doc-1"])
+    store.add("doc-4", "whois verification", fields={"product": "email", "lang": "en"})
+    store.save(str(tmp_path / "idx"))
+    loaded = BM25Store()
+    assert loaded.load(str(tmp_path / "idx"))
+    for f in ({"product": "hosting"}, {"product": "email", "lang": "en"}, {"product": "domains"}):
+        assert loaded.search("whois verification", top_k=7, filters=f) == \
+            store.search("whois verification", top_k=7, filters=f)
+    assert "doc-4" in [h["id"] for h in loaded.search("whois", top_k=300, filters={"product": "email"})]
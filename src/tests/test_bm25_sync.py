@@ -0,0 +1,72 @@
+import numpy as np
+
+from src.rag import vector_store as store_module
+from src.rag.bm25_store import BM25Store
+from src.rag.bm25_sync import BM25Sync
+from src.rag.chunk_cache import ChunkCache
+from src.rag.vector_store import VectorStore
+from src.utils.settings import settings
+
+def _worker() -> BM25Sync:
+    sync = BM25Sync(BM25Store())
+    sync.enabled = True  # route changes through the log without the tail thread
+    return sync
+
+def test_workers_share_changes_through_log(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "bm25_snapshot_dir", str(tmp_path / "idx"))
+    monkeypatch.setattr(settings, "bm25_changelog_path", str(tmp_path / "idx.log"))
+    monkeypatch.setattr(settings, "bm25_changelog_max_bytes", 10_000)
+
+    a, b = _worker(), _worker()
+    with a.locked():
+        assert not a.load()
+        a.store.build([("x", "domain whois lookup")])
+        a.compact()
+    with b.locked():
+        assert b.load() and b.in_sync
+    assert "x" in b.store
+
+    a.add_many([("y", "transfer lock removed", None, None), ("z", "refund transfer", None, {"product": "hosting"})])
+    a.delete(["x"])
+    assert "y" in a.store and "x" not in a.store  # writers see their own changes at once
+    assert b.poll() == 3  # two adds and one delete
+    assert "z" in b.store and "x" not in b.store
+    assert b.store.search("transfer")[0]["id"] == "y"
+    assert [h["id"] for h in b.store.search("transfer", filters={"product": "hosting"})] == ["z"]
+
+    # growing past the limit compacts; other workers reload the new snapshot and keep tailing
+    a.add_many([(f"d{i}", f"renewal policy term{i} " * 20, None, None) for i in range(40)])
+    b.add_many([("w", "abuse report", None, None)])
+    a.poll()
+    for w in (a, b):
+        assert len(w.store) == 43 and "w" in w.store and "x" not in w.store
+    assert a.store.search("abuse") == b.store.search("abuse")
+    a.stop()
+    b.stop()
+
+def test_other_workers_changes_evict_the_chunk_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "bm25_snapshot_dir", str(tmp_path / "idx"))
+    monkeypatch.setattr(settings, "bm25_changelog_path", str(tmp_path / "idx.log"))
+    monkeypatch.setattr(settings, "bm25_changelog_max_bytes", 10_000)
+    a, b = _worker(), _worker()
+    cache = ChunkCache(dim=4, max_bytes=1 << 20)
+    monkeypatch.setattr(store_module, "chunk_cache", cache)
+    monkeypatch.setattr(store_module, "bm25_sync", b)
+    VectorStore()  # worker b's store: listens to the log through b
+    heard = []
+    b.add_change_listener(heard.append)
+
+    cache.put_many(["x", "y", "z"], np.ones((3, 4), dtype=np.float32), [{"id": i, "text": i} for i in "xyz"])
+    b.add_many([("y", "local rewrite", None, None)])  # b's own entry: already handled by its writer
+    a.add_many([("x", "rewritten by a", None, None)])
+    a.delete(["z"])
+    b.poll()
+    assert heard == [["x", "z"]]
+    assert set(cache.get_many(["x", "y", "z"])[0]) == {"y"}
+
+    # a compaction by a: b reloads the snapshot without seeing the entries, so everything goes
+    a.add_many([(f"d{i}", f"renewal policy term{i} " * 20, None, None) for i in range(40)])
+    b.poll()
+    assert heard[-1] is None and len(cache) == 0
+    a.stop()
+    b.stop()
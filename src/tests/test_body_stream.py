@@ -0,0 +1,46 @@
+import asyncio
+import json
+
+from src.api.body_stream import BodyError, iter_json_items
+
+_ITEMS = [{"doc": "Policy", "text": f"item {i} with \"quotes\", ] and {{ braces", "n": i} for i in range(20)] + [42, "x"]
+
+async def _chunks(body: bytes, size: int):
+    for i in range(0, len(body), size):
+        yield body[i:i + size]
+
+def _parse(body: bytes, size: int = 7, max_item_bytes: int = 10_000):
+    async def run():
+        return [item async for item in iter_json_items(_chunks(body, size), max_item_bytes)]
+    return asyncio.run(run())
+
+def test_array_and_ndjson_in_any_chunking():
+    array = json.dumps(_ITEMS).encode()
+    ndjson = ("\n".join(json.dumps(x) for x in _ITEMS) + "\n").encode()
+    for size in (1, 5, 64, 1 << 16):
+        assert _parse(array, size) == list(enumerate(_ITEMS))
+        assert _parse(ndjson, size) == list(enumerate(_ITEMS))
+    assert _parse(b"  []  ") == [] and _parse(b"") == []
+
+def test_malformed_input_yields_error_items():
+    out = _parse(b'{"a": 1}\nnot json\n\n{"b": 2}')
+    assert out[0] == (0, {"a": 1}) and isinstance(out[1][1], BodyError) and out[2] == (2, {"b": 2})
+
+    out = _parse(b'[{"a": 1}, {"b": ]')
+    assert out[0] == (0, {"a": 1}) and len(out) == 2 and isinstance(out[1][1], BodyError)
+
+    out = _parse(b'[{"a": 1}')
+    assert out[0] == (0, {"a": 1}) and isinstance(out[1][1], BodyError)
+
+def test_numbers_split_across_chunks():
+    async def run(chunks):
+        async def gen():
+            for c in chunks:
+                yield c
+        return [item async for item in iter_json_items(gen(), 10_000)]
+    assert asyncio.run(run([b"[1.", b"5, 2]"])) == [(0, 1.5), (1, 2)]
+    assert asyncio.run(run([b"[12", b"e", b"-1, -", b"3]"])) == [(0, 1.2), (1, -3)]
+    out = asyncio.run(run([b"[1., 2]"]))
+    assert len(out) == 1 and isinstance(out[0][1], BodyError)
+    out = asyncio.run(run([b'[1, 2x]']))
+    assert out[0] == (0, 1) and isinstance(out[1][1], BodyError)
@@ -0,0 +1,56 @@
+import numpy as np
+
+from src.rag.chunk_cache import _ENTRY_OVERHEAD, ChunkCache
+
+DIM = 4
+
+def _put(cache, ids, text="t"):
+    vecs = np.arange(len(ids) * DIM, dtype=np.float32).reshape(len(ids), DIM) + 1
+    cache.put_many(ids, vecs, [{"id": pid, "text": text} for pid in ids])
+    return dict(zip(ids, vecs))
+
+def _entry(text="t"):
+    return DIM * 4 + len(text) + _ENTRY_OVERHEAD
+
+def test_byte_budget_evicts_least_recently_used():
+    cache = ChunkCache(dim=DIM, max_bytes=3 * _entry())
+    _put(cache, ["a", "b", "c"])
+    cache.get_many(["a"])  # b is now the least recently used
+    _put(cache, ["d"])
+    vecs, _ = cache.get_many(["a", "b", "c", "d"])
+    assert set(vecs) == {"a", "c", "d"} and cache.full and len(cache) == 3
+
+    # one large payload pushes out several small entries
+    big = "x" * (2 * _entry())
+    _put(cache, ["big"], text=big)
+    assert list(cache._slots) == ["big"] and cache._bytes == _entry(big) <= cache.max_bytes
+
+def test_slots_are_reused_after_eviction_and_delete():
+    cache = ChunkCache(dim=DIM, max_bytes=100 * _entry(), dtype="float16")
+    want = _put(cache, [f"p{i}" for i in range(10)])
+    rows = len(cache._mat)
+    cache.delete(["p2", "p5", "missing"])
+    assert len(cache) == 8 and len(cache._free) == 2
+    fresh = _put(cache, ["n1", "n2"])
+    assert not cache._free and len(cache._mat) == rows  # the freed rows, no growth
+    vecs, payloads = cache.get_many(["p3", "n2", "p2"])
+    assert set(vecs) == {"p3", "n2"} and vecs["p3"].dtype == np.float32
+    assert np.array_equal(vecs["p3"], want["p3"]) and np.array_equal(vecs["n2"], fresh["n2"])
+
+    # re-putting an id replaces its row and payload without growing the cache
+    cache.put_many(["p3"], -want["p3"][None], [{"id": "p3", "text": "new"}])
+    vecs, payloads = cache.get_many(["p3"])
+    assert np.array_equal(vecs["p3"], -want["p3"]) and payloads["p3"]["text"] == "new" and len(cache) == 10
+
+def test_update_payloads_and_clear():
+    cache = ChunkCache(dim=DIM, max_bytes=10 * _entry())
+    want = _put(cache, ["a", "b"])
+    cache.update_payloads([{"id": "a", "text": "t", "product": "hosting"}, {"id": "gone", "text": "t"}])
+    vecs, payloads = cache.get_many(["a", "b", "gone"])
+    assert payloads["a"]["product"] == "hosting" and "product" not in payloads["b"]
+    assert np.array_equal(vecs["a"], want["a"]) and "gone" not in vecs  # not cached by an update
+
+    cache.clear()
+    assert len(cache) == 0 and cache._bytes == 0 and cache.get_many(["a", "b"]) == ({}, {})
+    _put(cache, ["c"])
+    assert cache._slots["c"] == 0
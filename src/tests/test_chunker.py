@@ -0,0 +1,75 @@
+from src.rag import chunker
+from src.rag.chunker import chunk_paragraphs, count_tokens
+
+def _sentences(n: int, start: int = 0):
+    return [f"Sentence {i} explains the domain transfer lock policy." for i in range(start, start + n)]
+
+def test_chunks_fit_target_and_overlap():
+    paras = [" ".join(_sentences(3, 3 * i)) for i in range(40)]
+    chunks = chunk_paragraphs(paras, target_tokens=100, overlap_tokens=50)
+    assert len(chunks) > 1
+    assert all(count_tokens(c) <= 100 + 2 for c in chunks)  # + join spaces
+    for prev, cur in zip(chunks, chunks[1:]):
+        # each chunk starts with whole paragraphs from the end of the previous one
+        assert cur.split(" Sentence")[0] in prev
+    # nothing is dropped
+    joined = " ".join(chunks)
+    assert all(p in joined for p in paras)
+
+def test_oversized_paragraph_is_split_at_sentences():
+    huge = " ".join(_sentences(200))
+    chunks = chunk_paragraphs([huge], target_tokens=80, overlap_tokens=0)
+    assert len(chunks) > 10
+    assert all(c.endswith("policy.") for c in chunks)
+    assert all(count_tokens(c) <= 80 + 2 for c in chunks)
+    assert " ".join(chunks) == huge
+
+def test_unit_without_sentence_breaks_is_hard_split():
+    words = " ".join(f"word{i}" for i in range(2000))
+    chunks = chunk_paragraphs([words], target_tokens=50, overlap_tokens=10)
+    assert all(count_tokens(c) <= 50 for c in chunks)
+    assert chunks[0].startswith("word0") and chunks[-1].endswith("word1999")
+
+def _shared(prev: str, cur: str) -> str:
+    """Longest start of cur that prev ends with."""
+    for k in range(len(cur), 0, -1):
+        if prev.endswith(cur[:k]):
+            return cur[:k]
+    return ""
+
+def test_long_paragraphs_still_overlap():
+    # every paragraph is longer than the overlap budget; the last one has no sentence breaks
+    paras = [" ".join(_sentences(6, 6 * i)) for i in range(10)]
+    paras.append(" ".join(f"registrar{i} lock" for i in range(60)))
+    chunks = chunk_paragraphs(paras, target_tokens=150, overlap_tokens=40)
+    assert len(chunks) > 3
+    assert all(count_tokens(p) > 40 for p in paras)
+    for prev, cur in zip(chunks, chunks[1:]):
+        shared = _shared(prev, cur)
+        assert 20 <= count_tokens(shared) <= 40, (prev[-120:], cur[:120])
+        assert count_tokens(cur) <= 150 + 2
+    assert chunks[-1].endswith("registrar59 lock")
+    joined = " ".join(chunks)
+    assert all(p in joined for p in paras[:-1])
+
+class _FakeBPE:
+    """Stand-in for a tiktoken encoding: one token per 3 characters."""
+    def encode(self, text):
+        return [text[i:i + 3] for i in range(0, len(text), 3)]
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+def test_overlap_with_a_bpe_encoding(monkeypatch):
+    monkeypatch.setattr(chunker, "_encoding", lambda: _FakeBPE())
+    count_tokens.cache_clear()
+    try:
+        # the last paragraph is one long "word": hard-split, and overlapped at token boundaries
+        paras = [" ".join(_sentences(4, 4 * i)) for i in range(8)] + ["".join(f"{i:04d}" for i in range(300))]
+        chunks = chunk_paragraphs(paras, target_tokens=120, overlap_tokens=30)
+        assert all(count_tokens(c) <= 120 + 1 for c in chunks)
+        for prev, cur in zip(chunks, chunks[1:]):
+            assert 15 <= count_tokens(_shared(prev, cur)) <= 30
+        assert chunks[-1].endswith("0299")
+    finally:
+        count_tokens.cache_clear()
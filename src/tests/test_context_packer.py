@@ -0,0 +1,43 @@
+import numpy as np
+
+from src.rag.chunker import chunk_paragraphs
+from src.rag.context_packer import pack_context, snippet_ids
+
+def _sentences(n: int, start: int = 0):
+    return [f"Sentence {i} explains the domain transfer lock policy." for i in range(start, start + n)]
+
+def _snippet(pid, text, anchor, score, doc="transfers-1a2b", section="Locks"):
+    return {"id": pid, "score_merged": score,
+            "payload": {"doc": "Transfers", "doc_id": doc, "section": section, "anchor_id": anchor, "text": text}}
+
+def _unit(v):
+    v = np.asarray(v, dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+def test_overlapping_chunks_are_merged_once():
+    chunks = chunk_paragraphs(_sentences(30), target_tokens=100, overlap_tokens=40)
+    assert len(chunks) >= 3
+    hits = [_snippet(f"c{i}", c, f"para-{i + 1:04d}", 1.0 - i / 10) for i, c in enumerate(chunks[:3])]
+    hits.reverse()  # retrieval order is not document order
+    packed = pack_context(hits, budget_tokens=0, vectors={})
+    assert len(packed) == 1
+    assert packed[0]["id"] == "c0" and snippet_ids(packed[0]) == ["c0", "c1", "c2"]
+    text = packed[0]["payload"]["text"]
+    for s in _sentences(30):
+        if any(s in c for c in chunks[:3]):
+            assert text.count(s) == 1
+
+def test_near_duplicates_dropped_and_budget_respected():
+    base = _unit(np.arange(1, 9))
+    hits = [
+        _snippet("a", "Unlock the domain in the control panel.", "para-0001", 0.9, section="A"),
+        _snippet("b", "The domain is unlocked from the control panel.", "para-0007", 0.8, section="B"),
+        _snippet("c", "Transfers need the auth code from the current registrar.", "para-0003", 0.7, doc="other"),
+        _snippet("d", " ".join(_sentences(40)), "para-0004", 0.6, doc="long"),
+    ]
+    vectors = {"a": base, "b": _unit(base + 0.01), "c": _unit(np.arange(8, 0, -1)), "d": _unit(np.ones(8))}
+    packed = pack_context(hits, budget_tokens=120, dup_threshold=0.95, vectors=vectors)
+    assert [sn["id"] for sn in packed] == ["a", "c"]  # b duplicates a, d does not fit
+
+    # the best snippet is kept even if it alone exceeds the budget
+    assert [sn["id"] for sn in pack_context(hits[3:], budget_tokens=10, vectors=vectors)] == ["d"]
@@ -0,0 +1,149 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from src.rag import vector_store as store_module
+from src.rag.bm25_store import BM25Store
+from src.rag.bm25_sync import BM25Sync
+from src.rag.chunk_cache import ChunkCache
+from src.rag.embedded_store import EmbeddedStore
+from src.utils.settings import settings
+
+DIM = 16
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "embedding_dim", DIM)
+    monkeypatch.setattr(settings, "embedded_search_block_rows", 7)  # several blocks
+    # keep the service singletons out of it
+    monkeypatch.setattr(store_module, "chunk_cache", ChunkCache(dim=DIM, max_bytes=0))
+    monkeypatch.setattr(store_module, "bm25_sync", BM25Sync(BM25Store()))
+    s = EmbeddedStore(str(tmp_path / "vectors"))
+    s.ensure_collection()
+    return s
+
+def _points(n, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.standard_normal((n, DIM)).astype(np.float32)
+    ids = [f"p{i}" for i in range(n)]
+    payloads = [{"id": pid, "text": f"chunk {i}", "product": ("domains", "hosting")[i % 2], "lang": "en"}
+                for i, pid in enumerate(ids)]
+    return ids, x, payloads
+
+def _exact(x, q, k, keep=None):
+    x = x / np.linalg.norm(x, axis=1, keepdims=True)
+    s = x @ (q / np.linalg.norm(q))
+    if keep is not None:
+        s[~keep] = -np.inf
+    return [f"p{i}" for i in np.argsort(-s)[:k] if s[i] > -np.inf]
+
+def test_search_matches_exact_with_filters(store):
+    ids, x, payloads = _points(50)
+    store.upsert_many(ids, x, payloads)
+    q = np.random.default_rng(1).standard_normal(DIM).astype(np.float32)
+    hits = store.search(q, top_k=5)
+    assert [h["id"] for h in hits] == _exact(x, q, 5)
+    assert hits[0]["payload"]["text"] == f"chunk {int(hits[0]['id'][1:])}"
+    hosting = np.arange(50) % 2 == 1
+    assert [h["id"] for h in store.search(q, 5, {"product": "hosting"})] == _exact(x, q, 5, hosting)
+    assert store.search(q, 5, {"product": "email"}) == []
+    batch = store.search_batch([q, -q], [3, 60], {"lang": "en"})
+    assert [h["id"] for h in batch[0]] == _exact(x, q, 3) and len(batch[1]) == 50
+
+def test_updates_deletes_and_reopen(store, tmp_path):
+    ids, x, payloads = _points(20)
+    store.upsert(ids, x, payloads)
+    store.delete(["p0", "p1"])
+    store.overwrite_payloads([dict(payloads[2], product="email")])
+    store.upsert(["p2", "new"], x[:2], [dict(payloads[2], product="email"), {"id": "new", "text": "fresh", "lang": "en"}])
+    assert store.count() == 19
+    assert store._n == 20  # "new" reused a deleted row
+
+    # a second handle on the directory (another worker, or a restart) sees the same points
+    other = EmbeddedStore(str(tmp_path / "vectors"))
+    other.ensure_collection()
+    assert other.count() == 19
+    assert [h["id"] for h in other.search(x[0], 1, {"product": "email"})] == ["p2"]
+    pts = other.get_points_by_ids(["new", "p0"])
+    assert list(pts) == ["new"] and np.allclose(pts["new"]["vector"], x[1] / np.linalg.norm(x[1]), atol=1e-6)
+    assert {r["id"] for r in other.scroll_all_texts()} == set(ids[2:]) | {"new"}
+    assert set(other.scroll_text_ids()) == set(ids[2:]) | {"new"}
+
+    # writes through one handle are picked up by the other on its next call
+    other.delete(["new"])
+    assert store.count() == 18
+
+def test_float16_and_dim_check(tmp_path, monkeypatch, store):
+    monkeypatch.setattr(settings, "embedded_store_dtype", "float16")
+    half = EmbeddedStore(str(tmp_path / "half"))
+    half.ensure_collection()
+    ids, x, payloads = _points(30)
+    half.upsert(ids, x, payloads)
+    assert half._mat.dtype == np.float16
+    q = x[3]
+    assert half.search(q, 1)[0]["id"] == "p3"
+
+    monkeypatch.setattr(settings, "embedding_dim", DIM * 2)
+    with pytest.raises(RuntimeError):
+        EmbeddedStore(str(tmp_path / "half")).ensure_collection()
+
+def test_hnsw_graph_build_reopen_and_deletes(store, tmp_path, monkeypatch):
+    pytest.importorskip("hnswlib")
+    monkeypatch.setattr(settings, "embedded_hnsw_min_points", 1)
+    ids, x, payloads = _points(200)
+    store.upsert_many(ids, x, payloads)
+    queries = np.random.default_rng(2).standard_normal((10, DIM)).astype(np.float32)
+    got = store.search_batch(queries, [5] * 10)
+    assert store._graph is not None
+    assert all([h["id"] for h in hits] == _exact(x, q, 5) for hits, q in zip(got, queries))
+
+    # deleted points leave the graph results; a write after the build goes into the graph
+    store.delete(["p3", "p7"])
+    assert [h["id"] for h in store.search(x[3], 3)] == _exact(x, x[3], 4)[1:]
+    assert "p7" not in [h["id"] for h in store.search(x[7], 10, {"product": "hosting"})]
+    store.upsert(["p3"], x[3:4], payloads[3:4])  # reuses a row marked deleted in the graph
+    assert store.search(x[3], 1)[0]["id"] == "p3"
+
+    # the graph is not persisted: a second handle rebuilds it from the stored vectors
+    other = EmbeddedStore(str(tmp_path / "vectors"))
+    other.ensure_collection()
+    assert other._graph is None and other.count() == 199
+    assert other.search(x[3], 1)[0]["id"] == "p3"
+    assert other._graph is not None and "p7" not in [h["id"] for h in other.search(x[7], 10)]
+    assert [h["id"] for h in other.search(x[9], 3, {"product": "hosting"})] == _exact(
+        x, x[9], 3, (np.arange(200) % 2 == 1) & (np.arange(200) != 7))
+
+def test_exact_search_runs_outside_the_lock(store, monkeypatch):
+    ids, x, payloads = _points(50)
+    store.upsert_many(ids, x, payloads)
+    exact, calls = store._exact, []
+
+    def scoring(q, k, mask, mat=None):
+        calls.append(store._tlock._is_owned())
+        if len(calls) == 1:  # a write lands while the first search scores
+            store.upsert(["p0"], -x[:1], payloads[:1])
+        return exact(q, k, mask, mat)
+
+    monkeypatch.setattr(store, "_exact", scoring)
+    assert store.search(-x[0], 1)[0]["id"] == "p0"  # scored again after the write
+    assert calls == [False, True]
+    assert store.search(x[1], 1)[0]["id"] == "p1" and calls[2:] == [False]
+
+def test_async_reads_run_off_the_event_loop(store):
+    ids, x, payloads = _points(5)
+    store.upsert(ids, x, payloads)
+    threads = []
+    fetch = store.get_points_by_ids
+
+    def tracked(wanted):
+        threads.append(threading.get_ident())
+        return fetch(wanted)
+    store.get_points_by_ids = tracked
+
+    async def run():
+        return await store.aget_points_by_ids(["p1", "nope"]), await store.aget_vectors_by_ids(["p2"])
+    points, vecs = asyncio.run(run())
+    assert list(points) == ["p1"] and list(vecs) == ["p2"]
+    assert len(threads) == 2 and threading.get_ident() not in threads
@@ -0,0 +1,169 @@
+import asyncio
+import base64
+from types import SimpleNamespace
+
+import numpy as np
+
+from src.rag import embedding
+from src.rag.embedding import _ENTRY_OVERHEAD, EmbeddingBatcher, EmbeddingCache
+from src.utils.settings import settings
+
+def _vec(seed, dim=8):
+    return np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_memory_tier_ttl_and_byte_budget(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(embedding.time, "monotonic", clock)
+    entry = _vec(0).nbytes + _ENTRY_OVERHEAD
+    cache = EmbeddingCache(max_bytes=3 * entry, ttl_s=60)
+    cache.put_many([(k, _vec(i)) for i, k in enumerate("abc")])
+    assert set(cache.get_many(["a", "b", "c"])) == {"a", "b", "c"}
+
+    # over budget: the least recently used entry goes ("a" was read before "b" and "c")
+    cache.get_many(["b", "c"])
+    cache.put_many([("d", _vec(3))])
+    assert set(cache.get_many(list("abcd"))) == {"b", "c", "d"}
+    assert cache._bytes == 3 * entry
+
+    clock.now += 61
+    assert cache.get_many(["b", "c", "d"]) == {}
+    assert cache._bytes == 0 and not cache._mem
+
+def test_disk_tier_survives_a_cleared_memory_tier(tmp_path):
+    path = str(tmp_path / "emb.sqlite")
+    cache = EmbeddingCache(max_bytes=1 << 20, ttl_s=60, path=path)
+    cache.put_many([("a", _vec(0)), ("b", _vec(1))])
+
+    # a new process: empty memory tier, same file
+    again = EmbeddingCache(max_bytes=1 << 20, ttl_s=60, path=path)
+    found = again.get_many(["a", "b", "missing"])
+    assert set(found) == {"a", "b"} and np.array_equal(found["a"], _vec(0))
+    assert set(again._mem) == {"a", "b"}  # promoted to memory
+
+    # a zero byte budget keeps nothing in memory, every hit comes from disk
+    cold = EmbeddingCache(max_bytes=0, ttl_s=60, path=path)
+    assert np.array_equal(cold.get_many(["b"])["b"], _vec(1)) and not cold._mem
+
+def test_keys_separate_models_and_dimensions(monkeypatch):
+    calls = []
+
+    def create(input, **kwargs):
+        calls.append(kwargs)
+        dim = kwargs.get("dimensions", 8)
+        return SimpleNamespace(data=[SimpleNamespace(embedding=base64.b64encode(_vec(len(t), dim).tobytes()))
+                                     for t in input])
+
+    client = SimpleNamespace(embeddings=SimpleNamespace(create=create))
+    monkeypatch.setattr(embedding, "openai_client", lambda: client)
+    monkeypatch.setattr(embedding, "embedding_cache", EmbeddingCache(max_bytes=1 << 20, ttl_s=60))
+    monkeypatch.setattr(embedding, "_NATIVE_DIMS", {"small": 8, "large": 8})
+    monkeypatch.setattr(settings, "embedding_model", "small")
+    monkeypatch.setattr(settings, "embedding_dim", 8)
+
+    assert embedding.embed_texts(["dns  record", "dns record"]).shape == (2, 8)
+    assert embedding.embed_texts(["dns record"]).shape == (1, 8)  # normalized text: cached
+    assert len(calls) == 1
+
+    monkeypatch.setattr(settings, "embedding_dim", 4)  # shortened vectors of the same model
+    assert embedding.embed_texts(["dns record"]).shape == (1, 4)
+    assert calls[-1] == {"model": "small", "encoding_format": "base64", "dimensions": 4}
+
+    monkeypatch.setattr(settings, "embedding_model", "large")
+    monkeypatch.setattr(settings, "embedding_dim", 8)
+    embedding.embed_texts(["dns record"])
+    assert len(calls) == 3 and calls[-1]["model"] == "large"
+    assert embedding._cache_model() == "large"
+
+def _response(texts, dim=8):
+    return SimpleNamespace(data=[SimpleNamespace(embedding=base64.b64encode(_vec(len(t), dim).tobytes()))
+                                 for t in texts])
+
+class StubClient:
+    """Async embeddings API: records each request; texts in `hold` wait for `release`."""
+    def __init__(self, hold=()):
+        self.requests, self.hold, self.release = [], set(hold), asyncio.Event()
+        self.embeddings = SimpleNamespace(create=self.create)
+
+    async def create(self, input, **kwargs):
+        self.requests.append(list(input))
+        if self.hold & set(input):
+            await self.release.wait()
+        return _response(input)
+
+def _batcher(monkeypatch, client, **kw):
+    monkeypatch.setattr(embedding, "aopenai_client", lambda: client)
+    args = dict(window_ms=20, max_size=64, max_queue=64, max_inflight=4, timeout_s=5)
+    return EmbeddingBatcher(**dict(args, **kw))
+
+def test_concurrent_callers_share_one_request(monkeypatch):
+    client = StubClient()
+    batcher = _batcher(monkeypatch, client)
+
+    async def run():
+        rows = await asyncio.gather(*(batcher.submit(t) for t in ["whois", "dns", "whois", "ssl"]))
+        await batcher.close()
+        return rows
+    rows = asyncio.run(run())
+    assert client.requests == [["whois", "dns", "ssl"]]
+    assert np.array_equal(rows[0], rows[2]) and np.isclose(np.linalg.norm(rows[1]), 1)
+
+def test_a_timeout_fails_only_its_own_batch(monkeypatch):
+    client = StubClient(hold=["slow"])
+    batcher = _batcher(monkeypatch, client, window_ms=1, max_size=1, timeout_s=0.05)
+
+    async def run():
+        slow = asyncio.ensure_future(batcher.submit("slow"))
+        await asyncio.sleep(0.01)
+        fast = await batcher.submit("fast")
+        results = await asyncio.gather(slow, return_exceptions=True)
+        again = await batcher.submit("after")
+        await batcher.close()
+        return fast, results[0], again
+    fast, slow, again = asyncio.run(run())
+    assert isinstance(slow, asyncio.TimeoutError)
+    assert fast.shape == (8,) and again.shape == (8,)
+
+def test_full_queue_blocks_callers_until_batches_finish(monkeypatch):
+    client = StubClient(hold=["t0"])
+    batcher = _batcher(monkeypatch, client, window_ms=1, max_size=1, max_queue=2, max_inflight=1)
+
+    async def run():
+        tasks = [asyncio.ensure_future(batcher.submit(f"t{i}")) for i in range(6)]
+        await asyncio.sleep(0.05)
+        # t0 in flight, t1 held by the collector waiting for a permit, t2 and t3 queued,
+        # t4 and t5 blocked on put
+        assert client.requests == [["t0"]] and batcher._queue.full()
+        assert len(batcher._waiting) == 5 and not any(t.done() for t in tasks)
+        client.release.set()
+        rows = await asyncio.gather(*tasks)
+        await batcher.close()
+        return rows
+    assert len(asyncio.run(run())) == 6
+    assert client.requests == [[f"t{i}"] for i in range(6)]
+
+def test_close_finishes_sent_batches_and_fails_the_rest(monkeypatch):
+    client = StubClient(hold=["sent"])
+    batcher = _batcher(monkeypatch, client, window_ms=1, max_size=1, max_queue=1, max_inflight=1)
+
+    async def run():
+        sent = asyncio.ensure_future(batcher.submit("sent"))
+        await asyncio.sleep(0.01)
+        pending = [asyncio.ensure_future(batcher.submit(t)) for t in ("a", "b", "c")]
+        await asyncio.sleep(0.01)
+        closing = asyncio.ensure_future(batcher.close())
+        await asyncio.sleep(0.01)
+        assert not closing.done()  # waits for the batch in flight
+        client.release.set()
+        await closing
+        return await asyncio.gather(sent, *pending, return_exceptions=True)
+    sent, *pending = asyncio.run(run())
+    assert sent.shape == (8,)
+    assert all(isinstance(e, RuntimeError) and "closed" in str(e) for e in pending)
+    assert client.requests == [["sent"]]
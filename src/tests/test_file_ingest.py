@@ -0,0 +1,168 @@
+from concurrent.futures import Future
+from pathlib import Path
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from src.api import main
+from src.rag import file_ingest, vector_store as store_module
+from src.rag.bm25_store import BM25Store
+from src.rag.bm25_sync import BM25Sync
+from src.rag.chunk_cache import ChunkCache
+from src.rag.embedded_store import EmbeddedStore
+from src.rag.file_ingest import _iter_lines, _split_into_sections, build_payloads_from_file
+from src.rag.ingest_manifest import IngestManifest
+from src.utils.settings import settings
+
+DATA = Path(__file__).resolve().parents[2] / "data"
+
+def test_html_blocks_and_headings_stream_as_sections(tmp_path):
+    page = tmp_path / "policy.html"
+    page.write_text(
+        "<html><head><title>Policy</title><style>p {color: red}</style><script>var x = 1;</script></head>"
+        "<body><h1>Suspension</h1><p>A domain may be <b>suspended</b> for abuse.</p>"
+        "<div>Loose text<p>Nested paragraph.</p>after</div>"
+        "<h2>Reactivation</h2><ul><li>Verify identity.</li><li>Update WHOIS.</li></ul></body></html>"
+    )
+    sections = _split_into_sections("\n".join(_iter_lines(page)))
+    assert sections == [
+        ("INTRO", ["Policy"]),
+        ("Suspension", ["A domain may be suspended for abuse.", "Nested paragraph.", "Loose text after"]),
+        ("Reactivation", ["Verify identity.", "Update WHOIS."]),
+    ]
+
+def test_pdf_is_read_page_by_page():
+    text = "\n".join(_iter_lines(DATA / "abuse_escalation_guide.pdf"))
+    assert "Abuse Escalation Guide" in text and "escalate to the abuse team" in text
+
+def test_payloads_keep_sections_and_deterministic_ids():
+    a = build_payloads_from_file(DATA / "domain_suspension_policy.md")
+    b = build_payloads_from_file(DATA / "domain_suspension_policy.md")
+    assert [p["id"] for p in a] == [p["id"] for p in b]
+    assert a[0]["section"] == "4.2 Reasons for Suspension"
+    assert [p["anchor_id"] for p in a] == [f"para-{i:04d}" for i in range(1, len(a) + 1)]
+
+@pytest.fixture
+def ingest_env(tmp_path, monkeypatch):
+    """ingest_file/ingest_folder against an embedded store, a fresh manifest and fake embeddings."""
+    monkeypatch.setattr(settings, "embedding_dim", 8)
+    bm25 = BM25Store()
+    monkeypatch.setattr(store_module, "chunk_cache", ChunkCache(dim=8, max_bytes=0))
+    monkeypatch.setattr(store_module, "bm25_sync", BM25Sync(bm25))
+    store = EmbeddedStore(str(tmp_path / "vectors"))
+    monkeypatch.setattr(file_ingest, "vector_store", store)
+    monkeypatch.setattr(file_ingest, "ingest_manifest", IngestManifest(str(tmp_path / "manifest.json")))
+    monkeypatch.setattr(file_ingest, "embed_texts", lambda texts: np.ones((len(texts), 8), dtype=np.float32))
+    return store, bm25
+
+def test_same_name_uploads_stay_separate(ingest_env, tmp_path, monkeypatch):
+    store, bm25 = ingest_env
+    monkeypatch.setattr(settings, "ingest_upload_dir", str(tmp_path))
+
+    def run_inline(path, product, lang, source):
+        done = Future()
+        done.set_result(file_ingest.ingest_file(path, product=product, lang=lang, source=source))
+        return done
+    monkeypatch.setattr(main.ingest_jobs, "run", run_inline)
+    client = TestClient(main.app)
+
+    def upload(text, **params):
+        files = {"file": ("faq.md", f"# FAQ\n\n{text}\n".encode(), "text/markdown")}
+        return client.post("/ingest-file", params=dict(params, background="false"), files=files).json()
+
+    first = upload("Remove the transfer lock before moving the domain.")
+    second = upload("Mailbox quota can be raised in the hosting panel.", product="hosting")
+    assert first["ok"] and second["ok"] and second.get("deleted", 0) == 0
+    assert upload("Remove the transfer lock before moving the domain.")["skipped"]  # identical re-upload
+    assert [h["id"] for h in bm25.search("transfer lock")] and [h["id"] for h in bm25.search("mailbox quota")]
+    assert store.count() == first["chunks"] + second["chunks"]
+
+    # without a source_id, changed content is another document: nothing is replaced
+    changed = upload("Remove the registrar lock before moving the domain.")
+    assert changed["ok"] and changed["deleted"] == 0 and bm25.search("transfer lock") and bm25.search("registrar")
+
+    # under a caller source_id, a new version replaces the old one
+    upload("Renewal grace period is 30 days.", source_id="kb/faq")
+    replaced = upload("Redemption period is 30 days.", source_id="kb/faq")
+    assert replaced["deleted"] == 1
+    assert not bm25.search("renewal grace") and bm25.search("redemption")
+    assert bm25.search("transfer lock") and bm25.search("mailbox quota")
+
+def _docs(folder, count, sections=3):
+    folder.mkdir(exist_ok=True)
+    for i in range(count):
+        (folder / f"doc{i}.md").write_text("\n\n".join(
+            f"# Section {j}\n\nPart {j} of document {i} about nameserver glue records." for j in range(sections)))
+
+def test_folder_pipeline_isolates_failing_files(ingest_env, tmp_path, monkeypatch):
+    store, _ = ingest_env
+    monkeypatch.setattr(settings, "ingest_parse_workers", 2)
+    monkeypatch.setattr(settings, "ingest_batch_size", 1)  # one embed/upsert batch per chunk
+    folder = tmp_path / "kb"
+    _docs(folder, 4)
+    (folder / "broken.pdf").write_bytes(b"not a pdf")  # fails to parse
+    (folder / "poison.md").write_text("# Poison\n\nBOOM section")  # fails to embed
+
+    def embed(texts):
+        if any("BOOM" in t for t in texts):
+            raise ConnectionError("embedding API down")
+        return np.ones((len(texts), 8), dtype=np.float32)
+    monkeypatch.setattr(file_ingest, "embed_texts", embed)
+
+    stats = {}
+    results = {Path(r["file"]).name: r for r in file_ingest.ingest_folder(folder, stats=stats)}
+    assert not results["broken.pdf"]["ok"] and "PDF" in results["broken.pdf"]["error"]
+    assert not results["poison.md"]["ok"] and "down" in results["poison.md"]["error"]
+    assert all(results[f"doc{i}.md"]["ok"] and results[f"doc{i}.md"]["embedded"] == 3 for i in range(4))
+    assert stats["files"] == 6 and stats["parse"]["items"] == 5  # the broken PDF never finished parsing
+    assert stats["embed"]["items"] == 12 and stats["upsert"]["items"] == 12
+    assert store.count() == 12 and "poison.md" not in str(file_ingest.ingest_manifest._files)
+
+def test_folder_reingest_follows_the_manifest(ingest_env, tmp_path, monkeypatch):
+    store, bm25 = ingest_env
+    monkeypatch.setattr(settings, "ingest_parse_workers", 2)
+    folder = tmp_path / "kb"
+    _docs(folder, 3)
+    assert all(r["embedded"] == 3 for r in file_ingest.ingest_folder(folder))
+
+    embedded = []
+    monkeypatch.setattr(file_ingest, "embed_texts",
+                        lambda texts: embedded.extend(texts) or np.ones((len(texts), 8), dtype=np.float32))
+    assert all(r.get("skipped") for r in file_ingest.ingest_folder(folder)) and not embedded
+
+    # doc0: one section rewritten; doc1: removed from the folder
+    doc0 = folder / "doc0.md"
+    before = set(file_ingest.ingest_manifest.get(str(doc0.resolve()))["chunks"])
+    doc0.write_text(doc0.read_text().replace("Part 1 of document 0", "Registry lock of document 0"))
+    (folder / "doc1.md").unlink()
+    stats = {}
+    results = {Path(r["file"]).name: r for r in file_ingest.ingest_folder(folder, stats=stats)}
+    assert results["doc0.md"]["embedded"] == 1 and results["doc0.md"]["deleted"] == 1
+    assert results["doc1.md"] == dict(results["doc1.md"], ok=True, removed=True, deleted=3)
+    assert results["doc2.md"]["skipped"] and stats["removed"] == 1
+    assert len(embedded) == 1 and "Registry lock" in embedded[0]
+    assert store.count() == 6 and len(bm25) == 6
+    (replaced,) = before - set(file_ingest.ingest_manifest.get(str(doc0.resolve()))["chunks"])
+    assert replaced not in bm25 and not store.get_points_by_ids([replaced])
+    assert bm25.search("registry lock")[0]["id"] not in before
+    assert not [s for s in file_ingest.ingest_manifest.sources() if s.endswith("doc1.md")]
+
+def test_streamed_ingest_failure_removes_its_partial_chunks(ingest_env, tmp_path, monkeypatch):
+    store, _ = ingest_env
+    _docs(tmp_path / "kb", 1, sections=5)
+    path = tmp_path / "kb" / "doc0.md"
+    build = file_ingest.iter_payloads_from_file
+
+    def truncated(*args):
+        for i, p in enumerate(build(*args)):
+            if i == 3:
+                raise ValueError("parser gave up")
+            yield p
+    monkeypatch.setattr(file_ingest, "iter_payloads_from_file", truncated)
+    with pytest.raises(ValueError):
+        file_ingest.ingest_file(path, batch=1)
+    assert store.count() == 0 and file_ingest.ingest_manifest.get(str(path.resolve())) is None
+
+    monkeypatch.setattr(file_ingest, "iter_payloads_from_file", build)
+    assert file_ingest.ingest_file(path, batch=1)["embedded"] == 5 and store.count() == 5
@@ -0,0 +1,50 @@
+import numpy as np
+
+from src.rag.merged_retriever import _collect, _fuse, fuse_rrf, top_k_indices
+
+def _legacy_fuse(cand, q_vec, vecs, top_k, alpha):
+    # the list-based fusion that _fuse replaced
+    def norm(values):
+        vmin, vmax = min(values), max(values)
+        if vmax == vmin:
+            return [1.0 for _ in values]
+        return [(v - vmin) / (vmax - vmin) for v in values]
+    for pid, v in cand.items():
+        if "semantic" not in v:
+            vec = vecs.get(pid)
+            v["semantic"] = float(np.dot(q_vec, np.array(vec, dtype=np.float32))) if vec is not None else 0.0
+    sem = norm([v.get("semantic", 0.0) for v in cand.values()])
+    bm = norm([v.get("bm25", 0.0) for v in cand.values()])
+    for v, s, b in zip(cand.values(), sem, bm):
+        v["score_merged"] = alpha * s + (1 - alpha) * b
+    return sorted(cand.values(), key=lambda x: x["score_merged"], reverse=True)[:top_k]
+
+def _fixture(seed: int = 3, dim: int = 16):
+    rng = np.random.default_rng(seed)
+    q_vec = rng.normal(size=dim).astype(np.float32)
+    sem_hits = [{"id": f"s{i}", "score": float(rng.random()), "payload": {}} for i in range(40)]
+    bm25_hits = [{"id": f"s{i}", "bm25": float(rng.random() * 10)} for i in range(30, 45)]
+    bm25_hits += [{"id": f"b{i}", "bm25": float(rng.random() * 10)} for i in range(25)]
+    vecs = {f"b{i}": rng.normal(size=dim).tolist() for i in range(24)}  # b24 has no vector
+    return q_vec, sem_hits, bm25_hits, vecs
+
+def test_minmax_matches_legacy_fusion():
+    q_vec, sem_hits, bm25_hits, vecs = _fixture()
+    got = _fuse(_collect(sem_hits, bm25_hits), q_vec, vecs, top_k=10, alpha=0.7)
+    want = _legacy_fuse(_collect(sem_hits, bm25_hits), q_vec, vecs, top_k=10, alpha=0.7)
+    assert [h["id"] for h in got] == [h["id"] for h in want]
+    assert np.allclose([h["score_merged"] for h in got], [h["score_merged"] for h in want], atol=1e-6)
+
+def test_strategies_return_sorted_top_k():
+    q_vec, sem_hits, bm25_hits, vecs = _fixture()
+    for fusion in ("minmax", "rrf", "zscore"):
+        hits = _fuse(_collect(sem_hits, bm25_hits), q_vec, vecs, top_k=8, alpha=0.5, fusion=fusion)
+        scores = [h["score_merged"] for h in hits]
+        assert len(hits) == 8 and scores == sorted(scores, reverse=True)
+
+def test_rrf_prefers_candidates_in_both_lists():
+    sem = np.array([0.9, 0.8, 0.1])
+    bm25 = np.array([0.0, 5.0, 4.0])
+    in_bm25 = np.array([False, True, True])
+    scores = fuse_rrf(sem, bm25, in_bm25, alpha=0.5)
+    assert top_k_indices(scores, 1)[0] == 1
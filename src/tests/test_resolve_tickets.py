@@ -0,0 +1,138 @@
+import asyncio
+import json
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from src.api import main
+from src.api.body_stream import BodyError
+from src.api.schemas import TicketResponse
+from src.core import orchestrator
+from src.core.answer_cache import AnswerCache
+from src.utils.settings import settings
+
+def _collect(items):
+    async def source():
+        for item in items:
+            yield item
+
+    async def run():
+        return [r async for r in orchestrator.resolve_tickets(source())]
+    return asyncio.run(run())
+
+def test_results_stream_per_ticket_with_isolated_errors(monkeypatch):
+    calls = {"embed": 0, "search": 0}
+
+    async def embed(texts):
+        calls["embed"] += 1
+        return np.ones((len(texts), 4), dtype=np.float32)
+
+    async def search(queries, top_ks, alpha=0.7, q_vecs=None):
+        calls["search"] += 1
+        assert len(q_vecs) == len(queries)
+        return [[{"id": f"sn-{q[-1]}", "payload": {"doc": "Policy", "section": "1", "text": q}}] for q in queries]
+
+    async def llm(messages, kind="answer"):
+        prompt = messages[-1]["content"]
+        if "ticket two" in prompt:
+            raise RuntimeError("upstream timeout")
+        if "ticket one" in prompt:
+            await asyncio.sleep(0.05)  # finishes after ticket three
+        return ('{"answer": "Please update your WHOIS details.", "references": ["Policy · 1 · sn-x"], '
+                '"action_required": "no_escalation_needed"}')
+
+    monkeypatch.setattr(orchestrator, "aembed_texts", embed)
+    monkeypatch.setattr(orchestrator, "asearch_merged_batch", search)
+    monkeypatch.setattr(orchestrator, "_acall_llm", llm)
+    monkeypatch.setattr(orchestrator.settings, "resolve_batch_size", 2)
+
+    out = _collect([
+        (0, {"ticket_text": "batch ticket one", "id": "T-1"}),
+        (1, "batch ticket two"),
+        (2, {"ticket_text": "no"}),
+        (3, BodyError("invalid JSON")),
+        (4, "batch ticket three"),
+    ])
+    summary = out.pop()["summary"]
+    by_index = {r["index"]: r for r in out}
+    assert [r["index"] for r in out].index(4) < [r["index"] for r in out].index(0)  # completion order
+    assert by_index[0]["ok"] and by_index[0]["id"] == "T-1"
+    assert by_index[0]["result"]["references"] == ["Policy · 1 · sn-e"]  # unknown reference replaced
+    assert not by_index[1]["ok"] and "upstream timeout" in by_index[1]["error"]
+    assert not by_index[2]["ok"] and "ticket_text" in by_index[2]["error"]
+    assert not by_index[3]["ok"] and by_index[4]["ok"]
+    assert summary["count"] == 5 and summary["failed"] == 3 and summary["tickets_per_min"] > 0
+    assert calls == {"embed": 2, "search": 2}  # one embed and one search per wave of two
+
+def test_retrieval_failure_fails_only_its_wave(monkeypatch):
+    async def embed(texts):
+        if any("broken" in t for t in texts):
+            raise RuntimeError("embeddings unavailable")
+        return np.ones((len(texts), 4), dtype=np.float32)
+
+    async def search(queries, top_ks, alpha=0.7, q_vecs=None):
+        return [[{"id": "sn-1", "payload": {"doc": "Policy", "section": "1"}}] for _ in queries]
+
+    async def llm(messages, kind="answer"):
+        return ('{"answer": "Your refund is being processed.", "references": [], '
+                '"action_required": "no_escalation_needed"}')
+
+    monkeypatch.setattr(orchestrator, "aembed_texts", embed)
+    monkeypatch.setattr(orchestrator, "asearch_merged_batch", search)
+    monkeypatch.setattr(orchestrator, "_acall_llm", llm)
+    monkeypatch.setattr(orchestrator.settings, "resolve_batch_size", 1)
+
+    out = _collect([(0, "broken wave ticket"), (1, "refund for my renewal")])
+    assert out[-1]["summary"]["failed"] == 1
+    by_index = {r["index"]: r for r in out[:-1]}
+    assert "retrieval failed" in by_index[0]["error"] and by_index[1]["ok"]
+
+def test_cached_answers_survive_a_failed_wave_once(monkeypatch):
+    cache = AnswerCache(max_entries=8, ttl_s=60, semantic_threshold=0.95)
+    known = np.array([1, 0, 0, 0], dtype=np.float32)
+    cache.put("k", TicketResponse(answer="Renewals run 30 days before expiry.", references=[],
+                                  action_required="no_escalation_needed"), [], known)
+
+    async def embed(texts):
+        return np.array([known if "renew" in t else [0, 1, 0, 0] for t in texts], dtype=np.float32)
+
+    async def search(queries, top_ks, alpha=0.7, q_vecs=None):
+        assert queries == ["where is my refund"]  # the cached ticket is not retrieved
+        raise RuntimeError("search unavailable")
+
+    monkeypatch.setattr(orchestrator, "answer_cache", cache)
+    monkeypatch.setattr(orchestrator, "aembed_texts", embed)
+    monkeypatch.setattr(orchestrator, "asearch_merged_batch", search)
+
+    out = _collect([(0, {"ticket_text": "when do renewals happen", "id": "T-9"}), (1, "where is my refund")])
+    summary = out.pop()["summary"]
+    assert sorted(r["index"] for r in out) == [0, 1]  # one line per ticket
+    by_index = {r["index"]: r for r in out}
+    assert by_index[0]["ok"] and by_index[0]["id"] == "T-9"
+    assert by_index[0]["result"]["answer"].startswith("Renewals")
+    assert not by_index[1]["ok"] and "search unavailable" in by_index[1]["error"]
+    assert summary["count"] == 2 and summary["failed"] == 1
+
+def test_endpoint_spools_large_bodies_off_the_event_loop(monkeypatch):
+    monkeypatch.setattr(settings, "resolve_batch_spool_bytes", 64)
+    monkeypatch.setattr(settings, "ingest_upload_chunk_bytes", 16)
+    offloaded = []
+    to_thread = asyncio.to_thread
+
+    async def tracked(fn, *args):
+        offloaded.append(fn.__name__)
+        return await to_thread(fn, *args)
+
+    async def echo(items):
+        async for idx, value in items:
+            yield {"index": idx, "ok": True, "result": value}
+    monkeypatch.setattr(main.asyncio, "to_thread", tracked)
+    monkeypatch.setattr(main, "resolve_tickets", echo)
+    tickets = [f"ticket number {i} about a transfer" for i in range(10)]
+
+    client = TestClient(main.app)
+    small = client.post("/resolve-tickets", content=json.dumps(tickets[:1]))
+    assert [json.loads(l)["result"] for l in small.text.splitlines()] == tickets[:1] and not offloaded
+    big = client.post("/resolve-tickets", content="\n".join(json.dumps(t) for t in tickets))
+    assert [json.loads(l)["result"] for l in big.text.splitlines()] == tickets
+    assert {"write", "read"} <= set(offloaded)
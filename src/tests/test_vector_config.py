@@ -0,0 +1,35 @@
+from qdrant_client.http import models as qm
+
+from src.rag import embedding
+from src.rag.qdrant_store import search_params, vectors_config
+from src.utils.settings import settings
+
+def test_default_layout_is_plain_float32(monkeypatch):
+    monkeypatch.setattr(settings, "embedding_dim", 1536)
+    cfg = vectors_config()
+    assert cfg.size == 1536 and cfg.distance == qm.Distance.COSINE
+    assert cfg.on_disk is None and cfg.hnsw_config is None and cfg.quantization_config is None
+    assert search_params() is None
+
+def test_quantized_on_disk_layout(monkeypatch):
+    monkeypatch.setattr(settings, "qdrant_quantization", "scalar")
+    monkeypatch.setattr(settings, "qdrant_on_disk", True)
+    monkeypatch.setattr(settings, "qdrant_hnsw_m", 32)
+    cfg = vectors_config()
+    assert cfg.on_disk is True and cfg.hnsw_config.m == 32 and cfg.hnsw_config.ef_construct is None
+    assert cfg.quantization_config.scalar.type == qm.ScalarType.INT8
+    params = search_params()
+    assert params.quantization.rescore is True and params.quantization.oversampling == 2.0
+
+    monkeypatch.setattr(settings, "qdrant_quantization", "binary")
+    assert isinstance(vectors_config().quantization_config, qm.BinaryQuantization)
+
+def test_shortened_embeddings_request_dimensions(monkeypatch):
+    monkeypatch.setattr(settings, "embedding_model", "text-embedding-3-small")
+    monkeypatch.setattr(settings, "embedding_dim", 1536)
+    assert "dimensions" not in embedding._create_kwargs()
+    assert embedding._cache_model() == "text-embedding-3-small"
+
+    monkeypatch.setattr(settings, "embedding_dim", 512)
+    assert embedding._create_kwargs()["dimensions"] == 512
+    assert embedding._cache_model() == "text-embedding-3-small@512"
@@ -0,0 +1,169 @@
+import asyncio
+import re
+import threading
+
+from src.rag import merged_retriever
+from src.rag.bm25_store import BM25Store
+from src.rag.bm25_sync import BM25Sync
+from src.rag.file_ingest import _now_iso
+from src.rag.vector_store import VectorStore
+from src.rag.warmup import Warmup
+from src.utils.settings import settings
+
+class FlakyStore(VectorStore):
+    """Unreachable for the first `failures` ensure_collection calls."""
+    def __init__(self, rows, failures=0):
+        super().__init__()
+        self.rows, self.failures, self.calls, self.scrolls = rows, failures, 0, 0
+
+    def ensure_collection(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError("connection refused")
+
+    def count(self):
+        return len(self.rows)
+
+    def scroll_all_texts(self, batch=512, updated_since=None):
+        self.scrolls += 1
+        return [r for r in self.rows if not updated_since or (r["updated_at"] or "") >= updated_since]
+
+    def scroll_text_ids(self, batch=1024):
+        return [r["id"] for r in self.rows]
+
+    def get_points_by_ids(self, ids):
+        return {r["id"]: {"vector": None, "payload": {"id": r["id"], "text": r["text"], "updated_at": r["updated_at"]}}
+                for r in self.rows if r["id"] in ids}
+
+    def warm_cache(self, batch=256):
+        return len(self.rows)
+
+def _rows(n):
+    return [{"id": f"c{i}", "text": f"domain transfer step {i}", "updated_at": None, "fields": {}} for i in range(n)]
+
+def _settings(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "bm25_snapshot_dir", str(tmp_path / "idx"))
+    monkeypatch.setattr(settings, "bm25_changelog_path", str(tmp_path / "idx.log"))
+    monkeypatch.setattr(settings, "startup_retry_initial_s", 0.01)
+
+def test_warmup_retries_store_then_builds_bm25(tmp_path, monkeypatch):
+    _settings(tmp_path, monkeypatch)
+    w = Warmup(FlakyStore(_rows(5), failures=2), BM25Sync(BM25Store()))
+    monkeypatch.setattr(merged_retriever, "warmup", w)
+    monkeypatch.setattr(merged_retriever, "bm25_store", w.sync.store)
+
+    async def run():
+        w.start()
+        assert w.report() == dict(w.report(), ready=False, degraded=False)
+        assert merged_retriever._bm25_search("transfer", 3, None) == []  # vector-only meanwhile
+        assert merged_retriever._bm25_search_many(["a", "b"], [1, 1], None) == [[], []]
+        await w._task
+
+    try:
+        asyncio.run(run())
+    finally:
+        w.sync.stop()
+    report = w.report()
+    assert report["ready"] and not report["degraded"]
+    assert report["vector_store"]["status"] == "ready" and report["vector_store"]["attempts"] == 3
+    assert report["bm25"]["status"] == "ready" and report["bm25"]["indexed"] == 5
+    assert report["chunk_cache"]["status"] in ("ready", "skipped")
+    assert len(merged_retriever._bm25_search("transfer", 3, None)) == 3
+
+def test_warmup_reuses_snapshot_and_stops_on_config_error(tmp_path, monkeypatch):
+    _settings(tmp_path, monkeypatch)
+    first = Warmup(FlakyStore(_rows(3)), BM25Sync(BM25Store()))
+    try:
+        asyncio.run(first.run())
+    finally:
+        first.sync.stop()
+
+    again = Warmup(FlakyStore(_rows(3)), BM25Sync(BM25Store()))
+    try:
+        asyncio.run(again.run())
+    finally:
+        again.sync.stop()
+    assert again.report()["bm25"]["status"] == "ready" and "c2" in again.sync.store
+    assert again.store.scrolls == 0  # loaded from the snapshot, not rebuilt
+
+    class Mismatch(FlakyStore):
+        def ensure_collection(self):
+            raise RuntimeError("collection has 8-d vectors, EMBEDDING_DIM is 16")
+
+    bad = Warmup(Mismatch([]), BM25Sync(BM25Store()))
+    asyncio.run(bad.run())
+    assert bad.report()["ready"] is False and bad.state["vector_store"]["status"] == "failed"
+
+def test_warmup_reconciles_snapshot_with_equal_count(tmp_path, monkeypatch):
+    _settings(tmp_path, monkeypatch)
+    rows = [dict(r, updated_at="2024-01-01T00:00:00") for r in _rows(4)]
+    first = Warmup(FlakyStore(rows), BM25Sync(BM25Store()))
+    try:
+        asyncio.run(first.run())
+    finally:
+        first.sync.stop()
+
+    # same count: c0 deleted, c9 added without a newer updated_at, c1 rewritten after the watermark
+    changed = [dict(rows[1], text="refund invoice", updated_at="2024-02-01T00:00:00"), rows[2], rows[3],
+               {"id": "c9", "text": "nameserver glue record", "updated_at": None}]
+    again = Warmup(FlakyStore(changed), BM25Sync(BM25Store()))
+    try:
+        asyncio.run(again.run())
+    finally:
+        again.sync.stop()
+    bm25 = again.sync.store
+    assert sorted(bm25.doc_ids()) == ["c1", "c2", "c3", "c9"]
+    assert [h["id"] for h in bm25.search("refund")] == ["c1"]
+    assert [h["id"] for h in bm25.search("nameserver")] == ["c9"]
+    assert bm25.search("step 1") and "c1" not in [h["id"] for h in bm25.search("step")]
+    assert bm25.watermark == "2024-02-01T00:00:00"
+
+def test_warmup_retries_a_failed_bm25_build(tmp_path, monkeypatch):
+    _settings(tmp_path, monkeypatch)
+
+    class FlakyScroll(FlakyStore):
+        def scroll_all_texts(self, batch=512, updated_since=None):
+            if self.scrolls < 2:
+                self.scrolls += 1
+                raise ConnectionError("scroll timed out")
+            return super().scroll_all_texts(batch, updated_since)
+
+    w = Warmup(FlakyScroll(_rows(4)), BM25Sync(BM25Store()))
+
+    async def run():
+        w.start()
+        while w.state["bm25"].get("attempts") != 1:
+            await asyncio.sleep(0.001)
+        assert w.report()["degraded"] and w.state["bm25"]["status"] == "retrying"
+        assert "timed out" in w.state["bm25"]["error"]
+        await w._task
+
+    try:
+        asyncio.run(run())
+        threads = [t for t in threading.enumerate() if t.name == "bm25-sync"]
+    finally:
+        w.sync.stop()
+    assert len(threads) == 1  # the change-log tail is started once across attempts
+    report = w.report()
+    assert not report["degraded"] and report["bm25"]["status"] == "ready" and report["bm25"]["attempts"] == 3
+    assert sorted(w.sync.store.doc_ids()) == ["c0", "c1", "c2", "c3"]
+
+def test_warmup_reindexes_a_rewrite_in_the_watermark_second(tmp_path, monkeypatch):
+    _settings(tmp_path, monkeypatch)
+    stamp = _now_iso()
+    assert re.fullmatch(r"\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.\d{6}Z", stamp)
+    rows = [dict(r, updated_at="2024-01-01T00:00:00.100000Z") for r in _rows(3)]
+    first = Warmup(FlakyStore(rows), BM25Sync(BM25Store()))
+    try:
+        asyncio.run(first.run())
+    finally:
+        first.sync.stop()
+
+    # c1 re-ingested with the same id later within the same second
+    changed = [rows[0], dict(rows[1], text="refund invoice", updated_at="2024-01-01T00:00:00.600000Z"), rows[2]]
+    again = Warmup(FlakyStore(changed), BM25Sync(BM25Store()))
+    try:
+        asyncio.run(again.run())
+    finally:
+        again.sync.stop()
+    assert [h["id"] for h in again.sync.store.search("refund")] == ["c1"]
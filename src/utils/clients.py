@@ -0,0 +1,46 @@
+import threading
+from typing import Optional
+
+from openai import OpenAI, AsyncOpenAI
+
+from src.utils.settings import settings
+
+# OpenAI clients shared by embeddings and chat completions, built on first use, so importing
+# the app neither needs an API key nor opens connections.
+
+_lock = threading.Lock()
+_openai: Optional[OpenAI] = None
+_aopenai: Optional[AsyncOpenAI] = None
+
+def openai_client() -> OpenAI:
+    global _openai
+    if _openai is None:
+        with _lock:
+            if _openai is None:
+                _openai = OpenAI(api_key=settings.openai_api_key)
+    return _openai
+
+def aopenai_client() -> AsyncOpenAI:
+    global _aopenai
+    if _aopenai is None:
+        with _lock:
+            if _aopenai is None:
+                _aopenai = AsyncOpenAI(api_key=settings.openai_api_key)
+    return _aopenai
+
+def set_openai_clients(client: Optional[OpenAI] = None, aclient: Optional[AsyncOpenAI] = None):
+    """Replace the shared clients (benchmarks install transport stubs); None leaves one as is."""
+    global _openai, _aopenai
+    with _lock:
+        _openai = client or _openai
+        _aopenai = aclient or _aopenai
+
+async def aclose_clients():
+    global _openai, _aopenai
+    with _lock:
+        sync, async_ = _openai, _aopenai
+        _openai = _aopenai = None
+    if sync is not None:
+        sync.close()
+    if async_ is not None:
+        await async_.close()
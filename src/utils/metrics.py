@@ -0,0 +1,51 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# Prometheus metrics for the RAG pipeline, served on /metrics next to the HTTP metrics.
+
+# Embedding cache
+EMBED_CACHE_HITS = Counter("embedding_cache_hits_total", "Embedding cache hits", ["tier"])
+EMBED_CACHE_MISSES = Counter("embedding_cache_misses_total", "Embedding cache misses (texts sent to the API)")
+EMBED_CACHE_EVICTIONS = Counter("embedding_cache_evictions_total", "Embedding cache evictions", ["reason"])
+EMBED_CACHE_BYTES = Gauge("embedding_cache_bytes", "Bytes held by the in-process embedding cache")
+
+# Embedding micro-batching
+EMBED_BATCH_SIZE = Histogram("embedding_batch_size", "Texts per coalesced embedding call",
+                             buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+EMBED_QUEUE_WAIT = Histogram("embedding_batch_queue_wait_seconds", "Time a query waited for its batch to be sent",
+                             buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0))
+EMBED_BATCH_ERRORS = Counter("embedding_batch_errors_total", "Coalesced embedding calls that failed or timed out")
+
+# Streaming /resolve-ticket
+STREAM_TTFB = Histogram("resolve_ticket_stream_ttfb_seconds", "Time to the first SSE event (retrieved references)",
+                        buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0))
+STREAM_TTFT = Histogram("resolve_ticket_stream_ttft_seconds", "Time to the first streamed answer token",
+                        buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0))
+
+# Chunk vector/payload cache
+CHUNK_CACHE_HITS = Counter("chunk_cache_hits_total", "Candidate ids served from the local chunk cache")
+CHUNK_CACHE_MISSES = Counter("chunk_cache_misses_total", "Candidate ids fetched from Qdrant")
+CHUNK_CACHE_BYTES = Gauge("chunk_cache_bytes", "Approximate bytes held by the chunk cache")
+CHUNK_CACHE_ENTRIES = Gauge("chunk_cache_entries", "Chunks held by the chunk cache")
+
+# /resolve-ticket answer cache
+ANSWER_CACHE_HITS = Counter("answer_cache_hits_total", "Tickets answered from the answer cache", ["mode"])
+ANSWER_CACHE_MISSES = Counter("answer_cache_misses_total", "Answer cache misses")
+ANSWER_CACHE_INVALIDATIONS = Counter("answer_cache_invalidations_total", "Cached answers dropped because a snippet changed")
+
+# RAG pipeline stages (search_merged / resolve_ticket / ingest)
+STAGE_LATENCY = Histogram("rag_stage_seconds", "Time spent in one stage of a RAG pipeline", ["pipeline", "stage"],
+                          buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+RETRIEVAL_CANDIDATES = Histogram("rag_retrieval_candidates", "Candidates per merged search, by source", ["source"],
+                                 buckets=(0, 1, 2, 4, 8, 16, 32, 64, 128))
+SEARCH_DEGRADED = Counter("rag_search_degraded_total", "Merged searches served vector-only while BM25 warms up")
+CONTEXT_TOKENS = Histogram("rag_context_tokens", "Snippet tokens per prompt, as retrieved and after packing", ["stage"],
+                           buckets=(250, 500, 1000, 2000, 3000, 4000, 6000, 8000, 12000))
+ACTION_RULES_FIRED = Counter("action_rules_fired_total", "Tickets routed by an action rule", ["rule"])
+LLM_CALLS = Counter("llm_calls_total", "Chat completion calls", ["kind"])
+LLM_JSON_RETRIES = Counter("llm_json_retries_total", "LLM answers that failed JSON validation and were retried")
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens reported by the OpenAI API", ["kind"])
+INGEST_STAGE_ITEMS = Counter("ingest_stage_items_total", "Items processed by an ingest stage", ["stage"])
+
+# Shared BM25 change log
+BM25_SYNC_APPLIED = Counter("bm25_sync_applied_total", "BM25 change-log entries applied to this worker's index")
+BM25_SYNC_COMPACTIONS = Counter("bm25_sync_compactions_total", "BM25 snapshot + change-log compactions")
@@ -1,3 +1,4 @@
+from typing import Dict, Literal, Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 import os
 from dotenv import load_dotenv
@@ -10,15 +11,115 @@ class Settings(BaseSettings):
     """
     app_name: str = "Tucows RAG Assistant"
 
+    # Vector store: a Qdrant server, or the in-process index in embedded_store_dir
+    vector_backend: Literal["qdrant", "embedded"] = "qdrant"
+    embedded_store_dir: str = "./vector_store"
+    embedded_store_dtype: Literal["float32", "float16"] = "float32"  # applied when the store is created
+    embedded_search_block_rows: int = 16384  # rows per matmul block of the exact search
+    # HNSW graph (needs hnswlib) once the store holds this many points; None = always exact
+    embedded_hnsw_min_points: Optional[int] = None
+    embedded_hnsw_m: int = 16
+    embedded_hnsw_ef: int = 128
+
     # Qdrant settings
     qdrant_host: str = "localhost"
     qdrant_port: int = 6333
     qdrant_collection: str = "kb_chunks"
+    qdrant_prefer_grpc: bool = False  # protobuf instead of JSON; much cheaper for bulk upserts
+    qdrant_grpc_port: int = 6334
+    # collection layout, applied when the collection is created
+    qdrant_on_disk: bool = False  # original vectors memory-mapped from disk instead of held in RAM
+    qdrant_hnsw_m: Optional[int] = None  # None = server default (16)
+    qdrant_hnsw_ef_construct: Optional[int] = None  # None = server default (100)
+    qdrant_quantization: Optional[Literal["scalar", "binary"]] = None
+    qdrant_quantization_always_ram: bool = True
+    # search time: quantized candidates are rescored with the original vectors, oversampling x top_k of them
+    qdrant_search_rescore: bool = True
+    qdrant_search_oversampling: float = 2.0
+    qdrant_search_hnsw_ef: Optional[int] = None  # None = server default (ef_construct)
 
     # OpenAI settings
-    openai_api_key: str = os.getenv("OPENAI_API_KEY")  # Replace with your actual OpenAI API key
+    # only needed once the first embedding/completion is requested (the clients are built lazily)
+    openai_api_key: Optional[str] = os.getenv("OPENAI_API_KEY")  # Replace with your actual OpenAI API key
     embedding_model: str = "text-embedding-3-small"
-    embedding_dim: int = 1536
+    embedding_dim: int = 1536  # below the model's native size, text-embedding-3 returns shortened vectors
+    embedding_max_tokens: int = 8191  # input limit of the embedding model
+
+    # Embedding cache settings
+    embedding_cache_max_bytes: int = 256 * 1024 * 1024
+    embedding_cache_ttl_s: float = 24 * 3600
+    embedding_cache_path: Optional[str] = None  # e.g. ./embedding_cache.sqlite to persist across restarts
+
+    # Embedding micro-batching (async single-query path); window 0 disables it
+    embedding_batch_window_ms: float = 5.0
+    embedding_batch_max_size: int = 64
+    embedding_batch_max_queue: int = 1024
+    embedding_batch_max_inflight: int = 8
+    embedding_batch_timeout_s: float = 10.0
+
+    # Local chunk vector/payload cache
+    chunk_cache_max_bytes: int = 512 * 1024 * 1024
+    chunk_cache_dtype: str = "float32"  # or float16 to halve memory
+    chunk_cache_warm_on_startup: bool = True
+
+    # /resolve-ticket answer cache; a threshold (e.g. 0.97) enables near-duplicate reuse
+    answer_cache_max_entries: int = 2048
+    answer_cache_ttl_s: float = 3600
+    answer_cache_semantic_threshold: Optional[float] = None
+
+    # Folder ingestion pipeline
+    ingest_parse_workers: int = 0  # 0 = one process per CPU
+    ingest_embed_concurrency: int = 4
+    ingest_upsert_concurrency: int = 2
+    ingest_queue_size: int = 16
+    ingest_batch_size: int = 64
+    ingest_manifest_path: str = "./ingest_manifest.json"
+    # /ingest-batch: items per embedding call, largest accepted item
+    ingest_batch_embed_size: int = 256
+    ingest_batch_max_item_bytes: int = 1024 * 1024
+    # /ingest-file: uploads are streamed to a unique temp dir and ingested in a worker pool;
+    # uploads of at least ingest_upload_async_bytes return a job id instead of the result
+    ingest_upload_dir: Optional[str] = None  # None = system temp dir
+    ingest_upload_chunk_bytes: int = 1024 * 1024
+    ingest_upload_async_bytes: int = 4 * 1024 * 1024
+    ingest_job_workers: int = 2
+    ingest_jobs_dir: str = "./ingest_jobs"
+    ingest_job_ttl_s: float = 24 * 3600
+
+    # Prompt context packing: token budget for snippets (0 = none), MMR relevance weight,
+    # cosine similarity at which a snippet counts as a duplicate of one already in the prompt
+    context_max_tokens: int = 3000
+    context_mmr_lambda: float = 0.7
+    context_dup_threshold: float = 0.95
+
+    # action_required routing rules (JSON); None = src/core/action_rules.json
+    action_rules_path: Optional[str] = None
+
+    # /resolve-tickets: tickets retrieved together (one embeddings call, one Qdrant batch search),
+    # concurrent LLM calls, largest accepted ticket item, request body kept in memory (beyond it
+    # the body is spooled to a temp file)
+    resolve_batch_size: int = 64
+    resolve_batch_llm_concurrency: int = 8
+    resolve_batch_max_item_bytes: int = 64 * 1024
+    resolve_batch_spool_bytes: int = 4 * 1024 * 1024
+
+    # Chunking, in model tokens; CHUNK_PROFILES='{"hosting": {"target": 300, "overlap": 60}}' overrides per product
+    chunk_target_tokens: int = 400
+    chunk_overlap_tokens: int = 80
+    chunk_profiles: Dict[str, Dict[str, int]] = {}
+
+    # Startup: the app serves (/health) at once; /ready waits for the vector store, retried with
+    # exponential backoff between these bounds; BM25 is built in the background meanwhile
+    startup_retry_initial_s: float = 0.5
+    startup_retry_max_s: float = 10.0
+
+    # BM25 settings
+    bm25_snapshot_dir: str = "./bm25_index"
+    # change log shared by the workers on one host; each tails it every bm25_sync_interval_s
+    bm25_changelog_path: str = "./bm25_index.log"
+    bm25_changelog_max_bytes: int = 64 * 1024 * 1024
+    bm25_sync_interval_s: float = 1.0
+
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
 settings = Settings()
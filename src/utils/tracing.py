@@ -0,0 +1,60 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import structlog
+
+from src.utils.metrics import STAGE_LATENCY
+
+logger = structlog.get_logger()
+
+# stage -> seconds for the request being traced; None outside of trace()
+_spans: ContextVar[Optional[Dict[str, float]]] = ContextVar("rag_spans", default=None)
+# (pipeline, stage) -> (histogram child, span key); labels() lookups dominate the cost otherwise
+_children: Dict[Tuple[str, str], Tuple[Any, str]] = {}
+
+def _child(pipeline: str, stage: str) -> Tuple[Any, str]:
+    c = _children.get((pipeline, stage))
+    if c is None:
+        c = _children[(pipeline, stage)] = (STAGE_LATENCY.labels(pipeline, stage), f"{pipeline}.{stage}")
+    return c
+
+@contextmanager
+def span(pipeline: str, stage: str) -> Iterator[None]:
+    """
+    Time one pipeline stage into the rag_stage_seconds histogram and, inside trace(),
+    into the request's span list. Costs a few microseconds per stage.
+    """
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t
+        hist, key = _child(pipeline, stage)
+        hist.observe(dt)
+        spans = _spans.get()
+        if spans is not None:
+            spans[key] = spans.get(key, 0.0) + dt
+
+@contextmanager
+def trace(event: str, **fields) -> Iterator[Dict[str, float]]:
+    """
+    Collect the spans of one request and log them as a single structlog event.
+    Nested traces (e.g. search_merged inside resolve_ticket) record into the outer one.
+    Spans recorded in asyncio tasks or to_thread calls started inside are included,
+    since they share the context's dict.
+    """
+    spans = _spans.get()
+    if spans is not None:
+        yield spans
+        return
+    spans = {}
+    token = _spans.set(spans)
+    t = time.perf_counter()
+    try:
+        yield spans
+    finally:
+        _spans.reset(token)
+        logger.info(event, total_ms=round((time.perf_counter() - t) * 1000, 2),
+                    spans_ms={k: round(v * 1000, 2) for k, v in spans.items()}, **fields)